@@ -1,53 +1,182 @@
+"""
+Async analytics events and per-user insight rollups (MongoDB via pymongo's async client).
 
+Events go to ``user_events``. Alongside each event, a per-user rollup document
+in ``user_insights`` is updated in the same call, so ``get_user_insights`` is a
+single keyed lookup instead of a query over the raw events:
+
+- ``counts``: events per event type
+- ``last_seen``: last time per event type, plus ``last_seen_at`` overall
+- ``recent_queries``: the last INSIGHTS_QUERY_WINDOW search queries (lowercased),
+  from which top queries and recent searches are derived on read
+- checkout conversion: ``checkout_initiated`` events per ``search`` event
+
+Indexes and retention for both collections are declared in schema.py.
+
+``rebuild_insights`` recomputes rollups from ``user_events`` with one
+aggregation ending in ``$merge`` (for backfills, or after changing the rollup
+shape):
+
+    python analytics.py rebuild                  # every user
+    python analytics.py rebuild --user-id <id>   # one user
+
+Rollups count every event ever logged. If ``user_events`` has a TTL index
+(USER_EVENTS_RETENTION_DAYS) or is capped, older events are gone and a rebuild
+would replace those counts with counts over what is left, so it refuses to
+run unless forced (``--force``).
+
+Configuration (environment):
+    MONGODB_URI               Connection string (analytics is disabled without it)
+    MONGODB_DB_NAME           Database (default Travado)
+    INSIGHTS_QUERY_WINDOW     Search queries kept per user for top queries (default 100)
+    INSIGHTS_TOP_QUERIES      Top queries returned by get_user_insights (default 5)
+"""
+
+import argparse
+import asyncio
 import os
 import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
+from collections import Counter
+from typing import Optional
+
+from pymongo import AsyncMongoClient
 from dotenv import load_dotenv
 
+from app_logging import configure_logging, get_logger
+
 load_dotenv()
 
+logger = get_logger(__name__)
+
+QUERY_WINDOW = int(os.getenv("INSIGHTS_QUERY_WINDOW", "100"))
+TOP_QUERIES = int(os.getenv("INSIGHTS_TOP_QUERIES", "5"))
+
+SEARCH_EVENT = "search"
+CHECKOUT_EVENT = "checkout_initiated"
+
+
+def _normalize_query(query: str) -> str:
+    # Same as $trim + $toLower in the rebuild pipeline
+    return query.strip().lower()
+
+
+def rollup_update(event_type: str, timestamp: datetime.datetime, data: dict) -> dict:
+    """The upsert that folds one event into its user's ``user_insights`` document."""
+    update = {
+        "$inc": {f"counts.{event_type}": 1},
+        "$max": {f"last_seen.{event_type}": timestamp, "last_seen_at": timestamp},
+    }
+    query = data.get("query") if event_type == SEARCH_EVENT else None
+    if isinstance(query, str) and query.strip():
+        update["$push"] = {"recent_queries": {"$each": [_normalize_query(query)], "$slice": -QUERY_WINDOW}}
+    return update
+
+
+def rebuild_pipeline(user_id: Optional[str] = None) -> list:
+    """Aggregation over ``user_events`` that replaces the matching ``user_insights`` documents."""
+    match = {"user_id": user_id} if user_id else {"user_id": {"$nin": [None, ""]}}
+    return [
+        {"$match": match},
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "event_type": "$event_type"},
+            "count": {"$sum": 1},
+            "last": {"$max": "$timestamp"},
+            "queries": {"$push": {"$cond": [
+                {"$eq": ["$event_type", SEARCH_EVENT]},
+                {"$toLower": {"$trim": {"input": {"$ifNull": ["$data.query", ""]}}}},
+                "$$REMOVE",
+            ]}},
+        }},
+        {"$group": {
+            "_id": "$_id.user_id",
+            "types": {"$push": {"k": "$_id.event_type", "count": "$count", "last": "$last"}},
+            "queries": {"$push": "$queries"},
+            "last_seen_at": {"$max": "$last"},
+        }},
+        {"$project": {
+            "counts": {"$arrayToObject": {"$map": {"input": "$types", "in": {"k": "$$this.k", "v": "$$this.count"}}}},
+            "last_seen": {"$arrayToObject": {"$map": {"input": "$types", "in": {"k": "$$this.k", "v": "$$this.last"}}}},
+            "last_seen_at": 1,
+            "recent_queries": {"$slice": [
+                {"$filter": {
+                    "input": {"$reduce": {"input": "$queries", "initialValue": [], "in": {"$concatArrays": ["$$value", "$$this"]}}},
+                    "cond": {"$and": [{"$eq": [{"$type": "$$this"}, "string"]}, {"$ne": ["$$this", ""]}]},
+                }},
+                -QUERY_WINDOW,
+            ]},
+        }},
+        {"$merge": {"into": "user_insights", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def insights_from_rollup(doc: Optional[dict]) -> dict:
+    """Shape a ``user_insights`` document for callers."""
+    if not doc:
+        return {}
+    counts = doc.get("counts", {})
+    queries = doc.get("recent_queries", [])
+    recent = []
+    for query in reversed(queries):
+        if query not in recent:
+            recent.append(query)
+        if len(recent) == 5:
+            break
+    searches = counts.get(SEARCH_EVENT, 0)
+    return {
+        "recent_searches": recent,
+        "top_queries": [{"query": q, "count": n} for q, n in Counter(queries).most_common(TOP_QUERIES)],
+        "counts": counts,
+        "last_seen": doc.get("last_seen", {}),
+        "last_seen_at": doc.get("last_seen_at"),
+        "checkout_conversion": round(counts.get(CHECKOUT_EVENT, 0) / searches, 4) if searches else None,
+    }
+
+
 class AsyncAnalyticsClient:
     """
     Async client for logging analytics events to MongoDB.
-    Uses 'motor' for non-blocking I/O with FastAPI.
+    Uses pymongo's AsyncMongoClient for non-blocking I/O with FastAPI.
     """
     def __init__(self):
         self.client = None
         self.db = None
         self.collection = None
+        self.insights = None
         self.enabled = False
 
     async def initialize(self):
         """Initialize connection to MongoDB."""
         uri = os.getenv("MONGODB_URI")
         if not uri:
-            print("⚠️ Analytics disabled: MONGODB_URI not found in .env")
+            logger.warning("⚠️ Analytics disabled: MONGODB_URI not found in .env")
             return
 
         try:
-            self.client = AsyncIOMotorClient(uri, serverSelectionTimeoutMS=5000)
+            self.client = AsyncMongoClient(uri, serverSelectionTimeoutMS=5000)
             # Verify connection
             await self.client.admin.command('ping')
-            
+
             db_name = os.getenv("MONGODB_DB_NAME", "Travado")
             self.db = self.client[db_name]
             self.collection = self.db["user_events"]
+            self.insights = self.db["user_insights"]
             self.enabled = True
-            print(f"✅ Analytics initialized. Connected to MongoDB: {db_name}")
+            logger.info("✅ Analytics initialized. Connected to MongoDB: %s", db_name)
         except Exception as e:
-            print(f"⚠️ Analytics initialization failed: {e}")
+            logger.warning("⚠️ Analytics initialization failed: %s", e)
             self.enabled = False
 
     async def log_event(self, event_type: str, user_id: str, data: dict = None):
         """
-        Log an event to the database asynchronously.
-        
+        Log an event to the database asynchronously and update the user's rollup.
+
         Args:
             event_type: e.g., "search", "checkout_initiated", "view_product"
             user_id: Unique identifier for the user
             data: Arbitrary JSON-serializable dictionary with event details
         """
-        if not self.enabled or not self.collection:
+        if not self.enabled or self.collection is None:
             return
 
         event_doc = {
@@ -57,40 +186,95 @@ class AsyncAnalyticsClient:
             "data": data or {}
         }
 
+        writes = [self.collection.insert_one(event_doc)]
+        if user_id:
+            # Anonymous events are kept (e.g. for recommendations) but have no rollup
+            writes.append(self.insights.update_one(
+                {"_id": user_id},
+                rollup_update(event_type, event_doc["timestamp"], event_doc["data"]),
+                upsert=True,
+            ))
         try:
-            await self.collection.insert_one(event_doc)
-            # print(f"📊 Logged event: {event_type} for {user_id}") # Optional logging
+            await asyncio.gather(*writes)
         except Exception as e:
-            print(f"❌ Failed to log event: {e}")
+            logger.error("❌ Failed to log event %s: %s", event_type, e)
 
     async def get_user_insights(self, user_id: str) -> dict:
         """
-        Aggregate user events to derive insights (e.g., top searched categories).
-        Returns a dictionary of insights.
+        Return the user's insights from their rollup document (one keyed lookup).
+        Returns a dictionary of insights ({} if the user has no events).
         """
         if not self.enabled:
             return {}
 
-        # Example: Simple aggregation of search queries
-        # In a real system, you'd use a more complex aggregation pipeline
         try:
-            cursor = self.collection.find(
-                {"user_id": user_id, "event_type": "search"}
-            ).sort("timestamp", -1).limit(5)
-            
-            recent_searches = []
-            async for doc in cursor:
-                query = doc.get("data", {}).get("query")
-                if query:
-                    recent_searches.append(query)
-            
-            return {
-                "recent_searches": recent_searches
-            }
+            return insights_from_rollup(await self.insights.find_one({"_id": user_id}))
         except Exception as e:
-            print(f"❌ Failed to get insights: {e}")
+            logger.error("❌ Failed to get insights: %s", e)
             return {}
 
+    async def events_expire(self) -> Optional[str]:
+        """Why old events may be missing from ``user_events`` (TTL index or capped), or None."""
+        for name, index in (await self.collection.index_information()).items():
+            if "expireAfterSeconds" in index:
+                return f"user_events has a TTL index ({name}, {index['expireAfterSeconds']}s)"
+        if (await self.collection.options()).get("capped"):
+            return "user_events is capped"
+        return None
+
+    async def rebuild_insights(self, user_id: Optional[str] = None, force: bool = False) -> int:
+        """
+        Recompute rollups from the raw events with a ``$merge`` aggregation.
+
+        Args:
+            user_id: Rebuild only this user (default: everyone).
+            force: Rebuild even if old events expire (the rollups lose their counts).
+
+        Returns:
+            The number of rollup documents for the rebuilt user(s).
+
+        Raises:
+            RuntimeError: Events expire and ``force`` is not set.
+        """
+        if not self.enabled:
+            return 0
+        reason = await self.events_expire()
+        if reason:
+            if not force:
+                raise RuntimeError(f"Refusing to rebuild insights: {reason}, so the rollups would lose expired events (use force)")
+            logger.warning("Rebuilding insights although %s; expired events drop out of the rollups", reason)
+        cursor = await self.collection.aggregate(rebuild_pipeline(user_id), allowDiskUse=True)
+        await cursor.to_list(None)
+        return await self.insights.count_documents({"_id": user_id} if user_id else {})
+
     async def cleanup(self):
         if self.client:
-            self.client.close()
+            await self.client.close()
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Analytics maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild", help="Recompute user_insights from user_events")
+    rebuild.add_argument("--user-id", help="Only this user (default: all users)")
+    rebuild.add_argument("--force", action="store_true", help="Rebuild even if user_events has a TTL index or is capped")
+    args = parser.parse_args()
+
+    configure_logging()
+    client = AsyncAnalyticsClient()
+    await client.initialize()
+    if not client.enabled:
+        raise SystemExit(1)
+    try:
+        if args.command == "rebuild":
+            try:
+                count = await client.rebuild_insights(args.user_id, force=args.force)
+            except RuntimeError as e:
+                raise SystemExit(str(e))
+            logger.info("✅ Rebuilt insights: %d user(s)", count)
+    finally:
+        await client.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,143 @@
+"""
+Non-blocking logging for the backend.
+
+Records are put on an in-memory queue by the request path and written to stderr
+by a background thread (``logging.handlers.QueueListener``), so log I/O never
+runs on the event loop thread.
+
+- every record carries the current request's correlation ID (see ``request_id_var``)
+- large payloads are logged through ``Truncated``, which is only rendered if the
+  record is actually emitted and is cut to LOG_PAYLOAD_CHARS
+- ``sample_payload()`` lets call sites log full payloads for a fraction of requests
+
+Configuration (environment):
+    LOG_LEVEL                Root level (default INFO)
+    LOG_PAYLOAD_CHARS        Max characters of a logged payload (default 500)
+    LOG_PAYLOAD_SAMPLE_RATE  Fraction of requests that log full payloads at DEBUG (default 0)
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from typing import Any, Optional
+
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "500"))
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class Truncated:
+    """
+    Lazily rendered, length-capped view of a payload for log messages.
+
+    Rendering happens only if the record passes the level check, and long
+    strings are sliced before any further work.
+    """
+
+    __slots__ = ("payload", "limit")
+
+    def __init__(self, payload: Any, limit: int = PAYLOAD_CHARS):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.payload if isinstance(self.payload, str) else repr(self.payload)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... (+{len(text) - self.limit} chars)"
+
+
+class _RequestIdFilter(logging.Filter):
+    """Attach the current correlation ID to every record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+def sample_payload() -> bool:
+    """Whether this call site should log a full payload (LOG_PAYLOAD_SAMPLE_RATE)."""
+    return PAYLOAD_SAMPLE_RATE > 0 and random.random() < PAYLOAD_SAMPLE_RATE
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through a queue drained by a background thread.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a module logger."""
+    return logging.getLogger(name)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that assigns each HTTP request a correlation ID.
+
+    Reuses an incoming ``X-Request-ID`` header when present and echoes the ID
+    back on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:12]
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
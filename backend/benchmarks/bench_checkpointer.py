@@ -0,0 +1,143 @@
+"""
+Checkpointer write/read cost per agent step.
+
+Drives a small LangGraph with the same shape as the search agent (agent ->
+tool -> agent per turn, growing message history) through each checkpointer and
+reports the time and bytes spent in put/get per step:
+
+- memory:      MemorySaver (per-process baseline)
+- sqlite:      DeltaCheckpointSaver on SQLite, message deltas + read cache
+- sqlite-full: same store, whole message list re-serialized every step
+- sqlite-cold: message deltas, read cache disabled
+
+After the run, a second saver opened on the same SQLite file (as another
+uvicorn worker would) checks that it sees the full conversation.
+
+Usage (from backend/):
+    python -m benchmarks.bench_checkpointer --turns 30 --tool-bytes 4000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, MessagesState, StateGraph
+
+from benchmarks.stats import percentile, print_report
+from checkpointers import DeltaCheckpointSaver, SQLiteCheckpointStore
+
+
+def build_graph(checkpointer, tool_bytes: int):
+    """agent (tool call) -> tools (large result) -> agent (answer) -> END."""
+
+    def agent(state: MessagesState):
+        last = state["messages"][-1]
+        if isinstance(last, HumanMessage):
+            return {"messages": [AIMessage(content="", tool_calls=[
+                {"name": "search_global_products", "args": {"query": last.content}, "id": f"call-{len(state['messages'])}"}
+            ])]}
+        return {"messages": [AIMessage(content='[{"title": "Result", "price": "10.00"}]')]}
+
+    def tools(state: MessagesState):
+        call = state["messages"][-1].tool_calls[0]
+        return {"messages": [ToolMessage(content="x" * tool_bytes, tool_call_id=call["id"])]}
+
+    def route(state: MessagesState):
+        return "tools" if state["messages"][-1].tool_calls else END
+
+    workflow = StateGraph(MessagesState)
+    workflow.add_node("agent", agent)
+    workflow.add_node("tools", tools)
+    workflow.set_entry_point("agent")
+    workflow.add_conditional_edges("agent", route, {"tools": "tools", END: END})
+    workflow.add_edge("tools", "agent")
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def instrument(saver, timings: Dict[str, List[float]]) -> None:
+    """Record the duration of every aput/aget_tuple call on ``saver``."""
+    for name in ("aput", "aget_tuple"):
+        original = getattr(saver, name)
+
+        def make_wrapper(name, original):
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    timings[name].append(time.perf_counter() - start)
+            return wrapper
+
+        setattr(saver, name, make_wrapper(name, original))
+
+
+async def run_conversation(saver, turns: int, tool_bytes: int, thread_id: str) -> Dict[str, float]:
+    timings: Dict[str, List[float]] = defaultdict(list)
+    instrument(saver, timings)
+    graph = build_graph(saver, tool_bytes)
+    config = {"configurable": {"thread_id": thread_id}}
+
+    start = time.perf_counter()
+    for turn in range(turns):
+        await graph.ainvoke({"messages": [HumanMessage(content=f"query {turn}")]}, config)
+    elapsed = time.perf_counter() - start
+
+    state = await graph.aget_state(config)
+    puts, gets = timings["aput"], timings["aget_tuple"]
+    summary = {
+        "turns": turns,
+        "messages": len(state.values["messages"]),
+        "elapsed_s": elapsed,
+        "puts": len(puts),
+        "put_avg_ms": sum(puts) / len(puts) * 1000 if puts else 0,
+        "put_p95_ms": percentile(puts, 95) * 1000,
+        "gets": len(gets),
+        "get_avg_ms": sum(gets) / len(gets) * 1000 if gets else 0,
+        "get_p95_ms": percentile(gets, 95) * 1000,
+    }
+    if isinstance(saver, DeltaCheckpointSaver):
+        summary["bytes_per_put"] = saver.stats["bytes_written"] / max(1, saver.stats["puts"])
+        summary["bytes_written"] = saver.stats["bytes_written"]
+        summary["cache_hits"] = saver.stats["cache_hits"]
+        summary["cache_misses"] = saver.stats["cache_misses"]
+    return summary
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--tool-bytes", type=int, default=4000, help="Size of each tool result message")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_checkpointer_")
+    variants = {
+        "memory": lambda path: MemorySaver(),
+        "sqlite": lambda path: DeltaCheckpointSaver(SQLiteCheckpointStore(path)),
+        "sqlite-full": lambda path: DeltaCheckpointSaver(SQLiteCheckpointStore(path), delta_channels=()),
+        "sqlite-cold": lambda path: DeltaCheckpointSaver(SQLiteCheckpointStore(path), cache_threads=0),
+    }
+
+    for name, factory in variants.items():
+        path = os.path.join(workdir, f"{name}.sqlite")
+        saver = factory(path)
+        summary = await run_conversation(saver, args.turns, args.tool_bytes, thread_id="bench")
+
+        if isinstance(saver, DeltaCheckpointSaver):
+            # A second process-like reader sees the same conversation
+            other = DeltaCheckpointSaver(SQLiteCheckpointStore(path))
+            restored = await other.aget_tuple({"configurable": {"thread_id": "bench"}})
+            summary["other_worker_messages"] = len(restored.checkpoint["channel_values"]["messages"])
+            other.close()
+            saver.close()
+
+        print_report(f"checkpointer: {name} ({args.turns} turns, {args.tool_bytes}B tool results)", summary)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Image proxy cold vs warm cost against the fake CDN.
+
+Requests ``--images`` distinct product images at ``--width`` through an
+ImageProxy backed by a temporary cache directory, ``--repeat`` times each with
+``--concurrency`` requests in flight, and reports per-pass latency, upstream
+fetches and bytes served. The first pass fetches (and resizes, with Pillow);
+later passes should be served from disk without touching the CDN.
+
+Usage (from backend/):
+    python -m benchmarks.bench_images --images 30 --concurrency 8 --width 320
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+
+from benchmarks.fake_cdn import start_fake_cdn
+from benchmarks.stats import print_report, summarize
+from image_proxy import ImageProxy
+
+
+async def run_pass(proxy: ImageProxy, urls: List[str], width: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    served = 0
+    errors = 0
+
+    async def one(url: str):
+        nonlocal served, errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                image, _ = await proxy.get(url, width or None)
+                served += image.size
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(url) for url in urls))
+    summary = summarize(latencies, errors, time.perf_counter() - start)
+    summary["bytes_served"] = served
+    return summary
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--width", type=int, default=320, help="Thumbnail width (0 = original)")
+    parser.add_argument("--size", type=int, default=1200, help="Edge of the CDN's images in pixels")
+    parser.add_argument("--cdn-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    cdn, _ = start_fake_cdn(size=args.size, latency_ms=args.cdn_latency_ms)
+    urls = [f"{cdn.base_url}/products/{i}.png" for i in range(args.images)]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        proxy = ImageProxy(cache_dir=cache_dir, allowed_hosts=["127.0.0.1"])
+        try:
+            for n in range(args.repeat):
+                # Every request is issued twice per pass to exercise fetch coalescing
+                summary = await run_pass(proxy, urls + urls, args.width, args.concurrency)
+                summary["cdn_fetches"] = sum(cdn.hits.values())
+                label = "cold" if n == 0 else "warm"
+                print_report(f"image proxy pass {n + 1} ({label}, w={args.width or 'original'})", summary)
+        finally:
+            await proxy.stop()
+        original_bytes = sum(os.path.getsize(e.path) for k, e in proxy._index.items() if not e.path.endswith(".webp"))
+        print_report("image cache", {**proxy.snapshot(), "original_bytes": original_bytes})
+    cdn.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
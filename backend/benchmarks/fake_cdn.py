@@ -0,0 +1,131 @@
+"""
+Local stand-in for the product image CDN.
+
+``GET /<name>.<ext>?size=WxH`` answers with a deterministic PNG (a gradient
+coloured by ``name``), so the image proxy can be exercised offline. Every
+response is a fresh upstream hit; ``hits`` counts them per path so tests can
+check that the proxy fetched each image once.
+
+Usage:
+    python benchmarks/fake_cdn.py --port 9100 --size 1600 --latency-ms 80
+    IMAGE_PROXY_ALLOWED_HOSTS=127.0.0.1 ...   # let the proxy fetch from it
+"""
+
+import argparse
+import hashlib
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+@lru_cache(maxsize=64)
+def render_png(name: str, width: int, height: int) -> bytes:
+    """An RGB PNG of ``width`` x ``height``, a vertical gradient in a colour derived from ``name``."""
+    r, g, b = hashlib.sha1(name.encode()).digest()[:3]
+    rows = []
+    for y in range(height):
+        shade = y * 255 // max(1, height - 1)
+        pixel = bytes(((r + shade) % 256, (g + shade // 2) % 256, b))
+        rows.append(b"\x00" + pixel * width)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _chunk(b"IHDR", header)
+        + _chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + _chunk(b"IEND", b"")
+    )
+
+
+class FakeCDN(ThreadingHTTPServer):
+    """A threaded HTTP server serving generated images."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, size: int = 1200, latency_ms: float = 50, jitter_ms: float = 20):
+        """
+        Args:
+            port: Port to bind (0 picks a free one).
+            size: Default image edge in pixels (``?size=WxH`` overrides it).
+            latency_ms: Base latency added to every request.
+            jitter_ms: Uniform random jitter added on top of the latency.
+        """
+        super().__init__(("127.0.0.1", port), _CDNHandler)
+        self.size = size
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.hits = Counter()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def simulate_latency(self) -> None:
+        time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+
+
+class _CDNHandler(BaseHTTPRequestHandler):
+    server: FakeCDN
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def do_GET(self):
+        self.server.simulate_latency()
+        parts = urlsplit(self.path)
+        self.server.hits[parts.path] += 1
+        if parts.path.startswith("/missing"):
+            self.send_error(404)
+            return
+
+        width = height = self.server.size
+        size = parse_qs(parts.query).get("size")
+        if size:
+            try:
+                width, height = (int(v) for v in size[0].lower().split("x"))
+            except ValueError:
+                self.send_error(400)
+                return
+
+        body = render_png(parts.path, width, height)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_fake_cdn(**kwargs) -> Tuple[FakeCDN, threading.Thread]:
+    """Start a FakeCDN on a background thread. Keyword args go to FakeCDN."""
+    server = FakeCDN(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--size", type=int, default=1200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    server = FakeCDN(args.port, args.size, args.latency_ms, args.jitter_ms)
+    print(f"Fake CDN at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Deterministic stand-in for the Groq chat model.
+
+Follows the same two-turn protocol the real model is prompted into:
+1. On a new user message, emit a ``search_global_products`` tool call for the
+   text after "User query:".
+2. On a tool result, answer with the JSON list of products (title, price,
+   description, url, id, image_url).
+
+Latency is simulated so end-to-end benchmarks have realistic timing without a
+network dependency. Select it for the server with ``AGENT_LLM=fake``.
+
+Configuration (environment):
+    FAKE_LLM_LATENCY_MS  Simulated latency per call (default 400)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from tool_reducers import ToolReducer, find_items
+
+
+class FakeShoppingChatModel(BaseChatModel):
+    """A chat model that plays the search agent's protocol without calling an API."""
+
+    latency_ms: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "400"))
+    search_tool: str = "search_global_products"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-shopping"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"latency_ms": self.latency_ms}
+
+    def bind_tools(self, tools: List[Any], **kwargs) -> "FakeShoppingChatModel":
+        """Tools are implied by the protocol, so binding is a no-op."""
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+
+        if isinstance(last, ToolMessage):
+            try:
+                items = find_items(json.loads(last.content)) or []
+            except (json.JSONDecodeError, TypeError):
+                items = []
+            reducer = ToolReducer()
+            products = [reducer.project(item) for item in items]
+            return AIMessage(content=json.dumps(products, separators=(",", ":")))
+
+        text = next(
+            (m.content for m in reversed(messages) if isinstance(m, HumanMessage)),
+            "",
+        )
+        match = re.search(r"User query:\s*(.+)", text)
+        query = (match.group(1) if match else text).strip()
+        call_id = "call_" + hashlib.sha1(query.encode()).hexdigest()[:12]
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": self.search_tool, "args": {"query": query, "limit": 10}, "id": call_id}],
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
@@ -0,0 +1,126 @@
+"""
+Local stand-in for the Shopify catalog MCP server.
+
+Implements ``search_global_products`` and ``get_global_product_details`` with
+canned latency and payload sizes so the agent can be benchmarked offline.
+
+Usage:
+    python benchmarks/fake_mcp_server.py                      # stdio
+    python benchmarks/fake_mcp_server.py --http --port 8765   # streamable HTTP at /mcp
+
+Configuration (environment, also settable via flags):
+    FAKE_MCP_LATENCY_MS     Base latency per tool call (default 300)
+    FAKE_MCP_JITTER_MS      Uniform random jitter added to the latency (default 100)
+    FAKE_MCP_PRODUCTS       Products returned per search (default 20)
+    FAKE_MCP_PAYLOAD_BYTES  Approximate size of each product's raw JSON (default 3000)
+    FAKE_MCP_SLOW_RATE      Fraction of calls that take FAKE_MCP_SLOW_MS instead (default 0)
+    FAKE_MCP_SLOW_MS        Latency of a slow (tail) call (default 5000)
+    FAKE_MCP_IMAGE_BASE     Base URL of product images (default https://cdn.example.com);
+                            point it at benchmarks/fake_cdn.py to exercise the image proxy
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+from mcp.server.fastmcp import FastMCP
+
+
+LATENCY_MS = float(os.getenv("FAKE_MCP_LATENCY_MS", "300"))
+JITTER_MS = float(os.getenv("FAKE_MCP_JITTER_MS", "100"))
+PRODUCTS = int(os.getenv("FAKE_MCP_PRODUCTS", "20"))
+PAYLOAD_BYTES = int(os.getenv("FAKE_MCP_PAYLOAD_BYTES", "3000"))
+SLOW_RATE = float(os.getenv("FAKE_MCP_SLOW_RATE", "0"))
+SLOW_MS = float(os.getenv("FAKE_MCP_SLOW_MS", "5000"))
+IMAGE_BASE = os.getenv("FAKE_MCP_IMAGE_BASE", "https://cdn.example.com").rstrip("/")
+
+mcp = FastMCP("fake-shopify-catalog")
+
+
+async def _simulate_latency() -> None:
+    if random.random() < SLOW_RATE:
+        await asyncio.sleep(SLOW_MS / 1000)
+        return
+    await asyncio.sleep((LATENCY_MS + random.uniform(0, JITTER_MS)) / 1000)
+
+
+def _product(query: str, index: int) -> dict:
+    """Build a deterministic product roughly PAYLOAD_BYTES large."""
+    digest = hashlib.sha1(f"{query}:{index}".encode()).hexdigest()[:22]
+    product = {
+        "id": f"gid://shopify/p/{digest}",
+        "title": f"{query.title()} #{index + 1}",
+        "description": f"A fake {query} used for benchmarking. " * 4,
+        "priceRange": {"min": {"amount": 1000 + index * 250, "currency": "USD"}},
+        "media": [{"url": f"{IMAGE_BASE}/{digest}.jpg", "altText": query}],
+        "variants": [
+            {
+                "id": f"gid://shopify/ProductVariant/{1000 + index}",
+                "url": f"http://127.0.0.1:9000/products/{digest}?variant={1000 + index}",
+                "price": {"amount": 1000 + index * 250, "currency": "USD"},
+            }
+        ],
+        "shop": {"name": "Fake Store", "domain": "127.0.0.1:9000"},
+    }
+    padding = PAYLOAD_BYTES - len(json.dumps(product))
+    if padding > 0:
+        # Mimics the long tail of attributes the real catalog returns
+        product["attributes"] = "x" * padding
+    return product
+
+
+@mcp.tool()
+async def search_global_products(
+    query: str,
+    context: str = "",
+    limit: int = 10,
+    shop_ids: list[str] | None = None,
+) -> str:
+    """Search the (fake) global product catalog."""
+    await _simulate_latency()
+    count = min(max(limit, 1) * 2, PRODUCTS)
+    return json.dumps({"offers": [_product(query, i) for i in range(count)]})
+
+
+@mcp.tool()
+async def get_global_product_details(
+    product_ids: list[str],
+    context: str = "",
+) -> str:
+    """Look up (fake) product details by ID."""
+    await _simulate_latency()
+    return json.dumps({"products": [_product(pid, i) for i, pid in enumerate(product_ids)]})
+
+
+def main():
+    global LATENCY_MS, JITTER_MS, PRODUCTS, PAYLOAD_BYTES, SLOW_RATE, SLOW_MS, IMAGE_BASE
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--http", action="store_true", help="Serve streamable HTTP instead of stdio")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--products", type=int, default=PRODUCTS)
+    parser.add_argument("--payload-bytes", type=int, default=PAYLOAD_BYTES)
+    parser.add_argument("--slow-rate", type=float, default=SLOW_RATE)
+    parser.add_argument("--slow-ms", type=float, default=SLOW_MS)
+    parser.add_argument("--image-base", default=IMAGE_BASE)
+    args = parser.parse_args()
+
+    LATENCY_MS, JITTER_MS = args.latency_ms, args.jitter_ms
+    PRODUCTS, PAYLOAD_BYTES = args.products, args.payload_bytes
+    SLOW_RATE, SLOW_MS = args.slow_rate, args.slow_ms
+    IMAGE_BASE = args.image_base.rstrip("/")
+
+    if args.http:
+        mcp.settings.port = args.port
+        mcp.run(transport="streamable-http")
+    else:
+        mcp.run(transport="stdio")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Local stand-in for a merchant's Shopify storefront.
+
+Serves just enough for the /checkout flow:
+- ``GET /``: a homepage with several 32-char hex strings embedded, exactly one of
+  which is the valid Storefront token (what find_storefront_token scrapes)
+- ``POST /api/2025-01/graphql.json``: ``shop { name }``, ``product(id:) { variants }``
+  and ``cartCreate``, authenticated by the X-Shopify-Storefront-Access-Token header
+
+Latency and failures are injectable, so checkout can be load-tested offline.
+
+Usage:
+    python benchmarks/fake_storefront.py --port 9000 --latency-ms 150 --error-rate 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class FakeStorefront(ThreadingHTTPServer):
+    """A threaded HTTP server holding the store's configuration."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency_ms: float = 100,
+        jitter_ms: float = 50,
+        error_rate: float = 0.0,
+        decoy_tokens: int = 5,
+    ):
+        """
+        Args:
+            port: Port to bind (0 picks a free one).
+            latency_ms: Base latency added to every request.
+            jitter_ms: Uniform random jitter added on top of the latency.
+            error_rate: Probability of answering a GraphQL request with an error.
+            decoy_tokens: Invalid token-looking strings embedded in the homepage.
+        """
+        super().__init__(("127.0.0.1", port), _StorefrontHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token = uuid.uuid4().hex
+        self.decoys = [uuid.uuid4().hex for _ in range(decoy_tokens)]
+        self.shop_name = f"Fake Store {self.server_address[1]}"
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def simulate_latency(self) -> None:
+        time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+
+
+class _StorefrontHandler(BaseHTTPRequestHandler):
+    server: FakeStorefront
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.simulate_latency()
+        tokens = self.server.decoys + [self.server.token]
+        random.shuffle(tokens)
+        scripts = "\n".join(f'<script>var t = "{token}";</script>' for token in tokens)
+        body = f"<html><head><title>{self.server.shop_name}</title>{scripts}</head><body></body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.simulate_latency()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        query = request.get("query", "")
+        variables = request.get("variables", {})
+
+        if self.headers.get("X-Shopify-Storefront-Access-Token") != self.server.token:
+            return self._send_json(401, {"errors": [{"message": "Unauthorized"}]})
+
+        if random.random() < self.server.error_rate:
+            return self._send_json(200, {"errors": [{"message": "Injected failure"}]})
+
+        if "cartCreate" in query:
+            cart_id = hashlib.sha1(json.dumps(variables, sort_keys=True).encode()).hexdigest()[:16]
+            return self._send_json(200, {"data": {"cartCreate": {
+                "cart": {"checkoutUrl": f"{self.server.base_url}/cart/c/{cart_id}"},
+                "userErrors": [],
+            }}})
+
+        if "product(" in query:
+            numeric_id = "".join(filter(str.isdigit, variables.get("id", "")))
+            return self._send_json(200, {"data": {"product": {
+                "variants": {"nodes": [{"id": f"gid://shopify/ProductVariant/{numeric_id}1"}]},
+            }}})
+
+        if "shop" in query:
+            return self._send_json(200, {"data": {"shop": {"name": self.server.shop_name}}})
+
+        return self._send_json(200, {"errors": [{"message": "Unsupported operation"}]})
+
+
+def start_fake_storefront(**kwargs) -> Tuple[FakeStorefront, threading.Thread]:
+    """Start a FakeStorefront on a background thread. Keyword args go to FakeStorefront."""
+    server = FakeStorefront(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeStorefront(args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"Fake storefront at {server.base_url} (token {server.token})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
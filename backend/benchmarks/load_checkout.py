@@ -0,0 +1,154 @@
+"""
+/checkout load benchmark against local fake storefronts.
+
+Starts ``--stores`` FakeStorefront servers (benchmarks/fake_storefront.py) and
+sends multi-store carts through the in-process FastAPI app. Items carry no
+access token by default, so every checkout exercises token discovery.
+
+Usage (from backend/):
+    python -m benchmarks.load_checkout --stores 3 --items-per-store 2 --concurrency 4
+    python -m benchmarks.load_checkout --with-tokens --error-rate 0.1 --latency-ms 300
+
+Reports request latency percentiles, per-stage timings (token discovery,
+variant resolution, cartCreate) and how long the event loop was blocked.
+"""
+
+import argparse
+import asyncio
+import functools
+import itertools
+import random
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from benchmarks.fake_storefront import start_fake_storefront
+from benchmarks.stats import LoopLagMonitor, percentile, print_report, summarize
+
+
+# Stage name -> server function that implements it
+STAGES = {
+    "token_discovery": "find_storefront_token",
+    "variant_resolution": "resolve_variant_id",
+    "cart_create": "create_cart",
+}
+
+
+def instrument_stages(server_module: Any, timings: Dict[str, List[float]]) -> Callable[[], None]:
+    """
+    Wrap the checkout stage functions so each call's duration is recorded.
+
+    Returns:
+        A function that restores the original implementations.
+    """
+    originals = {}
+    for stage, func_name in STAGES.items():
+        original = getattr(server_module, func_name)
+        originals[func_name] = original
+
+        def make_wrapper(stage: str, func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    timings[stage].append(time.perf_counter() - start)
+            return wrapper
+
+        setattr(server_module, func_name, make_wrapper(stage, original))
+
+    def restore():
+        for func_name, original in originals.items():
+            setattr(server_module, func_name, original)
+
+    return restore
+
+
+def build_cart(stores: List[Any], items_per_store: int, with_tokens: bool) -> Dict[str, Any]:
+    """Build a /checkout payload spanning every store."""
+    items = []
+    for store in stores:
+        for _ in range(items_per_store):
+            items.append({
+                "variant_id": random.randint(10**9, 10**10),
+                "quantity": random.randint(1, 3),
+                "store_domain": store.base_url,
+                "access_token": store.token if with_tokens else None,
+            })
+    return {"items": items}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--stores", type=int, default=3)
+    parser.add_argument("--items-per-store", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--with-tokens", action="store_true", help="Send access tokens (skips discovery)")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    import server
+
+    stores = [
+        start_fake_storefront(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)[0]
+        for _ in range(args.stores)
+    ]
+    timings: Dict[str, List[float]] = defaultdict(list)
+    restore = instrument_stages(server, timings)
+
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while next(counter) < args.requests:
+            payload = build_cart(stores, args.items_per_store, args.with_tokens)
+            start = time.perf_counter()
+            try:
+                resp = await client.post("/checkout", json=payload)
+                checkouts = resp.json().get("checkouts", [])
+                failed = resp.status_code != 200 or any("error" in c for c in checkouts)
+            except Exception as e:
+                print(f"Request failed: {e}")
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            if failed:
+                errors += 1
+
+    monitor = LoopLagMonitor()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            await monitor.start()
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+            loop_stats = await monitor.stop()
+    finally:
+        restore()
+        for store in stores:
+            store.shutdown()
+
+    summary = summarize(latencies, errors, elapsed)
+    summary.update(loop_stats)
+    for stage in STAGES:
+        samples = timings.get(stage, [])
+        summary[f"{stage}_calls"] = len(samples)
+        summary[f"{stage}_p50_ms"] = percentile(samples, 50) * 1000
+        summary[f"{stage}_p95_ms"] = percentile(samples, 95) * 1000
+    print_report(
+        f"/checkout ({args.stores} stores x {args.items_per_store} items, concurrency={args.concurrency})",
+        summary,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
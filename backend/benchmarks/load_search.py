@@ -0,0 +1,170 @@
+"""
+End-to-end /search load benchmark.
+
+By default everything runs offline and in-process: the local fake catalog MCP
+server (benchmarks/fake_mcp_server.py, over stdio) and the fake chat model
+(benchmarks/fake_llm.py) are wired into a real MCPLangGraphAgent, and requests
+go through the FastAPI app via an in-memory ASGI transport.
+
+Usage (from backend/):
+    python -m benchmarks.load_search --concurrency 8 --requests 200
+    python -m benchmarks.load_search --mcp-latency-ms 800 --llm-latency-ms 500
+    MCP_HEDGE=1 python -m benchmarks.load_search --mcp-slow-rate 0.05 --mcp-slow-ms 3000
+
+Against a running server (start it with AGENT_LLM=fake and MCP_CONFIG_PATH
+pointing at a config for the fake MCP server):
+    python -m benchmarks.load_search --url http://localhost:8080
+
+Reports p50/p95/p99 latency, throughput and error rate.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.stats import summarize, print_report
+
+
+DEFAULT_QUERIES = [
+    "red sneakers",
+    "running shoes",
+    "wool sweater",
+    "leather wallet",
+    "waterproof jacket",
+    "yoga mat",
+    "wireless headphones",
+    "linen shirt",
+]
+
+FAKE_MCP_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_mcp_server.py")
+
+
+def write_fake_servers_config(args: argparse.Namespace) -> str:
+    """Write an MCP servers config that launches the fake catalog over stdio."""
+    config = {
+        "mcpServers": {
+            "shopify": {
+                "command": sys.executable,
+                "args": [
+                    FAKE_MCP_SERVER,
+                    "--latency-ms", str(args.mcp_latency_ms),
+                    "--jitter-ms", str(args.mcp_jitter_ms),
+                    "--payload-bytes", str(args.payload_bytes),
+                    "--slow-rate", str(args.mcp_slow_rate),
+                    "--slow-ms", str(args.mcp_slow_ms),
+                ],
+            }
+        }
+    }
+    fd, path = tempfile.mkstemp(prefix="fake_servers_", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(config, f)
+    return path
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    queries: List[str],
+    total_requests: int,
+    concurrency: int,
+    limit: int,
+    users: int,
+) -> Dict[str, Any]:
+    """
+    Fire ``total_requests`` searches with at most ``concurrency`` in flight.
+    """
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        while True:
+            n = next(counter)
+            if n >= total_requests:
+                return
+            query = queries[n % len(queries)]
+            user_id = f"bench-user-{n % users}" if users else ""
+            start = time.perf_counter()
+            try:
+                resp = await client.post(
+                    "/search",
+                    params={"limit": limit, "user_id": user_id, "v": 2},
+                    json={"query": query},
+                )
+                failed = resp.status_code != 200 or "error" in resp.json()
+            except Exception as e:
+                print(f"Request failed: {e}")
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            if failed:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, elapsed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--users", type=int, default=0, help="Distinct user_ids to rotate through (0 = anonymous)")
+    parser.add_argument("--queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--mcp-latency-ms", type=float, default=300)
+    parser.add_argument("--mcp-jitter-ms", type=float, default=100)
+    parser.add_argument("--payload-bytes", type=int, default=3000)
+    parser.add_argument("--mcp-slow-rate", type=float, default=0.0, help="Fraction of catalog calls that are slow (tail)")
+    parser.add_argument("--mcp-slow-ms", type=float, default=5000)
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            summary = await run_load(client, args.queries, args.requests, args.concurrency, args.limit, args.users)
+        print_report(f"/search @ {args.url} (concurrency={args.concurrency})", summary)
+        return
+
+    import server
+    from mcp_agent import MCPLangGraphAgent
+    from benchmarks.fake_llm import FakeShoppingChatModel
+    from tool_reducers import reduction_stats
+
+    config_path = write_fake_servers_config(args)
+    agent = MCPLangGraphAgent(config_path, model=FakeShoppingChatModel(latency_ms=args.llm_latency_ms))
+    try:
+        await agent.initialize()
+        server.app.state.agent = agent
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            summary = await run_load(client, args.queries, args.requests, args.concurrency, args.limit, args.users)
+
+        if agent.llm_cache:
+            summary["llm_cache"] = agent.llm_cache.snapshot()
+        summary["tool_cache"] = agent.tool_cache.snapshot()
+        if agent.plan_cache:
+            summary["plan_cache"] = agent.plan_cache.snapshot()
+        summary["tool_output"] = dict(reduction_stats)
+        for server, health in agent.mcp_client.health_snapshot().items():
+            summary[f"mcp_{server}"] = health
+        print_report(f"/search in-process (concurrency={args.concurrency})", summary)
+    finally:
+        await agent.cleanup()
+        os.remove(config_path)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
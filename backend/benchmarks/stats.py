@@ -0,0 +1,111 @@
+"""
+Latency statistics and report formatting shared by the benchmark drivers.
+"""
+
+import asyncio
+import math
+from typing import Any, Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of ``values`` (0 when empty).
+
+    Args:
+        values: Samples, in any order.
+        pct: Percentile between 0 and 100.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """
+    Summarize a load run.
+
+    Args:
+        latencies: Per-request latencies in seconds (successful and failed).
+        errors: Number of failed requests.
+        elapsed: Wall-clock duration of the run in seconds.
+    """
+    total = len(latencies)
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        "elapsed_s": elapsed,
+    }
+
+
+def print_report(title: str, summary: Dict[str, Any]) -> None:
+    """Print a summary produced by ``summarize`` (plus any extra keys)."""
+    print("\n" + "=" * 50)
+    print(title)
+    print("=" * 50)
+    for key, value in summary.items():
+        if isinstance(value, float):
+            print(f"  {key:<18} {value:,.3f}")
+        else:
+            print(f"  {key:<18} {value}")
+
+
+class LoopLagMonitor:
+    """
+    Measures how long the event loop is blocked while a benchmark runs.
+
+    A ticker sleeps for ``interval`` seconds at a time; any extra delay before it
+    wakes up is time the loop spent running blocking code.
+    """
+
+    def __init__(self, interval: float = 0.01, threshold: float = 0.005):
+        """
+        Args:
+            interval: Ticker period in seconds.
+            threshold: Lags below this are treated as scheduling noise.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked_s = 0.0
+        self.max_lag_s = 0.0
+        self.stalls = 0
+        self._task = None
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > self.threshold:
+                self.blocked_s += lag
+                self.stalls += 1
+                self.max_lag_s = max(self.max_lag_s, lag)
+
+    async def start(self) -> None:
+        """Start the ticker and let it take its first timestamp."""
+        self._task = asyncio.create_task(self._tick())
+        await asyncio.sleep(0)
+
+    async def stop(self) -> Dict[str, Any]:
+        """Stop the ticker and return the collected figures."""
+        if self._task:
+            # Give the ticker a chance to observe a stall that just ended
+            await asyncio.sleep(self.interval * 2)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return {
+            "loop_blocked_s": self.blocked_s,
+            "loop_max_lag_ms": self.max_lag_s * 1000,
+            "loop_stalls": self.stalls,
+        }
@@ -0,0 +1,704 @@
+"""
+Durable LangGraph checkpointers for the agent's conversation state.
+
+The default ``MemorySaver`` keeps each thread's state inside one process, so a
+follow-up search that lands on another uvicorn worker (or pod) has no context.
+``DeltaCheckpointSaver`` stores checkpoints in a shared backend instead:
+
+- ``SQLiteCheckpointStore``: one file shared by the workers of a single node (WAL mode)
+- ``MongoCheckpointStore``: the existing MongoDB cluster, for multi-node deployments
+
+Message deltas: every agent step produces a checkpoint whose ``messages``
+channel holds the *whole* conversation so far. Instead of re-serializing that
+list each step, messages are appended once to a per-thread message log and the
+checkpoint records only how many log entries it covers. A step therefore writes
+just its new messages. When a new list is not an extension of the log (a thread
+forked from an older checkpoint, or messages removed), a new log generation is
+started.
+
+Read cache: deserialized message logs and channel blobs are immutable once
+written, so they are kept in an in-process LRU keyed by thread. Only the small
+checkpoint row is read from the backend on each step.
+
+Configuration (environment):
+    AGENT_CHECKPOINTER        memory | sqlite | mongo (default memory)
+    AGENT_CHECKPOINT_DB       SQLite file path (default checkpoints.sqlite)
+    AGENT_CHECKPOINT_CACHE    Threads kept in the read cache (default 256, 0 disables)
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Channels whose value is an append-mostly list of messages
+DELTA_CHANNELS = ("messages",)
+
+# Blob type marking a channel value stored as a prefix of the message log
+LOG_REF_TYPE = "msglog"
+
+Typed = Tuple[str, bytes]
+
+
+@dataclass
+class _LogHead:
+    """Latest message-log generation for a thread and the ids it contains."""
+    gen: int = 0
+    ids: List[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class _LogRef:
+    """A channel value that is the first ``count`` messages of log generation ``gen``."""
+    gen: int
+    count: int
+
+
+@dataclass
+class _ThreadCache:
+    """Immutable data read for one (thread, namespace)."""
+    messages: Dict[int, List[Any]] = field(default_factory=dict)  # gen -> deserialized prefix
+    blobs: Dict[Tuple[str, str], Any] = field(default_factory=dict)  # (channel, version) -> value
+    head: Optional[_LogHead] = None
+
+
+# =============================================================================
+# STORAGE BACKENDS
+# =============================================================================
+
+class SQLiteCheckpointStore:
+    """Checkpoint tables in a SQLite file; safe for several processes on one host."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        thread_id TEXT, ns TEXT, checkpoint_id TEXT, parent_id TEXT,
+        type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+        PRIMARY KEY (thread_id, ns, checkpoint_id)
+    );
+    CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+        thread_id TEXT, ns TEXT, channel TEXT, version TEXT, type TEXT, blob BLOB,
+        PRIMARY KEY (thread_id, ns, channel, version)
+    );
+    CREATE TABLE IF NOT EXISTS checkpoint_writes (
+        thread_id TEXT, ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,
+        channel TEXT, type TEXT, blob BLOB, task_path TEXT,
+        PRIMARY KEY (thread_id, ns, checkpoint_id, task_id, idx)
+    );
+    CREATE TABLE IF NOT EXISTS checkpoint_messages (
+        thread_id TEXT, ns TEXT, gen INTEGER, seq INTEGER, msg_id TEXT, type TEXT, blob BLOB,
+        PRIMARY KEY (thread_id, ns, gen, seq)
+    );
+    """
+
+    def __init__(self, path: str = "checkpoints.sqlite"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def save_checkpoint(self, thread_id, ns, checkpoint_id, parent_id, checkpoint: Typed, metadata: Typed,
+                        blobs: List[Tuple[str, str, Typed]], messages: List[Tuple[int, int, str, Typed]]) -> bool:
+        """
+        Write a checkpoint, its new channel blobs and appended log messages atomically.
+
+        Returns:
+            False if another writer already appended the same log positions (nothing is written).
+        """
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT INTO checkpoint_messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(thread_id, ns, gen, seq, msg_id, t, b) for gen, seq, msg_id, (t, b) in messages],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?)",
+                    [(thread_id, ns, channel, version, t, b) for channel, version, (t, b) in blobs],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, checkpoint_id, parent_id, *checkpoint, *metadata),
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except sqlite3.IntegrityError:
+                self._conn.execute("ROLLBACK")
+                return False
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load_checkpoints(self, thread_id: Optional[str], ns: Optional[str], checkpoint_id: Optional[str] = None,
+                         before: Optional[str] = None, limit: Optional[int] = None) -> List[tuple]:
+        """Rows of (thread_id, ns, checkpoint_id, parent_id, checkpoint, metadata), newest first."""
+        clauses, params = [], []
+        for column, value in (("thread_id", thread_id), ("ns", ns), ("checkpoint_id", checkpoint_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before is not None:
+            clauses.append("checkpoint_id < ?")
+            params.append(before)
+        sql = "SELECT thread_id, ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY checkpoint_id DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(r[0], r[1], r[2], r[3], (r[4], r[5]), (r[6], r[7])) for r in rows]
+
+    def load_blobs(self, thread_id, ns, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Typed]:
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            for channel, version in keys:
+                row = self._conn.execute(
+                    "SELECT type, blob FROM checkpoint_blobs WHERE thread_id = ? AND ns = ? AND channel = ? AND version = ?",
+                    (thread_id, ns, channel, version),
+                ).fetchone()
+                if row:
+                    found[(channel, version)] = (row[0], row[1])
+        return found
+
+    def load_messages(self, thread_id, ns, gen: int, start: int, end: int) -> List[Typed]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT type, blob FROM checkpoint_messages WHERE thread_id = ? AND ns = ? AND gen = ? "
+                "AND seq >= ? AND seq < ? ORDER BY seq",
+                (thread_id, ns, gen, start, end),
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def load_log_head(self, thread_id, ns, known: Optional[_LogHead]) -> _LogHead:
+        """Latest log generation and its message ids; reuses ``known`` if it is still current."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT gen, COUNT(*) FROM checkpoint_messages WHERE thread_id = ? AND ns = ? "
+                "GROUP BY gen ORDER BY gen DESC LIMIT 1",
+                (thread_id, ns),
+            ).fetchone()
+            if row is None:
+                return _LogHead()
+            gen, count = row
+            if known is not None and known.gen == gen and len(known.ids) == count:
+                return known
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT msg_id FROM checkpoint_messages WHERE thread_id = ? AND ns = ? AND gen = ? ORDER BY seq",
+                (thread_id, ns, gen),
+            )]
+        return _LogHead(gen=gen, ids=ids)
+
+    def put_writes(self, thread_id, ns, checkpoint_id, task_id, task_path,
+                   writes: List[Tuple[int, str, Typed]], replace: bool) -> None:
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, checkpoint_id, task_id, idx, channel, t, b, task_path)
+                 for idx, channel, (t, b) in writes],
+            )
+
+    def load_writes(self, thread_id, ns, checkpoint_id) -> List[Tuple[str, str, Typed, str, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, channel, type, blob, task_path, idx FROM checkpoint_writes "
+                "WHERE thread_id = ? AND ns = ? AND checkpoint_id = ?",
+                (thread_id, ns, checkpoint_id),
+            ).fetchall()
+        return [(r[0], r[1], (r[2], r[3]), r[4], r[5]) for r in rows]
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes", "checkpoint_messages"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+
+class MongoCheckpointStore:
+    """Checkpoint collections in the application's MongoDB database."""
+
+    def __init__(self, db):
+        from schema import CHECKPOINT_COLLECTIONS, apply_schema, problems
+
+        self.checkpoints = db["agent_checkpoints"]
+        self.blobs = db["agent_checkpoint_blobs"]
+        self.writes = db["agent_checkpoint_writes"]
+        self.messages = db["agent_checkpoint_messages"]
+
+        # Indexes are declared in schema.py with the other collections
+        for issue in problems(apply_schema(db, CHECKPOINT_COLLECTIONS)):
+            logger.warning("Schema drift: %s", issue)
+
+    def close(self) -> None:
+        pass
+
+    def save_checkpoint(self, thread_id, ns, checkpoint_id, parent_id, checkpoint: Typed, metadata: Typed,
+                        blobs: List[Tuple[str, str, Typed]], messages: List[Tuple[int, int, str, Typed]]) -> bool:
+        from pymongo import ReplaceOne
+        from pymongo.errors import BulkWriteError
+
+        # Messages go first: a duplicate (seq) means another worker appended concurrently
+        if messages:
+            try:
+                self.messages.insert_many([
+                    {"thread_id": thread_id, "ns": ns, "gen": gen, "seq": seq, "msg_id": msg_id, "type": t, "blob": b}
+                    for gen, seq, msg_id, (t, b) in messages
+                ], ordered=True)
+            except BulkWriteError:
+                return False
+        if blobs:
+            self.blobs.bulk_write([
+                ReplaceOne(
+                    {"thread_id": thread_id, "ns": ns, "channel": channel, "version": version},
+                    {"thread_id": thread_id, "ns": ns, "channel": channel, "version": version, "type": t, "blob": b},
+                    upsert=True,
+                )
+                for channel, version, (t, b) in blobs
+            ], ordered=False)
+        key = {"thread_id": thread_id, "ns": ns, "checkpoint_id": checkpoint_id}
+        self.checkpoints.replace_one(key, {
+            **key,
+            "parent_id": parent_id,
+            "type": checkpoint[0], "checkpoint": checkpoint[1],
+            "metadata_type": metadata[0], "metadata": metadata[1],
+        }, upsert=True)
+        return True
+
+    def load_checkpoints(self, thread_id: Optional[str], ns: Optional[str], checkpoint_id: Optional[str] = None,
+                         before: Optional[str] = None, limit: Optional[int] = None) -> List[tuple]:
+        query: Dict[str, Any] = {}
+        if thread_id is not None:
+            query["thread_id"] = thread_id
+        if ns is not None:
+            query["ns"] = ns
+        if checkpoint_id is not None:
+            query["checkpoint_id"] = checkpoint_id
+        if before is not None:
+            query.setdefault("checkpoint_id", {})
+            if isinstance(query["checkpoint_id"], dict):
+                query["checkpoint_id"]["$lt"] = before
+        cursor = self.checkpoints.find(query).sort("checkpoint_id", -1)
+        if limit is not None:
+            cursor = cursor.limit(int(limit))
+        return [
+            (d["thread_id"], d["ns"], d["checkpoint_id"], d.get("parent_id"),
+             (d["type"], d["checkpoint"]), (d["metadata_type"], d["metadata"]))
+            for d in cursor
+        ]
+
+    def load_blobs(self, thread_id, ns, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Typed]:
+        if not keys:
+            return {}
+        cursor = self.blobs.find({
+            "thread_id": thread_id, "ns": ns,
+            "$or": [{"channel": channel, "version": version} for channel, version in keys],
+        })
+        return {(d["channel"], d["version"]): (d["type"], d["blob"]) for d in cursor}
+
+    def load_messages(self, thread_id, ns, gen: int, start: int, end: int) -> List[Typed]:
+        cursor = self.messages.find(
+            {"thread_id": thread_id, "ns": ns, "gen": gen, "seq": {"$gte": start, "$lt": end}},
+            {"type": 1, "blob": 1},
+        ).sort("seq", 1)
+        return [(d["type"], d["blob"]) for d in cursor]
+
+    def load_log_head(self, thread_id, ns, known: Optional[_LogHead]) -> _LogHead:
+        latest = self.messages.find_one(
+            {"thread_id": thread_id, "ns": ns}, {"gen": 1}, sort=[("gen", -1), ("seq", -1)]
+        )
+        if latest is None:
+            return _LogHead()
+        gen = latest["gen"]
+        count = self.messages.count_documents({"thread_id": thread_id, "ns": ns, "gen": gen})
+        if known is not None and known.gen == gen and len(known.ids) == count:
+            return known
+        cursor = self.messages.find({"thread_id": thread_id, "ns": ns, "gen": gen}, {"msg_id": 1}).sort("seq", 1)
+        return _LogHead(gen=gen, ids=[d["msg_id"] for d in cursor])
+
+    def put_writes(self, thread_id, ns, checkpoint_id, task_id, task_path,
+                   writes: List[Tuple[int, str, Typed]], replace: bool) -> None:
+        from pymongo import UpdateOne
+
+        ops = []
+        for idx, channel, (t, b) in writes:
+            key = {"thread_id": thread_id, "ns": ns, "checkpoint_id": checkpoint_id, "task_id": task_id, "idx": idx}
+            doc = {"channel": channel, "type": t, "blob": b, "task_path": task_path}
+            update = {"$set": doc} if replace else {"$setOnInsert": doc}
+            ops.append(UpdateOne(key, update, upsert=True))
+        if ops:
+            self.writes.bulk_write(ops, ordered=False)
+
+    def load_writes(self, thread_id, ns, checkpoint_id) -> List[Tuple[str, str, Typed, str, int]]:
+        cursor = self.writes.find({"thread_id": thread_id, "ns": ns, "checkpoint_id": checkpoint_id})
+        return [(d["task_id"], d["channel"], (d["type"], d["blob"]), d.get("task_path", ""), d["idx"]) for d in cursor]
+
+    def delete_thread(self, thread_id: str) -> None:
+        for collection in (self.checkpoints, self.blobs, self.writes, self.messages):
+            collection.delete_many({"thread_id": thread_id})
+
+
+# =============================================================================
+# SAVER
+# =============================================================================
+
+class DeltaCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer over a shared store, writing message deltas.
+
+    Sync methods talk to the store directly; async methods run them in a worker
+    thread so the event loop is never blocked on disk or network I/O.
+    """
+
+    def __init__(self, store, cache_threads: int = 256, delta_channels: Sequence[str] = DELTA_CHANNELS, serde=None):
+        """
+        Args:
+            store: A SQLiteCheckpointStore or MongoCheckpointStore.
+            cache_threads: Threads whose immutable data is kept in memory (0 disables the cache).
+            delta_channels: Channels stored as message-log prefixes instead of full blobs.
+        """
+        super().__init__(serde=serde)
+        self.store = store
+        self.cache_threads = cache_threads
+        self.delta_channels = tuple(delta_channels)
+        self._cache: "OrderedDict[Tuple[str, str], _ThreadCache]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"puts": 0, "gets": 0, "bytes_written": 0, "messages_appended": 0,
+                      "full_blobs": 0, "log_forks": 0, "cache_hits": 0, "cache_misses": 0}
+
+    def close(self) -> None:
+        self.store.close()
+
+    # ------------------------------------------------------------------ cache
+
+    def _thread_cache(self, thread_id: str, ns: str) -> _ThreadCache:
+        if self.cache_threads <= 0:
+            return _ThreadCache()
+        key = (thread_id, ns)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                cached = self._cache[key] = _ThreadCache()
+                while len(self._cache) > self.cache_threads:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(key)
+            return cached
+
+    # ------------------------------------------------------------------ reads
+
+    def _load_messages(self, thread_id: str, ns: str, gen: int, count: int, cache: _ThreadCache) -> List[Any]:
+        prefix = cache.messages.get(gen, [])
+        if len(prefix) >= count:
+            self.stats["cache_hits"] += 1
+            return list(prefix[:count])
+        self.stats["cache_misses"] += 1
+        loaded = [self.serde.loads_typed(m) for m in self.store.load_messages(thread_id, ns, gen, len(prefix), count)]
+        messages = prefix + loaded
+        cache.messages[gen] = messages
+        return list(messages)
+
+    def _channel_values(self, thread_id: str, ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        cache = self._thread_cache(thread_id, ns)
+        wanted = [(channel, str(version)) for channel, version in versions.items()]
+        missing = [key for key in wanted if key not in cache.blobs]
+        for key, typed in self.store.load_blobs(thread_id, ns, missing).items():
+            if typed[0] == LOG_REF_TYPE:
+                gen, count = (int(x) for x in typed[1].decode().split(":"))
+                cache.blobs[key] = _LogRef(gen, count)
+            elif typed[0] == "empty":
+                cache.blobs[key] = None
+            else:
+                cache.blobs[key] = self.serde.loads_typed(typed)
+
+        values = {}
+        for key in wanted:
+            if key not in cache.blobs or cache.blobs[key] is None:
+                continue
+            value = cache.blobs[key]
+            if isinstance(value, _LogRef):
+                value = self._load_messages(thread_id, ns, value.gen, value.count, cache)
+            values[key[0]] = value
+        return values
+
+    def _to_tuple(self, row: tuple) -> CheckpointTuple:
+        thread_id, ns, checkpoint_id, parent_id, checkpoint_typed, metadata_typed = row
+        checkpoint = self.serde.loads_typed(checkpoint_typed)
+        writes = sorted(
+            self.store.load_writes(thread_id, ns, checkpoint_id),
+            key=lambda w: writes_sort_key(w[3], w[0], w[4]),
+        )
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._channel_values(thread_id, ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed(metadata_typed),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(typed)) for task_id, channel, typed, _, _ in writes],
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self.stats["gets"] += 1
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        rows = self.store.load_checkpoints(thread_id, ns, checkpoint_id=get_checkpoint_id(config), limit=1)
+        return self._to_tuple(rows[0]) if rows else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        configurable = (config or {}).get("configurable", {})
+        rows = self.store.load_checkpoints(
+            configurable.get("thread_id"),
+            configurable.get("checkpoint_ns"),
+            checkpoint_id=get_checkpoint_id(config) if config else None,
+            before=get_checkpoint_id(before) if before else None,
+            # Metadata filters are applied after loading, so the limit can only be pushed down without one
+            limit=None if filter else limit,
+        )
+        for row in rows:
+            if filter:
+                metadata = self.serde.loads_typed(row[5])
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                if limit is not None:
+                    if limit <= 0:
+                        return
+                    limit -= 1
+            yield self._to_tuple(row)
+
+    # ------------------------------------------------------------------ writes
+
+    def _encode_delta(self, thread_id: str, ns: str, messages: List[Any], cache: _ThreadCache,
+                      appended: List[Tuple[int, int, str, Typed]]) -> Optional[bytes]:
+        """
+        Plan how to store a message list as a log prefix.
+
+        Appends the messages to write to ``appended`` and returns the reference to
+        store as the channel blob, or None if the list cannot be logged (e.g. a
+        message without an id).
+        """
+        ids = [getattr(m, "id", None) for m in messages]
+        if not all(ids):
+            return None
+        head = cache.head = self.store.load_log_head(thread_id, ns, cache.head)
+        pending = [entry for entry in appended if entry[0] == head.gen]
+        log_ids = head.ids + [entry[2] for entry in pending]
+
+        if ids[:len(log_ids)] == log_ids:
+            gen, start = head.gen, len(log_ids)
+        elif log_ids[:len(ids)] == ids:
+            # An earlier prefix of the current log (e.g. re-reading after a rollback)
+            return f"{head.gen}:{len(ids)}".encode()
+        else:
+            # The conversation diverged from the log: start a new generation
+            gen, start = head.gen + 1, 0
+            self.stats["log_forks"] += 1
+
+        for seq in range(start, len(messages)):
+            appended.append((gen, seq, ids[seq], self.serde.dumps_typed(messages[seq])))
+        return f"{gen}:{len(messages)}".encode()
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        cache = self._thread_cache(thread_id, ns)
+
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+
+        for attempt in range(2):
+            blobs: List[Tuple[str, str, Typed]] = []
+            appended: List[Tuple[int, int, str, Typed]] = []
+            logged: Dict[int, List[Any]] = {}
+            for channel, version in new_versions.items():
+                if channel not in values:
+                    blobs.append((channel, str(version), ("empty", b"")))
+                    continue
+                value = values[channel]
+                ref = None
+                if channel in self.delta_channels and isinstance(value, list):
+                    ref = self._encode_delta(thread_id, ns, value, cache, appended)
+                if ref is not None:
+                    blobs.append((channel, str(version), (LOG_REF_TYPE, ref)))
+                    logged[int(ref.split(b":")[0])] = value
+                else:
+                    self.stats["full_blobs"] += 1
+                    blobs.append((channel, str(version), self.serde.dumps_typed(value)))
+
+            checkpoint_typed = self.serde.dumps_typed(c)
+            metadata_typed = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+            if self.store.save_checkpoint(thread_id, ns, checkpoint["id"], parent_id,
+                                          checkpoint_typed, metadata_typed, blobs, appended):
+                break
+            # Another worker appended to this thread's log concurrently; re-read the head and retry
+            logger.debug("Checkpoint log race on %s, retrying", thread_id)
+            cache.head = None
+        else:
+            raise RuntimeError(f"Could not append to the message log of thread {thread_id}")
+
+        self.stats["puts"] += 1
+        self.stats["messages_appended"] += len(appended)
+        self.stats["bytes_written"] += (
+            len(checkpoint_typed[1]) + len(metadata_typed[1])
+            + sum(len(typed[1]) for _, _, typed in blobs)
+            + sum(len(typed[1]) for _, _, _, typed in appended)
+        )
+        # What was just written is exactly what the next step will read back
+        for gen, messages in logged.items():
+            if len(messages) > len(cache.messages.get(gen, ())):
+                cache.messages[gen] = list(messages)
+        if cache.head is not None:
+            for gen, _, msg_id, _ in appended:
+                if gen != cache.head.gen:
+                    cache.head = _LogHead(gen=gen, ids=[])
+                cache.head.ids.append(msg_id)
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        encoded = [
+            (WRITES_IDX_MAP.get(channel, idx), channel, self.serde.dumps_typed(value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        self.store.put_writes(
+            configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"],
+            task_id, task_path, encoded, replace,
+        )
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.store.delete_thread(thread_id)
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == thread_id]:
+                del self._cache[key]
+
+    def get_next_version(self, current: Optional[str], channel: None = None) -> str:
+        # Same scheme as MemorySaver: monotonic counter plus a random suffix so forks don't collide
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ------------------------------------------------------------------ async
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer(kind: Optional[str] = None) -> BaseCheckpointSaver:
+    """
+    Build the checkpointer named by ``kind`` or AGENT_CHECKPOINTER.
+
+    Falls back to an in-process MemorySaver if MongoDB is selected but unavailable.
+    """
+    kind = (kind or os.getenv("AGENT_CHECKPOINTER", "memory")).lower()
+    cache_threads = int(os.getenv("AGENT_CHECKPOINT_CACHE", "256"))
+
+    if kind == "sqlite":
+        path = os.getenv("AGENT_CHECKPOINT_DB", "checkpoints.sqlite")
+        logger.info("Using SQLite checkpointer at %s", path)
+        return DeltaCheckpointSaver(SQLiteCheckpointStore(path), cache_threads=cache_threads)
+
+    if kind == "mongo":
+        from database import get_database
+
+        db = get_database()
+        if db is not None:
+            logger.info("Using MongoDB checkpointer")
+            return DeltaCheckpointSaver(MongoCheckpointStore(db), cache_threads=cache_threads)
+        logger.warning("MongoDB unavailable; falling back to the in-memory checkpointer")
+    elif kind != "memory":
+        raise ValueError(f"Unknown checkpointer '{kind}'. Use memory, sqlite or mongo.")
+
+    return MemorySaver()
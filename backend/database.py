@@ -1,17 +1,24 @@
 """
 MongoDB database operations for Trovato.
-Handles user profiles and search history.
+Handles user profiles, search history and per-user search summaries.
 """
 
 import os
+import threading
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
+from app_logging import get_logger
+from user_stats import update_stats, build_stats
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 _client = None
+_client_lock = threading.Lock()
 _db_name = "Travado"
 
 
@@ -21,16 +28,19 @@ def get_database():
     if _client is None:
         uri = os.getenv("MONGODB_URI")
         if not uri:
-            print("Error: MONGODB_URI not found in environment variables.")
+            logger.error("Error: MONGODB_URI not found in environment variables.")
             return None
-        try:
-            _client = MongoClient(uri, serverSelectionTimeoutMS=5000)
-            _client.admin.command('ping')
-            print("Connected to MongoDB.")
-        except Exception as e:
-            print(f"Failed to connect to MongoDB: {e}")
-            _client = None
-    
+        # Callers run in worker threads (asyncio.to_thread); connect only once
+        with _client_lock:
+            if _client is None:
+                try:
+                    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+                    client.admin.command('ping')
+                    _client = client
+                    logger.info("Connected to MongoDB.")
+                except Exception as e:
+                    logger.error("Failed to connect to MongoDB: %s", e)
+
     if _client:
         return _client[_db_name]
     return None
@@ -48,7 +58,7 @@ def upsert_user_profile(profile_data: Dict[str, Any]) -> bool:
     """
     db = get_database()
     if db is None:
-        print("Database unavailable, cannot save profile.")
+        logger.warning("Database unavailable, cannot save profile.")
         return False
 
     try:
@@ -56,7 +66,7 @@ def upsert_user_profile(profile_data: Dict[str, Any]) -> bool:
         user_id = profile_data.get("user_id")
         
         if not user_id:
-            print("Error: user_id is required for profile upsert")
+            logger.error("Error: user_id is required for profile upsert")
             return False
         
         # Set timestamps
@@ -77,10 +87,10 @@ def upsert_user_profile(profile_data: Dict[str, Any]) -> bool:
             upsert=True
         )
         
-        print(f"Profile upserted for user {user_id}")
+        logger.info("Profile upserted for user %s", user_id)
         return True
     except Exception as e:
-        print(f"Error upserting profile: {e}")
+        logger.error("Error upserting profile: %s", e)
         return False
 
 
@@ -106,7 +116,7 @@ def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
             return profile
         return None
     except Exception as e:
-        print(f"Error retrieving profile: {e}")
+        logger.error("Error retrieving profile: %s", e)
         return None
 
 
@@ -127,11 +137,11 @@ def delete_user_profile(user_id: str) -> bool:
         result = collection.delete_one({"user_id": user_id})
         
         if result.deleted_count > 0:
-            print(f"Deleted profile for user {user_id}")
+            logger.info("Deleted profile for user %s", user_id)
             return True
         return False
     except Exception as e:
-        print(f"Error deleting profile: {e}")
+        logger.error("Error deleting profile: %s", e)
         return False
 
 
@@ -153,7 +163,7 @@ def get_all_profiles(limit: int = 100) -> list:
             profiles.append(profile)
         return profiles
     except Exception as e:
-        print(f"Error retrieving profiles: {e}")
+        logger.error("Error retrieving profiles: %s", e)
         return []
 
 
@@ -170,7 +180,7 @@ def add_search_history(user_id: str, query: str):
 
     db = get_database()
     if db is None:
-        print("Database unavailable, skipping history save.")
+        logger.warning("Database unavailable, skipping history save.")
         return
 
     try:
@@ -181,9 +191,12 @@ def add_search_history(user_id: str, query: str):
             "timestamp": datetime.now(timezone.utc)
         }
         collection.insert_one(doc)
-        print(f"Saved search history for user {user_id}")
+        logger.info("Saved search history for user %s", user_id)
     except Exception as e:
-        print(f"Error saving search history: {e}")
+        logger.error("Error saving search history: %s", e)
+        return
+
+    _update_search_stats(db, user_id, query, doc["timestamp"].timestamp())
 
 
 def get_search_history(user_id: str, limit: int = 5):
@@ -205,5 +218,77 @@ def get_search_history(user_id: str, limit: int = 5):
         
         return [doc["query"] for doc in cursor]
     except Exception as e:
-        print(f"Error retrieving search history: {e}")
+        logger.error("Error retrieving search history: %s", e)
         return []
+
+
+# =============================================================================
+# SEARCH SUMMARY OPERATIONS (see user_stats.py)
+# =============================================================================
+
+_STATS_RETRIES = 3
+_BACKFILL_QUERIES = 50
+
+
+def _update_search_stats(db, user_id: str, query: str, at: float):
+    """
+    Fold one search into the user's summary.
+
+    Optimistic concurrency: the write only applies if nobody updated the record
+    since it was read, otherwise it is recomputed (a few times at most).
+    """
+    collection = db["user_search_stats"]
+    try:
+        for _ in range(_STATS_RETRIES):
+            current = collection.find_one({"_id": user_id})
+            version = current.get("version", 0) if current else 0
+            stats = update_stats(current.get("stats") if current else None, query, at)
+            if current is None:
+                try:
+                    collection.insert_one({"_id": user_id, "stats": stats, "version": 1})
+                    return
+                except DuplicateKeyError:
+                    continue
+            result = collection.update_one(
+                {"_id": user_id, "version": version},
+                {"$set": {"stats": stats, "version": version + 1}},
+            )
+            if result.matched_count:
+                return
+        logger.warning("Search summary for user %s kept changing; skipped this update", user_id)
+    except Exception as e:
+        logger.error("Error updating search summary for user %s: %s", user_id, e)
+
+
+def get_search_stats(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Retrieve a user's search summary (a single keyed lookup).
+
+    Users whose history predates the summaries get one built from their
+    history on first use.
+    """
+    if not user_id:
+        return None
+
+    db = get_database()
+    if db is None:
+        return None
+
+    try:
+        doc = db["user_search_stats"].find_one({"_id": user_id}, {"stats": 1})
+        if doc:
+            return doc["stats"]
+
+        cursor = db["search_history"].find({"user_id": user_id}).sort("timestamp", -1).limit(_BACKFILL_QUERIES)
+        history = [(h["query"], h["timestamp"].replace(tzinfo=timezone.utc).timestamp()) for h in cursor]
+        if not history:
+            return None
+        stats = build_stats(list(reversed(history)))
+        try:
+            db["user_search_stats"].insert_one({"_id": user_id, "stats": stats, "version": 1})
+        except DuplicateKeyError:
+            pass
+        return stats
+    except Exception as e:
+        logger.error("Error retrieving search summary for user %s: %s", user_id, e)
+        return None
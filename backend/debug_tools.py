@@ -3,6 +3,7 @@ import json
 import os
 from dotenv import load_dotenv
 from mcp_agent import MCPLangGraphAgent
+from tool_profiles import profile_report
 
 load_dotenv()
 
@@ -34,6 +35,11 @@ async def debug_tools():
             print(f"Schema snippet: {schema_str[:500]} ...")
 
     print(f"\nTotal Approx Characters: {total_len}")
+
+    # Schema cost actually paid per request, by tool profile
+    print("\nSchema Token Cost by Profile:")
+    for row in profile_report(agent.tools):
+        print(f"  {row['profile']:<10} ~{row['schema_tokens']:>6} tokens  {row['tools']}")
     await agent.cleanup()
 
 if __name__ == "__main__":
@@ -3,11 +3,22 @@ from typing import Optional
 
 class PurchaseRequest(BaseModel):
     items: list[str] = Field(..., min_length=1, description="List of products to purchase via UCP")
+    idempotency_key: Optional[str] = Field(default=None, max_length=128, description="Client retry key (the Idempotency-Key header takes precedence)")
+
+class PurchaseItemResult(BaseModel):
+    item: str
+    success: bool
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
 
 class PurchaseResponse(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     purchases: list[dict[str, bool]] = Field(..., description="Purchase-boolean pairs indicating success or failure purchasing")
+    results: list[PurchaseItemResult] = Field(default_factory=list, description="Per-item outcome, in request order")
+    idempotency_key: Optional[str] = Field(default=None, description="Key the purchase was recorded under")
+    replayed: bool = Field(default=False, description="True if this is a stored result for a repeated key")
 
     def add(self, item: str, success: bool):
         self.purchases.append({item: success})
@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+
+class CartProduct(BaseModel):
+    id: str = Field(..., min_length=1)
+    title: Optional[str] = None
+    price: Optional[float] = Field(default=None, description="Price in cents, as in search results.")
+    image_url: Optional[str] = None
+    url: Optional[str] = None
+
+class CartEvent(BaseModel):
+    event: Literal["add", "remove"]
+    product_id: str = Field(..., min_length=1)
+    session_id: str = Field(..., min_length=1, max_length=128, description="One cart; items added under it count as bought together.")
+    user_id: str = Field(default="")
+    product: Optional[CartProduct] = Field(default=None, description="Product details, returned with recommendations.")
@@ -1,7 +1,18 @@
 from pydantic import BaseModel, Field
 from typing import Optional
+from enums.sort import SortBy
 
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, description="The natural language catalog query.")
     # category: Optional[str] = Field(..., min_length=1, description="Product category.")
     # profile: Optional[str] = Field(..., min_length=1, description="Background information about the user.")
+
+class BatchSearchQuery(BaseModel):
+    query: str = Field(..., min_length=1, description="The natural language catalog query.")
+    limit: int = Field(default=10, ge=1, le=100, description="Max items returned for this query.")
+    sort_order: SortBy = Field(default=SortBy.RELEVANCE, description="How to order this query's items.")
+    id: Optional[str] = Field(default=None, max_length=128, description="Caller's own key, echoed back in the result.")
+
+class BatchSearchRequest(BaseModel):
+    queries: list[BatchSearchQuery] = Field(..., min_length=1)
+    user_id: str = Field(default="", description="Use this user's search history as context (history is not updated).")
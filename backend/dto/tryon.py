@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class TryOnRequest(BaseModel):
+    user_id: str = Field(..., min_length=1, description="Supabase user ID; the profile photo is the person in the try-on.")
+    product_id: Optional[str] = Field(default=None, description="Catalog product ID (the image URL is used when missing).")
+    product_image_url: str = Field(..., min_length=1, description="Product image from the search results.")
+    product_name: str = Field(default="", description="Product title, used in the generation prompt.")
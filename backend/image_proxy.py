@@ -0,0 +1,401 @@
+"""
+Product image proxy with an on-disk LRU cache and WebP thumbnails.
+
+``GET /images?url=...&w=320`` fetches a product image from the CDN once, keeps
+the original in a size-bounded disk cache and serves it (or a resized WebP
+thumbnail at one of a few fixed widths) with long-lived cache headers and an
+ETag, answering ``If-None-Match`` with 304.
+
+- concurrent requests for the same image share one upstream fetch
+- only hosts on IMAGE_PROXY_ALLOWED_HOSTS are fetched (the proxy must not become
+  a way to reach arbitrary, e.g. internal, URLs)
+- only raster images (RASTER_TYPES) are cached and served, under a fixed file
+  extension per type; anything else (SVG can carry scripts) is answered with 415
+- requested widths are snapped up to the nearest configured width, so the cache
+  holds at most len(IMAGE_PROXY_WIDTHS) + 1 files per image
+- thumbnails need Pillow; without it the original is served for every width
+- least recently used files are evicted once the cache exceeds
+  IMAGE_CACHE_MAX_BYTES (the order is rebuilt from file mtimes on restart)
+
+Configuration (environment):
+    IMAGE_CACHE_DIR                 Cache directory (default ./image_cache)
+    IMAGE_CACHE_MAX_BYTES           Disk budget in bytes (default 536870912 = 512MB)
+    IMAGE_PROXY_WIDTHS              Thumbnail widths (default 160,320,640)
+    IMAGE_PROXY_ALLOWED_HOSTS       Comma-separated hosts; "*.example.com" matches subdomains
+                                    (default cdn.shopify.com,*.shopify.com,*.shopifycdn.net)
+    IMAGE_PROXY_MAX_SOURCE_BYTES    Largest original accepted (default 15728640 = 15MB)
+    IMAGE_PROXY_TIMEOUT             Upstream fetch timeout in seconds (default 10)
+    IMAGE_PROXY_WEBP_QUALITY        WebP quality for thumbnails (default 80)
+    IMAGE_PROXY_BASE_URL            Public base URL for proxy links in search responses
+                                    (default: the base URL of the incoming request)
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+from app_logging import get_logger
+from metrics import IMAGE_CACHE_BYTES
+
+try:
+    from PIL import Image
+except ImportError:  # optional; originals are served unresized without it
+    Image = None
+
+logger = get_logger(__name__)
+
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Content types served, with the extension their cache files get
+RASTER_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "image/avif": "avif",
+}
+
+
+class ImageProxyError(Exception):
+    """The image cannot be served; ``status_code`` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class CachedImage:
+    path: str
+    content_type: str
+    etag: str
+    size: int
+
+
+def host_allowed(url: str, allowed_hosts: Sequence[str]) -> bool:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    host = parts.hostname.lower()
+    for pattern in allowed_hosts:
+        if pattern.startswith("*."):
+            if host.endswith(pattern[1:]):
+                return True
+        elif host == pattern:
+            return True
+    return False
+
+
+def snap_width(width: Optional[int], widths: Sequence[int]) -> Optional[int]:
+    """Smallest configured width >= ``width`` (the largest one for bigger requests); None keeps the original."""
+    if not width:
+        return None
+    for w in widths:
+        if w >= width:
+            return w
+    return widths[-1]
+
+
+class ImageProxy:
+    """Fetch-once, disk-cached image proxy (see module docstring)."""
+
+    def __init__(
+        self,
+        cache_dir: str = "image_cache",
+        max_bytes: int = 512 * 1024 * 1024,
+        widths: Sequence[int] = (160, 320, 640),
+        allowed_hosts: Sequence[str] = ("cdn.shopify.com", "*.shopify.com", "*.shopifycdn.net"),
+        max_source_bytes: int = 15 * 1024 * 1024,
+        timeout: float = 10,
+        webp_quality: int = 80,
+        base_url: Optional[str] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.widths = sorted(widths)
+        self.allowed_hosts = [h.lower() for h in allowed_hosts]
+        self.max_source_bytes = max_source_bytes
+        self.timeout = timeout
+        self.webp_quality = webp_quality
+        self.base_url = base_url
+
+        self._index: OrderedDict[str, CachedImage] = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {"hits": 0, "misses": 0, "fetches": 0, "resizes": 0, "evictions": 0, "errors": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @classmethod
+    def from_env(cls) -> "ImageProxy":
+        widths = os.getenv("IMAGE_PROXY_WIDTHS", "160,320,640")
+        hosts = os.getenv("IMAGE_PROXY_ALLOWED_HOSTS", "cdn.shopify.com,*.shopify.com,*.shopifycdn.net")
+        return cls(
+            cache_dir=os.getenv("IMAGE_CACHE_DIR", "image_cache"),
+            max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+            widths=[int(w) for w in widths.split(",") if w.strip()],
+            allowed_hosts=[h.strip() for h in hosts.split(",") if h.strip()],
+            max_source_bytes=int(os.getenv("IMAGE_PROXY_MAX_SOURCE_BYTES", str(15 * 1024 * 1024))),
+            timeout=float(os.getenv("IMAGE_PROXY_TIMEOUT", "10")),
+            webp_quality=int(os.getenv("IMAGE_PROXY_WEBP_QUALITY", "80")),
+            base_url=os.getenv("IMAGE_PROXY_BASE_URL") or None,
+        )
+
+    @property
+    def resizing(self) -> bool:
+        return Image is not None
+
+    # ------------------------------------------------------------------
+    # Disk index
+    # ------------------------------------------------------------------
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from the cache directory, oldest mtime first."""
+        entries: List[Tuple[float, str, CachedImage]] = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            try:
+                with open(self._meta_path(key)) as f:
+                    meta = json.load(f)
+                content_type = meta["content_type"]
+                if content_type not in RASTER_TYPES:
+                    continue  # Cached before the allowlist; fetched again on demand
+                path = os.path.join(self.cache_dir, f"{key}.{RASTER_TYPES[content_type]}")
+                stat = os.stat(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((stat.st_mtime, key, CachedImage(path, content_type, meta["etag"], stat.st_size)))
+        for _, key, entry in sorted(entries, key=lambda e: e[0]):
+            self._index[key] = entry
+            self._bytes += entry.size
+        IMAGE_CACHE_BYTES.set(self._bytes)
+        if entries:
+            logger.info("Image cache: %d files, %.1f MB", len(entries), self._bytes / 1e6)
+
+    def _write(self, key: str, data: bytes, content_type: str, etag: str, ext: str) -> CachedImage:
+        """Atomically store a file and its metadata (runs in a worker thread)."""
+        filename = f"{key}.{ext}"
+        path = os.path.join(self.cache_dir, filename)
+        for target, payload in ((path, data), (self._meta_path(key), json.dumps(
+            {"file": filename, "content_type": content_type, "etag": etag}
+        ).encode())):
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, target)
+        return CachedImage(path, content_type, etag, len(data))
+
+    def _remember(self, key: str, entry: CachedImage) -> None:
+        old = self._index.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._index[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            evicted_key, evicted = self._index.popitem(last=False)
+            self._bytes -= evicted.size
+            self.stats["evictions"] += 1
+            for path in (evicted.path, self._meta_path(evicted_key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        IMAGE_CACHE_BYTES.set(self._bytes)
+
+    def _lookup(self, key: str) -> Optional[CachedImage]:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if not os.path.exists(entry.path):
+            self._index.pop(key)
+            self._bytes -= entry.size
+            return None
+        self._index.move_to_end(key)
+        return entry
+
+    # ------------------------------------------------------------------
+    # Fetch and resize
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=False)
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _download(self, url: str) -> Tuple[bytes, str]:
+        await self.start()
+        self.stats["fetches"] += 1
+        try:
+            async with self._client.stream("GET", url) as resp:
+                if resp.status_code != 200:
+                    raise ImageProxyError(f"Upstream answered {resp.status_code}", 404 if resp.status_code == 404 else 502)
+                content_type = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+                if content_type not in RASTER_TYPES:
+                    raise ImageProxyError(f"Unsupported image type ({content_type or 'unknown'})", 415)
+                chunks, size = [], 0
+                async for chunk in resp.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_source_bytes:
+                        raise ImageProxyError("Image too large", 413)
+                    chunks.append(chunk)
+        except httpx.HTTPError as e:
+            raise ImageProxyError(f"Fetching image failed: {type(e).__name__}", 504 if isinstance(e, httpx.TimeoutException) else 502)
+        return b"".join(chunks), content_type
+
+    def _resize(self, data: bytes, width: int) -> bytes:
+        """Downscale to ``width`` (never upscale) and encode as WebP (runs in a worker thread)."""
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            if img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            out = io.BytesIO()
+            img.save(out, "WEBP", quality=self.webp_quality, method=4)
+            return out.getvalue()
+
+    async def _single_flight(self, key: str, produce) -> CachedImage:
+        """
+        Run ``produce`` once per key for all concurrent callers.
+
+        It runs as a detached task, so a caller that is cancelled (e.g. the
+        client went away) stops waiting without cancelling the download for
+        the others.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(produce())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here if nobody was left waiting
+
+    async def _original(self, url: str) -> CachedImage:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:40]
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry
+
+        async def produce():
+            data, content_type = await self._download(url)
+            etag = hashlib.sha256(data).hexdigest()[:32]
+            entry = await asyncio.to_thread(self._write, key, data, content_type, etag, RASTER_TYPES[content_type])
+            self._remember(key, entry)
+            return entry
+
+        return await self._single_flight(key, produce)
+
+    async def get(self, url: str, width: Optional[int] = None) -> Tuple[CachedImage, bool]:
+        """
+        Return the cached image for ``url`` at ``width`` (snapped), fetching/resizing as needed.
+
+        Returns:
+            (image, cache_hit)
+
+        Raises:
+            ImageProxyError: For disallowed hosts, upstream failures, non-raster and oversize images.
+        """
+        if not host_allowed(url, self.allowed_hosts):
+            raise ImageProxyError("Image host not allowed", 403)
+
+        width = snap_width(width, self.widths) if self.resizing else None
+        key = hashlib.sha256(f"{url}|w={width}".encode("utf-8")).hexdigest()[:40] if width else None
+        if key is not None:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry, True
+
+        orig_key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:40]
+        had_original = orig_key in self._index
+        try:
+            original = await self._original(url)
+        except ImageProxyError:
+            self.stats["errors"] += 1
+            raise
+        if width is None:
+            self.stats["hits" if had_original else "misses"] += 1
+            return original, had_original
+
+        async def produce():
+            data = await asyncio.to_thread(_read, original.path)
+            try:
+                resized = await asyncio.to_thread(self._resize, data, width)
+            except Exception as e:
+                raise ImageProxyError(f"Could not decode image: {e}", 415)
+            self.stats["resizes"] += 1
+            entry = await asyncio.to_thread(
+                self._write, key, resized, "image/webp", f"{original.etag}-w{width}", "webp"
+            )
+            self._remember(key, entry)
+            return entry
+
+        self.stats["misses"] += 1
+        try:
+            return await self._single_flight(key, produce), False
+        except ImageProxyError as e:
+            if e.status_code != 415:
+                raise
+            # Not something Pillow can resize (e.g. AVIF without a plugin): the original is the best we have
+            logger.info("Serving original for %s: %s", url, e)
+            return original, had_original
+
+    async def fetch(self, url: str) -> Tuple[bytes, str]:
+        """The original image's bytes and content type, through the cache."""
+        image, _ = await self.get(url)
+        return await asyncio.to_thread(_read, image.path), image.content_type
+
+    def proxy_url(self, base_url: str, image_url: Optional[str], width: Optional[int] = None) -> Optional[str]:
+        """Proxy URL for ``image_url`` (None when the host is not proxied)."""
+        if not image_url or not host_allowed(image_url, self.allowed_hosts):
+            return None
+        url = f"{(self.base_url or base_url).rstrip('/')}/images?url={quote(image_url, safe='')}"
+        if width:
+            url += f"&w={snap_width(width, self.widths)}"
+        return url
+
+    def add_thumbnails(self, items: List[Any], base_url: str, width: int) -> List[Any]:
+        """Copy items, adding ``thumbnail_url`` (a proxy URL at ``width``) where ``image_url`` is proxied."""
+        out = []
+        for item in items:
+            if isinstance(item, dict):
+                thumbnail = self.proxy_url(base_url, item.get("image_url"), width)
+                if thumbnail:
+                    item = {**item, "thumbnail_url": thumbnail}
+            out.append(item)
+        return out
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"files": len(self._index), "bytes": self._bytes, "resizing": self.resizing, **self.stats}
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
@@ -1,92 +1,84 @@
 """
 MongoDB Database Initialization Script.
-Run this to set up collections and indexes in MongoDB Atlas.
+Run this to set up collections, indexes and retention (TTL) in MongoDB Atlas.
+
+The schema itself is declared in schema.py; the server also applies it at
+startup (SCHEMA_MODE), so this script is for first-time setup and migrations.
 
 Usage:
     cd backend
-    python init_db.py
+    python init_db.py            # create what is missing, report drift
+    python init_db.py --check    # only report differences
 """
 
+import sys
+
 from database import get_database
-from pymongo import ASCENDING, DESCENDING
+from schema import CHECKPOINT_COLLECTIONS, apply_schema, explain_hot_queries, problems
 
 
-def init_database():
+def init_database(fix: bool = True):
     """Initialize MongoDB collections and indexes"""
     print("=" * 50)
     print("MongoDB Database Initialization")
     print("=" * 50)
-    
+
     db = get_database()
-    
+
     if db is None:
         print("\n❌ Failed to connect to MongoDB!")
         print("Check your MONGODB_URI in .env file")
         return False
-    
+
     print(f"\n✅ Connected to database: {db.name}")
-    
+
     # List existing collections
     existing = db.list_collection_names()
     print(f"\nExisting collections: {existing if existing else 'None'}")
-    
-    # Create user_profiles collection with indexes
-    print("\n📁 Setting up 'user_profiles' collection...")
-    try:
-        profiles = db["user_profiles"]
-        
-        # Create unique index on user_id
-        profiles.create_index(
-            [("user_id", ASCENDING)],
-            unique=True,
-            name="user_id_unique"
-        )
-        print("   ✅ Created unique index on 'user_id'")
-        
-        # Create index on email for lookups
-        profiles.create_index(
-            [("email", ASCENDING)],
-            name="email_index"
-        )
-        print("   ✅ Created index on 'email'")
-        
-    except Exception as e:
-        print(f"   ⚠️  Warning: {e}")
-    
-    # Create search_history collection with indexes
-    print("\n📁 Setting up 'search_history' collection...")
-    try:
-        history = db["search_history"]
-        
-        # Create compound index for user_id + timestamp queries
-        history.create_index(
-            [("user_id", ASCENDING), ("timestamp", DESCENDING)],
-            name="user_timestamp_index"
-        )
-        print("   ✅ Created compound index on 'user_id' + 'timestamp'")
-        
-    except Exception as e:
-        print(f"   ⚠️  Warning: {e}")
-    
-    # List final collections
-    final_collections = db.list_collection_names()
-    print(f"\n📋 Final collections: {final_collections}")
-    
+
+    report = apply_schema(db, fix=fix)
+    for name, result in report.items():
+        print(f"\n📁 '{name}'")
+        for item in result["created"]:
+            print(f"   ✅ Created {item}")
+        for item in result["updated"]:
+            print(f"   🔁 Updated {item}")
+        for item in result["drift"]:
+            print(f"   ⚠️  Drift: {item}")
+        if not any(result.values()):
+            print("   ✅ Up to date")
+
     # Show index info
     print("\n📊 Index Information:")
-    for coll_name in ["user_profiles", "search_history"]:
-        if coll_name in final_collections:
-            indexes = list(db[coll_name].list_indexes())
-            print(f"\n   {coll_name}:")
-            for idx in indexes:
-                print(f"      - {idx['name']}: {dict(idx['key'])}")
-    
+    final_collections = db.list_collection_names()
+    for coll_name in [name for name in report if name in final_collections]:
+        print(f"\n   {coll_name}:")
+        for idx in db[coll_name].list_indexes():
+            ttl = f" (TTL {idx['expireAfterSeconds']}s)" if "expireAfterSeconds" in idx else ""
+            print(f"      - {idx['name']}: {dict(idx['key'])}{ttl}")
+
+    # Verify that the hot queries are served by indexes
+    print("\n🔎 Query plans:")
+    queries = explain_hot_queries(db)
+    for name, result in queries.items():
+        ok = result.get("index_supported") and not result.get("in_memory_sort")
+        print(f"   {'✅' if ok else '⚠️ '} {name}: {result.get('plan', result.get('error'))}")
+
+    issues = problems(report, queries)
+    checkpoint_names = {spec.name for spec in CHECKPOINT_COLLECTIONS}
+    if checkpoint_names & set(final_collections):
+        issues += problems(apply_schema(db, CHECKPOINT_COLLECTIONS, fix=fix))
+
     print("\n" + "=" * 50)
-    print("✅ Database initialization complete!")
+    if issues:
+        print(f"⚠️  Database initialized with {len(issues)} issue(s) to review")
+    else:
+        print("✅ Database initialization complete!")
     print("=" * 50)
-    
-    return True
+
+    return not issues
 
 
 if __name__ == "__main__":
-    init_database()
+    ok = init_database(fix="--check" not in sys.argv[1:])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,216 @@
+"""
+In-process async job runner for long-running requests.
+
+A job is submitted with an async work function and returns an ID at once. A
+fixed pool of worker tasks runs queued jobs; the work function publishes partial
+results with ``job.publish(...)`` as they become available, and clients follow
+progress by polling (``job.to_dict()``) or streaming (``job.events()``, used for
+Server-Sent Events).
+
+Jobs are owned by the runner, not the request that created them, so they keep
+running when the client disconnects. Finished jobs are garbage-collected after
+a TTL.
+
+Configuration (environment):
+    JOB_WORKERS       Jobs run at once (default 4)
+    JOB_TTL           Seconds a finished job is kept for polling (default 900)
+    JOB_MAX_PENDING   Queued jobs before submit() refuses new work (default 1000)
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app_logging import get_logger, request_id_var
+
+logger = get_logger(__name__)
+
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobQueueFull(Exception):
+    """The runner's queue is at JOB_MAX_PENDING."""
+
+
+@dataclass
+class Job:
+    """A unit of background work and everything published about it so far."""
+    id: str
+    kind: str
+    total: Optional[int] = None
+    status: str = PENDING
+    results: List[Any] = field(default_factory=list)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    request_id: str = "-"
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def publish(self, result: Any) -> None:
+        """Append a partial result and wake anyone following the job."""
+        self.results.append(result)
+        self._notify()
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        if status in FINISHED:
+            self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self) -> None:
+        # Swap in a fresh event so waiters see every change exactly once
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "completed": len(self.results),
+            "results": list(self.results),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def events(self, heartbeat: float = 15.0) -> AsyncIterator[str]:
+        """
+        Yield the job's progress as Server-Sent Events.
+
+        Emits one ``result`` event per published result (including those published
+        before the stream was opened), a ``status`` event on each status change,
+        and a final ``done`` event. Comment lines are sent as heartbeats.
+        """
+        sent = 0
+        last_status = None
+        while True:
+            changed = self._changed
+            while sent < len(self.results):
+                yield _sse("result", self.results[sent])
+                sent += 1
+            if self.status != last_status:
+                last_status = self.status
+                yield _sse("status", {"status": self.status, "completed": sent, "total": self.total})
+            if self.done:
+                yield _sse("done", self.to_dict())
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+JobWork = Callable[[Job], Awaitable[None]]
+
+
+class JobRunner:
+    """Bounded pool of worker tasks draining a queue of jobs."""
+
+    def __init__(self, workers: int = 4, ttl: float = 900, max_pending: int = 1000):
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls) -> "JobRunner":
+        return cls(
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            ttl=float(os.getenv("JOB_TTL", "900")),
+            max_pending=int(os.getenv("JOB_MAX_PENDING", "1000")),
+        )
+
+    def start(self) -> None:
+        """Start the workers and the garbage collector on the running loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._collect_garbage()))
+
+    async def stop(self) -> None:
+        """Cancel workers; jobs still queued or running are marked failed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self.jobs.values():
+            if not job.done:
+                job._set_status(FAILED, "Server shutting down")
+
+    def submit(self, kind: str, work: JobWork, total: Optional[int] = None) -> Job:
+        """
+        Queue ``work`` as a new job and return it immediately.
+
+        Args:
+            kind: Label for the job type (e.g. "checkout").
+            work: Coroutine function taking the Job; it publishes results via job.publish().
+            total: Expected number of results, if known (reported to clients).
+
+        Raises:
+            JobQueueFull: If JOB_MAX_PENDING jobs are already waiting.
+        """
+        if not self._tasks:
+            self.start()
+        job = Job(id=uuid.uuid4().hex, kind=kind, total=total, request_id=request_id_var.get())
+        try:
+            self._queue.put_nowait((job, work))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"{self.max_pending} jobs already pending")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job, work = await self._queue.get()
+            token = request_id_var.set(job.request_id)
+            job._set_status(RUNNING)
+            try:
+                await work(job)
+                job._set_status(SUCCEEDED)
+            except asyncio.CancelledError:
+                job._set_status(FAILED, "Cancelled")
+                raise
+            except Exception as e:
+                logger.error("Job %s (%s) failed: %s", job.id, job.kind, e)
+                job._set_status(FAILED, str(e))
+            finally:
+                request_id_var.reset(token)
+                self._queue.task_done()
+
+    async def _collect_garbage(self) -> None:
+        interval = max(1.0, min(60.0, self.ttl / 4))
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.time() - self.ttl
+            expired = [job_id for job_id, job in self.jobs.items() if job.done and job.finished_at < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+            if expired:
+                logger.debug("Collected %d finished jobs", len(expired))
@@ -0,0 +1,350 @@
+"""
+Content-addressed completion cache for the agent's chat model.
+
+The agent runs Groq at temperature 0, so an identical message list sent to the
+same model with the same bound tools produces (effectively) the same answer.
+This module wraps the bound model so those repeated calls are answered locally.
+
+Keys are a SHA-256 over:
+- the canonicalized message list (role, content, tool calls, tool call ids).
+  Searches run on a long-lived per-user thread, so for the search profile only
+  the current turn is keyed in full, plus a digest of the last
+  LLM_CACHE_SEARCH_HISTORY_TURNS earlier queries; a repeated search can then
+  hit even though the thread has grown since
+- the bound tool schemas and any other binding kwargs
+- the underlying model parameters (model name, temperature, max_tokens, ...)
+
+Two tiers are used:
+- an in-process LRU (always on unless the size is 0)
+- an optional SQLite file, which survives restarts and lets benchmarks replay
+  agent runs deterministically
+
+Configuration (environment):
+    LLM_CACHE_SIZE  Max entries in the memory tier (default 256, 0 disables caching)
+    LLM_CACHE_DB    Path to a SQLite file for the persistent tier (optional)
+    LLM_CACHE_SEARCH_HISTORY_TURNS  Earlier queries in a search thread that count toward
+                    the key (default 0: search prompts carry their own user context)
+
+Lookups are counted by outcome in ``llm_cache_total`` (GET /metrics).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from metrics import LLM_CACHE_TOTAL
+
+
+# response_metadata key marking replies answered from the cache (no tokens spent)
+LLM_CACHE_METADATA_KEY = "llm_cache"
+
+SEARCH_HISTORY_TURNS = int(os.getenv("LLM_CACHE_SEARCH_HISTORY_TURNS", "0"))
+
+# stats key -> LLM_CACHE_TOTAL outcome label
+OUTCOME_LABELS = {
+    "memory_hits": "memory_hit",
+    "disk_hits": "disk_hit",
+    "misses": "miss",
+    "coalesced": "coalesced",
+    "stores": "store",
+}
+
+
+def _canonical_message(message: BaseMessage) -> Dict[str, Any]:
+    """
+    Reduce a message to the fields that influence the model's answer.
+
+    Message ids, response metadata and token usage differ between otherwise
+    identical conversations, so they are left out of the key.
+    """
+    canonical = {
+        "type": message.type,
+        "content": message.content,
+    }
+    if getattr(message, "name", None):
+        canonical["name"] = message.name
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        canonical["tool_calls"] = [
+            {"name": tc["name"], "args": tc["args"], "id": tc.get("id")}
+            for tc in tool_calls
+        ]
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id:
+        canonical["tool_call_id"] = tool_call_id
+    return canonical
+
+
+def _renumber_tool_calls(canonical: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace tool call ids by their order of appearance.
+
+    Ids are random (replayed plans and cache hits get fresh ones) and don't
+    influence the answer; only which result belongs to which call does.
+    """
+    numbers: Dict[str, str] = {}
+
+    def number(call_id: Any) -> str:
+        return numbers.setdefault(str(call_id), f"call_{len(numbers)}")
+
+    for message in canonical:
+        for call in message.get("tool_calls", []):
+            call["id"] = number(call["id"])
+        if "tool_call_id" in message:
+            message["tool_call_id"] = number(message["tool_call_id"])
+    return canonical
+
+
+def _fresh_tool_call_ids(message: BaseMessage) -> None:
+    """Give a cached reply's tool calls new ids, so a thread never holds the same id twice."""
+    renamed = {}
+    for call in getattr(message, "tool_calls", None) or []:
+        new_id = f"call_{uuid.uuid4().hex[:24]}"
+        renamed[call["id"]] = new_id
+        call["id"] = new_id
+    for call in message.additional_kwargs.get("tool_calls", []):
+        if call.get("id") in renamed:
+            call["id"] = renamed[call["id"]]
+
+
+def model_fingerprint(model: Any) -> str:
+    """
+    Describe a (possibly tool-bound) chat model as a stable JSON string.
+
+    For a binding created by ``bind_tools`` this includes the tool schemas and
+    the parameters of the wrapped model.
+    """
+    binding_kwargs = getattr(model, "kwargs", None) or {}
+    inner = getattr(model, "bound", model)
+    params = getattr(inner, "_default_params", None) or getattr(inner, "_identifying_params", {})
+    return json.dumps(
+        {
+            "model": type(inner).__name__,
+            "params": params,
+            "binding": binding_kwargs,
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+def completion_key(messages: List[BaseMessage], fingerprint: str, history_turns: Optional[int] = None) -> str:
+    """
+    Compute the content address for a model call.
+
+    Args:
+        messages: The message list sent to the model.
+        fingerprint: ``model_fingerprint`` of the bound model.
+        history_turns: None keys on the whole list. Otherwise the current turn
+            (its system prompt and human message onwards) is keyed in full, and
+            of the earlier conversation only the last ``history_turns`` human
+            messages are folded in, as a digest.
+    """
+    keyed, context = messages, []
+    if history_turns is not None:
+        start = max((i for i, m in enumerate(messages) if m.type == "human"), default=0)
+        # The turn's own system prompt is sent right before its human message
+        while start > 0 and messages[start - 1].type == "system":
+            start -= 1
+        keyed = messages[start:]
+        earlier = [m for m in messages[:start] if m.type == "human"]
+        context = earlier[-history_turns:] if history_turns > 0 else []
+    history = json.dumps([_canonical_message(m) for m in context], sort_keys=True, default=str)
+    payload = json.dumps(
+        {
+            "model": fingerprint,
+            "messages": _renumber_tool_calls([_canonical_message(m) for m in keyed]),
+            "history": hashlib.sha256(history.encode("utf-8")).hexdigest(),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    Two-tier (memory LRU + optional SQLite) store of serialized model responses.
+    """
+
+    def __init__(self, max_entries: int = 256, db_path: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries kept in memory.
+            db_path: Optional path to a SQLite database for the persistent tier.
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._memory: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "stores": 0}
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY,"
+                " message TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["CompletionCache"]:
+        """Build a cache from LLM_CACHE_SIZE / LLM_CACHE_DB, or None if disabled."""
+        max_entries = int(os.getenv("LLM_CACHE_SIZE", "256"))
+        if max_entries <= 0:
+            return None
+        return cls(max_entries=max_entries, db_path=os.getenv("LLM_CACHE_DB") or None)
+
+    def count(self, stat: str) -> None:
+        """Bump a stats counter and its LLM_CACHE_TOTAL outcome."""
+        self.stats[stat] += 1
+        LLM_CACHE_TOTAL.labels(OUTCOME_LABELS[stat]).inc()
+
+    def _remember(self, key: str, serialized: Dict[str, Any]) -> None:
+        self._memory[key] = serialized
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT message FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _db_put(self, key: str, serialized: Dict[str, Any]) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, message, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(serialized), time.time()),
+            )
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[BaseMessage]:
+        """
+        Look up a cached response.
+
+        Returns:
+            A fresh copy of the cached message, or None on a miss.
+        """
+        serialized = self._memory.get(key)
+        if serialized is not None:
+            self._memory.move_to_end(key)
+            self.count("memory_hits")
+        elif self._db is not None:
+            serialized = await asyncio.to_thread(self._db_get, key)
+            if serialized is not None:
+                self._remember(key, serialized)
+                self.count("disk_hits")
+
+        if serialized is None:
+            self.count("misses")
+            return None
+
+        # A new id makes add_messages append the reply instead of replacing
+        # an earlier copy of the same message in the thread.
+        message = messages_from_dict([serialized])[0]
+        message.id = None
+        _fresh_tool_call_ids(message)
+        message.response_metadata = {**message.response_metadata, LLM_CACHE_METADATA_KEY: "hit"}
+        return message
+
+    async def put(self, key: str, message: BaseMessage) -> None:
+        """Store a model response under its content address."""
+        serialized = message_to_dict(message)
+        self._remember(key, serialized)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, key, serialized)
+        self.count("stores")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current hit ratio."""
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "entries": len(self._memory),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """Close the SQLite tier, if any."""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+class CachedChatModel:
+    """
+    Wraps a (tool-bound) chat model and answers repeated calls from a CompletionCache.
+
+    Only ``ainvoke`` is intercepted - it is the sole entry point used by the agent
+    graph. Concurrent identical calls share a single upstream request.
+    """
+
+    def __init__(self, model: Any, cache: CompletionCache, history_turns: Optional[int] = None):
+        """
+        Args:
+            model: The model (usually the result of ``bind_tools``) to wrap.
+            cache: The completion cache to read from and write to.
+            history_turns: Earlier human turns that count toward the key (see
+                ``completion_key``; None = the whole conversation).
+        """
+        self.model = model
+        self.cache = cache
+        self.history_turns = history_turns
+        self.fingerprint = model_fingerprint(model)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def ainvoke(self, messages: List[BaseMessage], config: Any = None, **kwargs) -> BaseMessage:
+        """Return the cached response for ``messages`` or call the wrapped model."""
+        key = completion_key(messages, self.fingerprint, self.history_turns)
+
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.cache.count("coalesced")
+            response = await asyncio.shield(task)
+            return response.model_copy(update={"id": None})
+
+        # The call runs detached so cancelling this caller (a timeout, a preempted
+        # prefetch) doesn't cancel it for concurrent identical calls
+        task = asyncio.create_task(self._call(key, messages, config, **kwargs))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    async def _call(self, key: str, messages: List[BaseMessage], config: Any, **kwargs) -> BaseMessage:
+        response = await self.model.ainvoke(messages, config, **kwargs)
+        await self.cache.put(key, response)
+        return response
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when nobody was left waiting on it
+            task.exception()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
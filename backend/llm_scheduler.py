@@ -0,0 +1,115 @@
+"""
+Concurrency limit for chat model calls, with interactive traffic first.
+
+Every agent step that calls the LLM takes a slot from ``LLMScheduler``. When
+all slots are busy, waiters are served by priority (lower first) and then in
+arrival order, so a large ``/search/batch`` queued behind the limit does not
+delay the next interactive ``/search``.
+
+Calls below PREFETCH priority count as foreground traffic; ``foreground_idle``
+tells speculative work (prefetch.py) whether it may use the model right now.
+
+Configuration (environment):
+    LLM_MAX_CONCURRENCY    Concurrent chat model calls (default 0 = unlimited)
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+
+INTERACTIVE = 0
+BATCH = 10
+PREFETCH = 20
+
+
+class LLMScheduler:
+    """Priority-ordered semaphore around chat model calls."""
+
+    def __init__(self, max_concurrency: int = 0):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.foreground_active = 0
+        self.last_foreground = 0.0
+        self.stats = {"calls": 0, "queued": 0}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "0")))
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _wake_next(self) -> None:
+        while self._waiters and self.active < self.max_concurrency:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        """
+        Hold one LLM slot for the duration of the block.
+
+        Args:
+            priority: INTERACTIVE (0), BATCH (10) or PREFETCH (20); lower values are served first.
+        """
+        self.stats["calls"] += 1
+        foreground = priority < PREFETCH
+        if foreground:
+            self.foreground_active += 1
+            self.last_foreground = time.monotonic()
+        try:
+            async with self._limited(priority):
+                yield
+        finally:
+            if foreground:
+                self.foreground_active -= 1
+                self.last_foreground = time.monotonic()
+
+    def foreground_idle(self, quiet_for: float = 0.0) -> bool:
+        """True if no foreground call is running or queued, and none ended in the last ``quiet_for`` seconds."""
+        return self.foreground_active == 0 and time.monotonic() - self.last_foreground >= quiet_for
+
+    @asynccontextmanager
+    async def _limited(self, priority: int):
+        if not self.max_concurrency:
+            yield
+            return
+
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+        else:
+            self.stats["queued"] += 1
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._counter), fut))
+            try:
+                await fut
+            except asyncio.CancelledError:
+                # Granted just as we were cancelled: hand the slot on
+                if fut.done() and not fut.cancelled():
+                    self.active -= 1
+                    self._wake_next()
+                raise
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._wake_next()
+
+    def status(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "foreground_active": self.foreground_active,
+            **self.stats,
+        }
@@ -9,8 +9,8 @@ Prerequisites:
 """
 
 import asyncio
-import os, sys
-from typing import Annotated, TypedDict, Literal, Optional
+import os
+from typing import Annotated, Awaitable, Callable, TypedDict, Literal, Optional
 from dotenv import load_dotenv
 
 
@@ -19,16 +19,36 @@ from langchain_groq import ChatGroq
 
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage, BaseMessage
 from langchain_core.tools import tool, StructuredTool
+from langchain_core.runnables import RunnableConfig
+from langchain_core.language_models import BaseChatModel
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
-
-from mcp_multi_client import MCPMultiClient
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from mcp_multi_client import MCPMultiClient, is_auth_error
+from llm_cache import CompletionCache, CachedChatModel, LLM_CACHE_METADATA_KEY, SEARCH_HISTORY_TURNS
+from llm_scheduler import LLMScheduler, INTERACTIVE
+from plan_cache import PlanCache, PLAN_CACHE_METADATA_KEY
+from checkpointers import DeltaCheckpointSaver, create_checkpointer
+from tool_cache import ToolResultCache
+from tool_reducers import reduce_tool_output, CHARS_PER_TOKEN
+from metrics import LLM_REQUEST_SECONDS, MCP_TOOL_SECONDS, MCP_TOOL_ERRORS_TOTAL
+from app_logging import configure_logging, get_logger, Truncated, sample_payload
+from tool_profiles import (
+    TOOL_PROFILES,
+    DEFAULT_PROFILE,
+    INJECTED_DEFAULTS,
+    compact_schema,
+    compact_tool_description,
+    tools_for_profile,
+)
 
 # Load environment variables
 load_dotenv()
 
+logger = get_logger(__name__)
+
 
 class AgentState(TypedDict):
     """State for the agent graph."""
@@ -40,46 +60,81 @@ class MCPLangGraphAgent:
     A LangGraph agent that integrates with MCP servers via the MCPMultiClient.
     """
 
-    def __init__(self, config_path: str = "servers_config.json"):
+    def __init__(
+        self,
+        config_path: str = "servers_config.json",
+        model: BaseChatModel | None = None,
+        on_auth_error: Callable[[str], Awaitable[bool]] | None = None,
+    ):
         """
         Initialize the agent.
 
         Args:
             config_path: Path to the MCP servers configuration file.
+            model: Optional chat model to use instead of Groq (e.g. a fake for benchmarks).
+            on_auth_error: Credential refresher handed to MCPMultiClient; rejected tool
+                calls are retried on a rebuilt session when it returns True.
         """
         self.config_path = config_path
+        self.base_model = model
+        self.on_auth_error = on_auth_error
         self.mcp_client: MCPMultiClient | None = None
         self.tools: list[StructuredTool] = []
         self.model = None
+        self.models: dict = {}  # Maps tool profile -> bound model
+        self.llm_cache: CompletionCache | None = None
+        self.llm_scheduler = LLMScheduler.from_env()
+        self.plan_cache = PlanCache.from_env()
+        self.tool_cache = ToolResultCache.from_env()
+        self.checkpointer: Optional[BaseCheckpointSaver] = None
         self.graph = None
 
     async def initialize(self) -> None:
         """Initialize the MCP client and build the agent graph."""
         # Initialize MCP client
-        self.mcp_client = MCPMultiClient(self.config_path)
+        self.mcp_client = MCPMultiClient(self.config_path, on_auth_error=self.on_auth_error)
         await self.mcp_client.connect()
 
         # Convert MCP tools to LangChain tools
         # 2. Convert MCP tools to LangChain tools
         await self._create_langchain_tools()
 
-        # Initialize Groq (Llama 3.1 8B for speed and TPM limits)
-        self.model = ChatGroq(
-            model="llama-3.1-8b-instant",
-            api_key=os.getenv("GROQ_API_KEY"),
-            temperature=0,
-            max_tokens=8000,
-        )
-        # Bind tools to the model
-        if self.tools:
-            self.model = self.model.bind_tools(self.tools)
+        base_model = self.base_model or self._create_model()
+
+        # Answer repeated identical calls from the completion cache
+        self.llm_cache = CompletionCache.from_env()
+
+        # Bind one model per tool profile so each route only pays for its own tools
+        for profile in TOOL_PROFILES:
+            profile_tools = tools_for_profile(self.tools, profile)
+            model = base_model.bind_tools(profile_tools) if profile_tools else base_model
+            if self.llm_cache:
+                # Search threads are long-lived, but each search prompt stands on its own
+                history_turns = SEARCH_HISTORY_TURNS if profile == "search" else None
+                model = CachedChatModel(model, self.llm_cache, history_turns)
+            self.models[profile] = model
+        self.model = self.models[DEFAULT_PROFILE]
 
         # Build the graph
         self._build_graph()
 
-        print(f"Agent initialized with {len(self.tools)} tools from MCP servers")
+        logger.info("Agent initialized with %d tools from MCP servers", len(self.tools))
+
 
 
+    def _create_model(self) -> BaseChatModel:
+        """Create the chat model. AGENT_LLM=fake selects the offline benchmark model."""
+        if os.getenv("AGENT_LLM") == "fake":
+            from benchmarks.fake_llm import FakeShoppingChatModel
+            return FakeShoppingChatModel()
+
+        # Initialize Groq (Llama 3.1 8B for speed and TPM limits)
+        return ChatGroq(
+            model="llama-3.1-8b-instant",
+            api_key=os.getenv("GROQ_API_KEY"),
+            temperature=0,
+            max_tokens=8000,
+        )
 
     async def _create_langchain_tools(self) -> None:
         """Convert MCP tools to LangChain StructuredTools with corrected Pydantic schemas."""
@@ -94,10 +149,28 @@ class MCPLangGraphAgent:
             input_schema = mcp_tool.get("input_schema", {})
             
             # 1. Create a Pydantic model to enforce strict types (Fixes the "missing items" error)
-            args_schema, field_mapping = self._create_pydantic_model(tool_name, input_schema)
+            #    from the compacted schema, which is what gets bound to the model
+            args_schema, field_mapping = self._create_pydantic_model(
+                tool_name, compact_schema(tool_name, input_schema)
+            )
 
             # 2. Create the execution closure
-            def create_tool_func(name: str, mapping: dict):
+            def create_tool_func(name: str, mapping: dict, input_schema: dict):
+                call_timer = MCP_TOOL_SECONDS.labels(name)
+                call_errors = MCP_TOOL_ERRORS_TOTAL.labels(name)
+
+                async def call_server(final_args: dict):
+                    """Send the call to the MCP server, recording latency and errors."""
+                    try:
+                        with call_timer.time():
+                            result = await self.mcp_client.call_tool(name, final_args)
+                    except Exception:
+                        call_errors.inc()
+                        raise
+                    if getattr(result, "isError", False):
+                        call_errors.inc()
+                    return result
+
                 async def tool_func(**kwargs) -> str:
                     """Execute the MCP tool with structured arguments."""
                     try:
@@ -108,25 +181,26 @@ class MCPLangGraphAgent:
                             final_args[original_key] = v
                             
                         # Auto-inject defaults for robustness (Shopify server is strict)
-                        if "context" not in final_args and "context" in input_schema.get("properties", {}):
-                            final_args["context"] = "User search request"
-                        
-                        if "shop_ids" not in final_args and "shop_ids" in input_schema.get("properties", {}):
-                            final_args["shop_ids"] = []
-
-                        if "product_ids" not in final_args and "product_ids" in input_schema.get("properties", {}):
-                            final_args["product_ids"] = []
+                        for key, default in INJECTED_DEFAULTS.items():
+                            if final_args.get(key) is None and key in input_schema.get("properties", {}):
+                                final_args[key] = list(default) if isinstance(default, list) else default
                             
                         # Remove None values (clean up optional args)
                         final_args = {k: v for k, v in final_args.items() if v is not None}
                         
-                        # Execute tool
-                        result = await self.mcp_client.call_tool(name, final_args)
-                        print(result)
+                        # Execute tool (repeated calls are served from the result cache)
+                        result = await self.tool_cache.get_or_call(
+                            name,
+                            final_args,
+                            lambda: call_server(final_args),
+                        )
+                        logger.debug("Tool %s returned %s", name, Truncated(result))
                         
-                        if result.content[0].text == "You are not authorized to use this tool":
-                            print("Shopify hates you (get new token)")
-                            sys.exit(1)
+                        if is_auth_error(result):
+                            # The client already refreshed credentials and retried once
+                            self.tool_cache.invalidate(name, final_args)
+                            logger.error("Tool %s still unauthorized after refreshing credentials", name)
+                            return f"Error calling tool {name}: catalog authorization failed, try again shortly"
                         
                         # Handle result content
                         if hasattr(result, 'content') and result.content:
@@ -136,7 +210,8 @@ class MCPLangGraphAgent:
                                     contents.append(item.text)
                                 else:
                                     contents.append(str(item))
-                            return "\n".join(contents)
+                            # Keep only the fields the prompt asks for
+                            return reduce_tool_output(name, "\n".join(contents), final_args)
                         return str(result)
                     except Exception as e:
                         return f"Error calling tool {name}: {str(e)}"
@@ -145,9 +220,9 @@ class MCPLangGraphAgent:
             # 3. Create a StructuredTool (Gemini prefers this over simple Tools)
             langchain_tool = StructuredTool.from_function(
                 func=lambda **x: None,  # Dummy sync function
-                coroutine=create_tool_func(tool_name, field_mapping),
+                coroutine=create_tool_func(tool_name, field_mapping, input_schema),
                 name=tool_name,
-                description=raw_description,
+                description=compact_tool_description(raw_description),
                 args_schema=args_schema  # This applies the fix
             )
             
@@ -239,17 +314,33 @@ class MCPLangGraphAgent:
 
     def _build_graph(self) -> None:
         """Build the LangGraph agent graph."""
-        print("Build the LangGraph agent graph.")
+        logger.info("Build the LangGraph agent graph.")
+
+        # Pre-bound latency histograms, one per tool profile
+        llm_timers = {profile: LLM_REQUEST_SECONDS.labels(profile) for profile in TOOL_PROFILES}
 
         # Define the agent node
-        async def agent_node(state: AgentState) -> dict:
+        async def agent_node(state: AgentState, config: RunnableConfig) -> dict:
             """The agent decides what to do based on the current state."""
             import json
             import uuid
     
-            print("graph.ainvoke")
             messages = state["messages"]
-            response = await self.model.ainvoke(messages)
+            # Use the model bound to the caller's tool profile
+            configurable = config.get("configurable", {})
+            profile = configurable.get("tool_profile", DEFAULT_PROFILE)
+            model = self.models.get(profile, self.model)
+
+            # First turn of a known query: replay the trusted tool plan instead of asking the model
+            if self.plan_cache and isinstance(messages[-1], HumanMessage):
+                planned = self.plan_cache.lookup(profile, messages[-1].content)
+                if planned is not None:
+                    return {"messages": [planned]}
+
+            # Batch work waits behind interactive requests when LLM_MAX_CONCURRENCY is set
+            async with self.llm_scheduler.slot(configurable.get("llm_priority", INTERACTIVE)):
+                with llm_timers.get(profile, llm_timers[DEFAULT_PROFILE]).time():
+                    response = await model.ainvoke(messages)
             
 
 
@@ -260,14 +351,7 @@ class MCPLangGraphAgent:
             """Determine if we should continue to tools or end."""
             messages = state["messages"]
             last_message = messages[-1]
-            
-            print()
-            print()
-            print()
-            # print(messages[-1])
-            print()
-            print()
-            print()
+
 
             # If the LLM made a tool call, route to tools
             if hasattr(last_message, "tool_calls") and last_message.tool_calls:
@@ -301,22 +385,37 @@ class MCPLangGraphAgent:
         # Set entry point
         workflow.set_entry_point("agent")
 
-        # Compile with memory checkpointer
-        memory = MemorySaver()
-        self.graph = workflow.compile(checkpointer=memory)
-
-    async def chat(self, message: str, thread_id: str = "default") -> str:
+        # Compile with the configured checkpointer (AGENT_CHECKPOINTER; in-memory by default)
+        if self.checkpointer is None:
+            self.checkpointer = create_checkpointer()
+        self.graph = workflow.compile(checkpointer=self.checkpointer)
+
+    async def chat(
+        self,
+        message: str,
+        thread_id: str = "default",
+        tool_profile: str = DEFAULT_PROFILE,
+        priority: int = INTERACTIVE,
+        tool_calls: list | None = None,
+        usage: dict | None = None,
+    ) -> str:
         """
         Send a message to the agent and get a response.
 
         Args:
             message: The user's message.
             thread_id: Thread ID for conversation memory.
+            tool_profile: Which tool profile (see tool_profiles.TOOL_PROFILES) to bind.
+            priority: LLM scheduling priority (llm_scheduler.INTERACTIVE or BATCH).
+            tool_calls: If given, the tool calls made during this run ({"name", "args"})
+                are appended to it.
+            usage: If given, "llm_calls" and "tokens" for this run are added to it (tokens
+                are estimated from message sizes when the model reports no usage).
 
         Returns:
             The agent's response.
         """
-        config = {"configurable": {"thread_id": thread_id}}
+        config = {"configurable": {"thread_id": thread_id, "tool_profile": tool_profile, "llm_priority": priority}}
         
         system_prompt = (
             "You are a helpful shopping assistant with access to Shopify's global product catalog. "
@@ -333,12 +432,32 @@ class MCPLangGraphAgent:
             "**DO NOT INCLUDE CONVERSATIONAL TEXT, ONLY INCLUDE THE JSON**"
         )
        
-        print("INVOKING")
         result = await self.graph.ainvoke(
             {"messages": [SystemMessage(content=system_prompt), HumanMessage(content=message)]},
             config=config
         )
-        print(result)
+        logger.debug("Agent run on %s finished with %d messages", thread_id, len(result["messages"]))
+        if self.plan_cache:
+            self.plan_cache.observe(tool_profile, message, result["messages"])
+        if tool_calls is not None or usage is not None:
+            messages = result["messages"]
+            start = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+            for i in range(start, len(messages)):
+                msg = messages[i]
+                if not isinstance(msg, AIMessage):
+                    continue
+                if tool_calls is not None:
+                    tool_calls.extend({"name": tc["name"], "args": tc["args"]} for tc in msg.tool_calls)
+                answered_locally = any(msg.response_metadata.get(k) for k in (PLAN_CACHE_METADATA_KEY, LLM_CACHE_METADATA_KEY))
+                if usage is not None and not answered_locally:
+                    reported = (msg.usage_metadata or {}).get("total_tokens")
+                    if reported is None:
+                        chars = sum(len(str(m.content)) for m in messages[:i + 1])
+                        reported = chars // CHARS_PER_TOKEN
+                    usage["llm_calls"] = usage.get("llm_calls", 0) + 1
+                    usage["tokens"] = usage.get("tokens", 0) + reported
+        if sample_payload():
+            logger.debug("Agent state: %s", result)
 
         # Get the last AI message
         for msg in reversed(result["messages"]):
@@ -351,10 +470,15 @@ class MCPLangGraphAgent:
         """Clean up resources."""
         if self.mcp_client:
             await self.mcp_client.cleanup()
+        if self.llm_cache:
+            self.llm_cache.close()
+        if isinstance(self.checkpointer, DeltaCheckpointSaver):
+            self.checkpointer.close()
 
 
 async def main():
     """Main function to run the agent interactively."""
+    configure_logging()
     agent = MCPLangGraphAgent("servers_config.json")
 
     try:
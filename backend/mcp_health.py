@@ -0,0 +1,207 @@
+"""
+Per-server health tracking for MCP tool calls.
+
+``ServerHealth`` keeps, for each MCP server:
+- an EWMA of call latency and of the error rate
+- a window of recent latencies (for the p95 that triggers hedged requests)
+- a circuit breaker: after too many consecutive failures, or a high error rate,
+  the breaker opens and calls fail fast with ``CircuitOpenError`` for a cooldown;
+  then a single probe call is let through (half-open) and its outcome closes or
+  re-opens the breaker
+
+Timeouts count as failures. Tool-level error results (``isError``) do not, since
+they usually mean bad arguments rather than an unhealthy server.
+
+Configuration (environment):
+    MCP_CALL_TIMEOUT               Default per-call timeout in seconds (default 20)
+    MCP_TOOL_TIMEOUTS              JSON object of per-tool timeouts, e.g. {"search_global_products": 10}
+    MCP_BREAKER_FAILURES           Consecutive failures that open the breaker (default 5)
+    MCP_BREAKER_ERROR_RATE         EWMA error rate that opens the breaker (default 0.5)
+    MCP_BREAKER_MIN_CALLS          Calls needed before the error rate is trusted (default 20)
+    MCP_BREAKER_COOLDOWN           Seconds the breaker stays open before probing (default 30)
+    MCP_HEDGE                      1 to send a second, hedged request when a call runs past p95 (default 0)
+    MCP_HEDGE_TOOLS                Comma-separated read-only tools that may be hedged
+                                   (default search_global_products,get_global_product_details)
+    MCP_HEDGE_MIN_SAMPLES          Latency samples needed before hedging (default 20)
+    MCP_HEDGE_MIN_DELAY            Never hedge earlier than this many seconds (default 0.2)
+"""
+
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from metrics import MCP_BREAKER_STATE, MCP_SERVER_LATENCY_EWMA, MCP_SERVER_ERROR_RATE
+
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Numeric encoding for the breaker-state gauge
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+EWMA_ALPHA = 0.2
+LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(ConnectionError):
+    """The server's circuit breaker is open; the call was not sent."""
+
+
+class HealthConfig:
+    """Timeouts, breaker thresholds and hedging settings (see module docstring)."""
+
+    def __init__(
+        self,
+        call_timeout: float = 20,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        breaker_failures: int = 5,
+        breaker_error_rate: float = 0.5,
+        breaker_min_calls: int = 20,
+        breaker_cooldown: float = 30,
+        hedge: bool = False,
+        hedge_tools: tuple = ("search_global_products", "get_global_product_details"),
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.2,
+    ):
+        self.call_timeout = call_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.breaker_failures = breaker_failures
+        self.breaker_error_rate = breaker_error_rate
+        self.breaker_min_calls = breaker_min_calls
+        self.breaker_cooldown = breaker_cooldown
+        self.hedge = hedge
+        self.hedge_tools = tuple(hedge_tools)
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+
+    @classmethod
+    def from_env(cls) -> "HealthConfig":
+        hedge_tools = os.getenv("MCP_HEDGE_TOOLS", "search_global_products,get_global_product_details")
+        return cls(
+            call_timeout=float(os.getenv("MCP_CALL_TIMEOUT", "20")),
+            tool_timeouts={k: float(v) for k, v in json.loads(os.getenv("MCP_TOOL_TIMEOUTS", "{}")).items()},
+            breaker_failures=int(os.getenv("MCP_BREAKER_FAILURES", "5")),
+            breaker_error_rate=float(os.getenv("MCP_BREAKER_ERROR_RATE", "0.5")),
+            breaker_min_calls=int(os.getenv("MCP_BREAKER_MIN_CALLS", "20")),
+            breaker_cooldown=float(os.getenv("MCP_BREAKER_COOLDOWN", "30")),
+            hedge=os.getenv("MCP_HEDGE", "0") == "1",
+            hedge_tools=tuple(t.strip() for t in hedge_tools.split(",") if t.strip()),
+            hedge_min_samples=int(os.getenv("MCP_HEDGE_MIN_SAMPLES", "20")),
+            hedge_min_delay=float(os.getenv("MCP_HEDGE_MIN_DELAY", "0.2")),
+        )
+
+    def timeout_for(self, tool_name: str) -> float:
+        return self.tool_timeouts.get(tool_name, self.call_timeout)
+
+    def may_hedge(self, tool_name: str) -> bool:
+        return self.hedge and tool_name in self.hedge_tools
+
+
+class ServerHealth:
+    """Latency/error statistics and circuit breaker for one MCP server."""
+
+    def __init__(self, server_name: str, config: HealthConfig):
+        self.server_name = server_name
+        self.config = config
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+        self._latency_gauge = MCP_SERVER_LATENCY_EWMA.labels(server_name)
+        self._error_gauge = MCP_SERVER_ERROR_RATE.labels(server_name)
+        self._state_gauge = MCP_BREAKER_STATE.labels(server_name)
+        self._state_gauge.set(BREAKER_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._state_gauge.set(BREAKER_STATE_VALUES[state])
+
+    def before_call(self) -> None:
+        """
+        Admit or reject a call according to the breaker.
+
+        Raises:
+            CircuitOpenError: If the breaker is open (or half-open with a probe already running).
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.config.breaker_cooldown:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for MCP server '{self.server_name}'")
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit half-open for MCP server '{self.server_name}' (probe running)")
+            self._probe_in_flight = True
+
+    def record(self, latency: float, ok: bool, timed_out: bool = False) -> None:
+        """Record the outcome of an admitted call and update the breaker."""
+        self.calls += 1
+        self._latencies.append(latency)
+        self.latency_ewma = latency if self.latency_ewma is None else (
+            EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+        )
+        self.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+        self._latency_gauge.set(self.latency_ewma)
+        self._error_gauge.set(self.error_rate)
+
+        was_probe = self._probe_in_flight
+        self._probe_in_flight = False
+        if ok:
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self._set_state(CLOSED)
+                self.error_rate = 0.0
+            return
+
+        self.failures += 1
+        self.timeouts += int(timed_out)
+        self.consecutive_failures += 1
+        too_many = self.consecutive_failures >= self.config.breaker_failures
+        rate_high = self.calls >= self.config.breaker_min_calls and self.error_rate >= self.config.breaker_error_rate
+        if was_probe or too_many or rate_high:
+            self._set_state(OPEN)
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Free the half-open probe slot when an admitted call ended without a verdict."""
+        self._probe_in_flight = False
+
+    def p95(self) -> Optional[float]:
+        if len(self._latencies) < self.config.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if there is not enough history yet."""
+        p95 = self.p95()
+        return None if p95 is None else max(p95, self.config.hedge_min_delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "latency_ewma_ms": None if self.latency_ewma is None else round(self.latency_ewma * 1000, 1),
+            "p95_ms": None if self.p95() is None else round(self.p95() * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "consecutive_failures": self.consecutive_failures,
+        }
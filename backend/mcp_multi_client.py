@@ -10,20 +10,136 @@ Supports:
 - SSE transport (remote HTTP servers)
 - streamable_http transport (modern HTTP servers like Shopify)
 
+Each server connection lives in its own task, which enters and exits the
+transport and session contexts (anyio requires both to happen in the same
+task). That lets a single server be reconnected at runtime, e.g. with a fresh
+token: the new session is opened first, new calls switch to it, and the old
+one is closed once its in-flight calls drain.
+
+Every call goes through the server's health tracker (mcp_health.py): per-call
+timeouts, a circuit breaker that fails fast while a server is unhealthy, and
+optional hedging of slow read-only calls onto a spare session.
+
+Configuration (environment):
+    MCP_CONNECT_TIMEOUT   Seconds to wait for a server to connect (default 30)
+    MCP_DRAIN_TIMEOUT     Seconds an old session may finish in-flight calls after a reconnect (default 10)
+    (timeouts, breaker and hedging settings: see mcp_health.py)
+
 Prerequisites: pip install mcp httpx-sse
 """
 
 import asyncio
 import json
 import os
-from contextlib import AsyncExitStack
-from typing import Dict, Any, List, Optional
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, Any, Awaitable, Callable, List, Optional
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
 from mcp.client.streamable_http import streamablehttp_client
 
+from app_logging import get_logger
+from mcp_health import CLOSED, HealthConfig, ServerHealth
+from metrics import MCP_HEDGED_CALLS_TOTAL
+
+logger = get_logger(__name__)
+
+
+CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "30"))
+DRAIN_TIMEOUT = float(os.getenv("MCP_DRAIN_TIMEOUT", "10"))
+
+AUTH_ERROR_TEXT = "You are not authorized to use this tool"
+
+
+def is_auth_error(result: Any = None, error: Optional[BaseException] = None) -> bool:
+    """Whether a tool result or exception means the server rejected our credentials."""
+    if error is not None:
+        text = str(error)
+        return "401" in text or "Unauthorized" in text or AUTH_ERROR_TEXT in text
+    content = getattr(result, "content", None)
+    return bool(content) and getattr(content[0], "text", None) == AUTH_ERROR_TEXT
+
+
+class ServerConnection:
+    """
+    One live session to one MCP server, owned by a dedicated task.
+
+    The task opens the transport and session, then waits until asked to close,
+    so the contexts are always exited by the task that entered them.
+    """
+
+    def __init__(self, name: str, generation: int):
+        self.name = name
+        self.generation = generation
+        self.session: Optional[ClientSession] = None
+        self.inflight = 0
+        self._ready = asyncio.Event()
+        self._close = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self, connector: Callable[[AsyncExitStack], Awaitable[ClientSession]], timeout: float) -> None:
+        """Start the connection task and wait until the session is initialized."""
+        self._task = asyncio.create_task(self._run(connector), name=f"mcp-{self.name}-{self.generation}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close(drain_timeout=0)
+            raise TimeoutError(f"Timed out connecting to {self.name} after {timeout}s")
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self, connector) -> None:
+        try:
+            async with AsyncExitStack() as stack:
+                self.session = await connector(stack)
+                self._ready.set()
+                await self._close.wait()
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            self._error = e
+            if self._ready.is_set():
+                logger.warning("Connection to %s ended: %s", self.name, e)
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    @asynccontextmanager
+    async def use(self):
+        """Count a call as in flight on this connection for the duration of the block."""
+        self.inflight += 1
+        self._idle.clear()
+        try:
+            yield self.session
+        finally:
+            self.inflight -= 1
+            if self.inflight == 0:
+                self._idle.set()
+
+    async def close(self, drain_timeout: float = DRAIN_TIMEOUT) -> None:
+        """Let in-flight calls finish (up to ``drain_timeout``), then close the session."""
+        if drain_timeout > 0:
+            try:
+                await asyncio.wait_for(self._idle.wait(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Closing %s with %d calls still in flight", self.name, self.inflight)
+        self._close.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), 5)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+
 
 class MCPMultiClient:
     """
@@ -31,16 +147,26 @@ class MCPMultiClient:
     a unified interface for tool discovery and execution.
     """
 
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, on_auth_error: Optional[Callable[[str], Awaitable[bool]]] = None):
         """
         Initialize the multi-client manager.
 
         Args:
             config_path: Path to the JSON configuration file containing server definitions.
+            on_auth_error: Awaited with the server name when a call is rejected for bad
+                credentials. Should refresh them and return True if a retry is worthwhile;
+                the server is then reconnected and the call retried once.
         """
         self.config_path = config_path
-        self.sessions: Dict[str, ClientSession] = {}
-        self.exit_stack = AsyncExitStack()
+        self.on_auth_error = on_auth_error
+        self.server_configs: Dict[str, Dict[str, Any]] = {}
+        self.connections: Dict[str, ServerConnection] = {}
+        self.spares: Dict[str, ServerConnection] = {}  # Second session per server, for hedged calls
+        self.health_config = HealthConfig.from_env()
+        self.health: Dict[str, ServerHealth] = {}
+        self._reconnect_locks: Dict[str, asyncio.Lock] = {}
+        self._closing: set[asyncio.Task] = set()  # Replaced connections still draining
+        self._generation = 0
         self.tool_registry: Dict[str, str] = {}  # Maps tool_name -> server_name
         self.original_tool_names: Dict[str, str] = {}  # Maps namespaced_name -> original_name
 
@@ -56,11 +182,91 @@ class MCPMultiClient:
         with open(self.config_path, 'r') as f:
             config = json.load(f)
 
-        for server_name, server_conf in config.get('mcpServers', {}).items():
+        self.server_configs = dict(config.get('mcpServers', {}))
+        names = list(self.server_configs)
+        results = await asyncio.gather(
+            *(self._open_connection(name) for name in names), return_exceptions=True
+        )
+        for server_name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                logger.error("Failed to connect to %s: %s", server_name, result)
+                continue
+            self.health[server_name] = ServerHealth(server_name, self.health_config)
+            # Register Tools with namespace collision handling (in config order)
+            for tool in result.tools:
+                self._register_tool(tool.name, server_name)
+
+        if self.health_config.hedge:
+            for server_name in list(self.connections):
+                try:
+                    await self._open_connection(server_name, spare=True)
+                except Exception as e:
+                    logger.warning("No spare session for %s (hedging disabled for it): %s", server_name, e)
+
+    @property
+    def sessions(self) -> Dict[str, ClientSession]:
+        """Live sessions by server name."""
+        return {name: conn.session for name, conn in self.connections.items() if conn.session is not None}
+
+    async def _open_connection(self, server_name: str, spare: bool = False):
+        """Open a new connection to ``server_name``, make it current and return its tool list."""
+        server_conf = self.server_configs[server_name]
+        self._generation += 1
+        conn = ServerConnection(server_name, self._generation)
+        await conn.open(lambda stack: self._connect_to_server(stack, server_name, server_conf), CONNECT_TIMEOUT)
+        tools = await conn.session.list_tools()
+        pool = self.spares if spare else self.connections
+        old = pool.get(server_name)
+        pool[server_name] = conn
+        if old is not None:
+            # Close in the background so the caller does not wait for the drain
+            self._close_in_background(old)
+        return tools
+
+    def _close_in_background(self, conn: "ServerConnection", **kwargs) -> None:
+        task = asyncio.create_task(conn.close(**kwargs))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def reconnect(self, server_name: str, stale_generation: Optional[int] = None) -> bool:
+        """
+        Replace a server's session with a freshly connected one.
+
+        Concurrent callers are serialized per server. If ``stale_generation`` is given
+        and the current connection is already newer, nothing is done.
+
+        Returns:
+            True if the server now has a connection newer than ``stale_generation``.
+        """
+        lock = self._reconnect_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            current = self.connections.get(server_name)
+            if stale_generation is not None and current is not None and current.generation > stale_generation:
+                return True
             try:
-                await self._connect_to_server(server_name, server_conf)
+                await self._open_connection(server_name)
             except Exception as e:
-                print(f"Failed to connect to {server_name}: {e}")
+                logger.error("Reconnect to %s failed: %s", server_name, e)
+                return False
+            if server_name in self.spares:
+                try:
+                    await self._open_connection(server_name, spare=True)
+                except Exception as e:
+                    logger.warning("Spare session for %s not reconnected: %s", server_name, e)
+                    self._close_in_background(self.spares.pop(server_name), drain_timeout=0)
+            logger.info("🔌 Reconnected to %s", server_name)
+            return True
+
+    def servers_using_env(self, var_name: str) -> List[str]:
+        """Servers whose config references ``${var_name}`` (e.g. a token in a header)."""
+        marker = "${" + var_name + "}"
+        return [name for name, conf in self.server_configs.items() if marker in json.dumps(conf)]
+
+    async def reconnect_servers_using_env(self, var_name: str) -> None:
+        """Reconnect every server whose config depends on ``var_name`` (after it changed)."""
+        for server_name in self.servers_using_env(var_name):
+            current = self.connections.get(server_name)
+            await self.reconnect(server_name, current.generation if current else None)
 
     def _resolve_env_vars(self, value: Any) -> Any:
         """
@@ -82,11 +288,12 @@ class MCPMultiClient:
             return [self._resolve_env_vars(item) for item in value]
         return value
 
-    async def _connect_to_server(self, server_name: str, server_conf: Dict[str, Any]) -> None:
+    async def _connect_to_server(self, exit_stack: AsyncExitStack, server_name: str, server_conf: Dict[str, Any]) -> ClientSession:
         """
-        Connect to a single MCP server.
+        Connect to a single MCP server and return its initialized session.
 
         Args:
+            exit_stack: Stack owning the transport and session contexts (closed by the connection task).
             server_name: The name/identifier of the server.
             server_conf: Configuration dictionary for the server.
                         For stdio: requires 'command', optional 'args' and 'env'
@@ -100,7 +307,7 @@ class MCPMultiClient:
             url = server_conf['url']
             headers = self._resolve_env_vars(server_conf.get('headers', {}))
             
-            streams = await self.exit_stack.enter_async_context(
+            streams = await exit_stack.enter_async_context(
                 streamablehttp_client(url, headers=headers)
             )
             read_stream, write_stream, _ = streams
@@ -110,7 +317,7 @@ class MCPMultiClient:
             url = server_conf['url']
             headers = self._resolve_env_vars(server_conf.get('headers', {}))
             
-            transport = await self.exit_stack.enter_async_context(
+            transport = await exit_stack.enter_async_context(
                 sse_client(url, headers=headers)
             )
             read_stream, write_stream = transport[0], transport[1]
@@ -120,26 +327,21 @@ class MCPMultiClient:
             server_params = StdioServerParameters(
                 command=server_conf['command'],
                 args=server_conf.get('args', []),
-                env={**os.environ, **server_conf.get('env', {})}
+                env={**os.environ, **self._resolve_env_vars(server_conf.get('env', {}))}
             )
-            transport = await self.exit_stack.enter_async_context(
+            transport = await exit_stack.enter_async_context(
                 stdio_client(server_params)
             )
             read_stream, write_stream = transport[0], transport[1]
 
         # Create session from transport
-        session = await self.exit_stack.enter_async_context(
+        session = await exit_stack.enter_async_context(
             ClientSession(read_stream, write_stream)
         )
 
         # Initialize
         await session.initialize()
-        self.sessions[server_name] = session
-
-        # Register Tools with namespace collision handling
-        tools = await session.list_tools()
-        for tool in tools.tools:
-            self._register_tool(tool.name, server_name)
+        return session
 
     def _register_tool(self, tool_name: str, server_name: str) -> None:
         """
@@ -161,16 +363,16 @@ class MCPMultiClient:
                 self.tool_registry[namespaced_existing] = existing_server
                 self.original_tool_names[namespaced_existing] = tool_name
                 del self.tool_registry[tool_name]
-                print(f"Renamed existing tool: {tool_name} -> {namespaced_existing}")
+                logger.info("Renamed existing tool: %s -> %s", tool_name, namespaced_existing)
 
             # Add the new tool with namespace prefix
             namespaced_name = f"{server_name}_{tool_name}"
             self.tool_registry[namespaced_name] = server_name
             self.original_tool_names[namespaced_name] = tool_name
-            print(f"Loaded tool: {namespaced_name} from {server_name} (namespaced due to collision)")
+            logger.info("Loaded tool: %s from %s (namespaced due to collision)", namespaced_name, server_name)
         else:
             self.tool_registry[tool_name] = server_name
-            print(f"Loaded tool: {tool_name} from {server_name}")
+            logger.info("Loaded tool: %s from %s", tool_name, server_name)
 
     async def get_all_tools(self) -> List[Dict[str, Any]]:
         """
@@ -228,18 +430,115 @@ class MCPMultiClient:
 
         Raises:
             ValueError: If the tool is not found in any connected server.
+            ConnectionError: If the tool's server is not connected.
+            CircuitOpenError: If the server's circuit breaker is open.
+            TimeoutError: If the call exceeded its timeout (MCP_CALL_TIMEOUT / MCP_TOOL_TIMEOUTS).
         """
         server_name = self.tool_registry.get(tool_name)
         if not server_name:
             raise ValueError(f"Tool '{tool_name}' not found in any connected server.")
 
-        session = self.sessions[server_name]
-        
         # Get the original tool name if it was namespaced
         original_name = self.original_tool_names.get(tool_name, tool_name)
-        
-        result = await session.call_tool(original_name, arguments)
-        return result
+
+        for attempt in range(2):
+            conn = self.connections.get(server_name)
+            if conn is None or not conn.alive:
+                raise ConnectionError(f"Server '{server_name}' is not connected.")
+
+            health = self.health.setdefault(server_name, ServerHealth(server_name, self.health_config))
+            health.before_call()  # Raises CircuitOpenError while the server is unhealthy
+
+            timeout = self.health_config.timeout_for(original_name)
+            error = result = None
+            timed_out = False
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._send(server_name, conn, original_name, arguments), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                error = TimeoutError(f"Tool '{tool_name}' on '{server_name}' timed out after {timeout}s")
+            except asyncio.CancelledError:
+                health.release_probe()
+                raise
+            except Exception as e:
+                error = e
+
+            auth_failed = is_auth_error(result, error)
+            if auth_failed:
+                # A credentials problem says nothing about the server's health
+                health.release_probe()
+            else:
+                health.record(time.monotonic() - start, ok=error is None, timed_out=timed_out)
+
+            if attempt == 0 and self.on_auth_error is not None and auth_failed:
+                # Refresh credentials, rebuild only this server's session and retry once
+                logger.warning("Auth failure calling %s on %s; refreshing credentials", tool_name, server_name)
+                if await self.on_auth_error(server_name) and await self.reconnect(server_name, conn.generation):
+                    continue
+            if error is not None:
+                raise error
+            return result
+
+    async def _send(self, server_name: str, conn: ServerConnection, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """Send one call, hedging it onto the spare session if it runs past the server's p95."""
+        spare = self.spares.get(server_name)
+        delay = self.health[server_name].hedge_delay() if spare is not None else None
+        if delay is None or not spare.alive or not self.health_config.may_hedge(tool_name):
+            async with conn.use() as session:
+                return await session.call_tool(tool_name, arguments)
+        return await self._hedged_call(server_name, conn, spare, tool_name, arguments, delay)
+
+    async def _hedged_call(self, server_name: str, primary_conn: ServerConnection, spare: ServerConnection,
+                           tool_name: str, arguments: Dict[str, Any], delay: float) -> Any:
+        """Run the call on the primary session; after ``delay`` also on the spare. First success wins."""
+        async def call_on(conn: ServerConnection):
+            async with conn.use() as session:
+                return await session.call_tool(tool_name, arguments)
+
+        primary = asyncio.create_task(call_on(primary_conn))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            health = self.health[server_name]
+            health.hedged += 1
+            backup = asyncio.create_task(call_on(spare))
+            tasks.add(backup)
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "hedge" if task is backup else "primary"
+                        health.hedge_wins += int(task is backup)
+                        MCP_HEDGED_CALLS_TOTAL.labels(server_name, winner).inc()
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def is_idle(self) -> bool:
+        """True if no call is in flight on any server and every circuit breaker is closed."""
+        busy = any(conn.inflight for conn in list(self.connections.values()) + list(self.spares.values()))
+        return not busy and all(health.state == CLOSED for health in self.health.values())
+
+    def health_snapshot(self) -> Dict[str, Any]:
+        """Breaker state and latency statistics per server, for monitoring."""
+        return {
+            name: {
+                **health.snapshot(),
+                "connected": name in self.connections and self.connections[name].alive,
+                "spare": name in self.spares and self.spares[name].alive,
+            }
+            for name, health in self.health.items()
+        }
 
     async def get_resources(self, server_name: Optional[str] = None) -> Dict[str, List[Any]]:
         """
@@ -264,7 +563,7 @@ class MCPMultiClient:
                 result = await session.list_resources()
                 resources[name] = result.resources
             except Exception as e:
-                print(f"Failed to get resources from {name}: {e}")
+                logger.warning("Failed to get resources from %s: %s", name, e)
                 resources[name] = []
 
         return resources
@@ -273,11 +572,15 @@ class MCPMultiClient:
         """
         Gracefully close all server connections.
         """
-        await self.exit_stack.aclose()
-        self.sessions.clear()
+        connections = list(self.connections.values()) + list(self.spares.values())
+        self.connections.clear()
+        self.spares.clear()
+        await asyncio.gather(
+            *(conn.close(drain_timeout=0) for conn in connections), *self._closing, return_exceptions=True
+        )
         self.tool_registry.clear()
         self.original_tool_names.clear()
-        print("All MCP connections closed.")
+        logger.info("All MCP connections closed.")
 
     def list_connected_servers(self) -> List[str]:
         """
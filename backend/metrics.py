@@ -0,0 +1,345 @@
+"""
+Minimal Prometheus-style metrics for the backend.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format on ``GET /metrics``.
+
+Hot-path cost is kept negligible:
+- label children are created once (``metric.labels(...)``) and can be bound
+  ahead of time, so an observation is a bisect plus two additions
+- observations take no locks; the lock only guards creating a new child
+
+Usage:
+    TOOL_CALL = MCP_TOOL_SECONDS.labels("search_global_products")   # bind once
+    with TOOL_CALL.time():
+        ...
+"""
+
+import bisect
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Timer:
+    """Context manager that observes its own duration on a histogram child."""
+
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: "_HistogramChild"):
+        self._child = child
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric:
+    """Base class: a named family of children keyed by label values."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Return (creating on first use) the child for these label values.
+
+        Bind the result once outside hot loops rather than calling this per observation.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+
+class Histogram(_Metric):
+    """Bucketed observations (typically durations in seconds)."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default().time()
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =============================================================================
+# BACKEND METRICS
+# =============================================================================
+
+SEARCH_STAGE_SECONDS = Histogram(
+    "search_stage_seconds",
+    "Time spent in each stage of a /search request.",
+    ["stage"],
+)
+SEARCH_REQUESTS_TOTAL = Counter(
+    "search_requests_total",
+    "Search requests by outcome.",
+    ["outcome"],
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds",
+    "Latency of each chat model call made by the agent, by tool profile.",
+    ["profile"],
+)
+MCP_TOOL_SECONDS = Histogram(
+    "mcp_tool_call_seconds",
+    "Latency of MCP tool calls sent to a server (cache hits excluded).",
+    ["tool"],
+)
+MCP_TOOL_ERRORS_TOTAL = Counter(
+    "mcp_tool_errors_total",
+    "MCP tool calls that raised or returned an error result.",
+    ["tool"],
+)
+# No store label: store domains come from clients, so they would be unbounded
+CHECKOUT_STAGE_SECONDS = Histogram(
+    "checkout_stage_seconds",
+    "Time spent in each per-store checkout stage.",
+    ["stage"],
+)
+CHECKOUT_STORES_TOTAL = Counter(
+    "checkout_stores_total",
+    "Per-store checkouts by outcome.",
+    ["outcome"],
+)
+MCP_SERVER_LATENCY_EWMA = Gauge(
+    "mcp_server_latency_ewma_seconds",
+    "Exponentially weighted moving average of MCP call latency, per server.",
+    ["server"],
+)
+MCP_SERVER_ERROR_RATE = Gauge(
+    "mcp_server_error_rate",
+    "Exponentially weighted moving average of the MCP call failure rate, per server.",
+    ["server"],
+)
+MCP_BREAKER_STATE = Gauge(
+    "mcp_breaker_state",
+    "Circuit breaker state per MCP server (0 closed, 1 half-open, 2 open).",
+    ["server"],
+)
+MCP_HEDGED_CALLS_TOTAL = Counter(
+    "mcp_hedged_calls_total",
+    "Hedged MCP calls by which request answered first.",
+    ["server", "winner"],
+)
+SEARCH_BATCH_QUERIES_TOTAL = Counter(
+    "search_batch_queries_total",
+    "Queries of /search/batch requests by outcome (deduped = answered by an identical query).",
+    ["outcome"],
+)
+LLM_CACHE_TOTAL = Counter(
+    "llm_cache_total",
+    "Completion cache lookups and stores by outcome (memory_hit, disk_hit, miss, coalesced, store).",
+    ["outcome"],
+)
+TOOL_CACHE_TOTAL = Counter(
+    "tool_cache_total",
+    "MCP tool result cache lookups by tool and outcome (hit, stale_hit, negative_hit, miss, coalesced, refresh).",
+    ["tool", "outcome"],
+)
+PLAN_CACHE_TOTAL = Counter(
+    "plan_cache_total",
+    "Query-plan cache lookups and updates by outcome (hit, miss, store, rejected, invalidated).",
+    ["outcome"],
+)
+PREFETCH_RESULTS_TOTAL = Counter(
+    "prefetch_results_total",
+    "Speculative search results by outcome (stored, hit, wasted, preempted, failed, over_budget).",
+    ["outcome"],
+)
+PREFETCH_SPEND_TOTAL = Counter(
+    "prefetch_spend_total",
+    "LLM tokens and MCP tool calls spent on speculative searches.",
+    ["resource"],
+)
+IMAGE_PROXY_REQUESTS_TOTAL = Counter(
+    "image_proxy_requests_total",
+    "Image proxy requests by outcome (hit, miss, not_modified, error).",
+    ["outcome"],
+)
+IMAGE_CACHE_BYTES = Gauge(
+    "image_cache_bytes",
+    "Bytes held in the image proxy's disk cache.",
+)
+TRYON_REQUESTS_TOTAL = Counter(
+    "tryon_requests_total",
+    "Try-on requests and generations by outcome (cached, coalesced, queued, generated, failed).",
+    ["outcome"],
+)
+RECOMMENDATION_REQUESTS_TOTAL = Counter(
+    "recommendation_requests_total",
+    "Frequently-bought-together lookups by outcome (hit, empty).",
+    ["outcome"],
+)
+PURCHASE_ITEMS_TOTAL = Counter(
+    "purchase_items_total",
+    "Purchased items by provider and outcome (idempotent replays excluded).",
+    ["provider", "outcome"],
+)
+
+# Pre-bound children for the fixed search stages
+HISTORY_FETCH = SEARCH_STAGE_SECONDS.labels("history_fetch")
+PROMPT_BUILD = SEARCH_STAGE_SECONDS.labels("prompt_build")
+AGENT_RUN = SEARCH_STAGE_SECONDS.labels("agent")
+JSON_EXTRACT = SEARCH_STAGE_SECONDS.labels("json_extract")
+HISTORY_WRITE = SEARCH_STAGE_SECONDS.labels("history_write")
@@ -0,0 +1,188 @@
+"""
+Query-plan cache: replay the agent's tool choice instead of asking the model.
+
+For a search, the first model turn only decides which tool to call and with
+which arguments; the same prompt leads to the same plan every time. The plan
+cache remembers that decision (tool names + arguments) keyed on the turn's
+user message, which carries both the normalized query and the personalization
+(search history) the prompt was built from, plus the tool profile.
+
+On a hit the graph emits the remembered tool calls directly: the tools run
+against the live catalog (so products stay fresh, subject to the tool-result
+cache), and only the second, answer-writing model turn is paid for.
+
+Unlike the completion cache (llm_cache), which needs the whole conversation to
+match, a plan is reused across threads and conversation histories.
+
+Plans are only served once they are trusted:
+- every call in the plan uses a cacheable tool (PLAN_CACHE_TOOLS)
+- the model produced the same plan PLAN_CACHE_MIN_AGREEMENT times
+- the tool calls of the run that produced it did not fail
+A served plan whose tool call fails is dropped, and the next run asks the model.
+
+Configuration (environment):
+    PLAN_CACHE_SIZE            Max plans kept (default 1024, 0 disables the cache)
+    PLAN_CACHE_TTL             Seconds a plan stays valid (default 3600)
+    PLAN_CACHE_MIN_AGREEMENT   Identical model plans needed before one is served (default 2)
+    PLAN_CACHE_TOOLS           Comma-separated tools whose calls may be replayed
+                               (default search_global_products)
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from metrics import PLAN_CACHE_TOTAL
+
+
+PLAN_CACHE_METADATA_KEY = "plan_cache"
+
+
+def normalize_prompt(text: str) -> str:
+    return " ".join(str(text).split()).lower()
+
+
+def plan_key(profile: str, prompt: str) -> str:
+    payload = json.dumps({"profile": profile, "prompt": normalize_prompt(prompt)}, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _plan_of(message: AIMessage) -> List[Dict[str, Any]]:
+    return [{"name": tc["name"], "args": tc["args"]} for tc in message.tool_calls]
+
+
+def _is_failed_tool_message(message: ToolMessage) -> bool:
+    return getattr(message, "status", None) == "error" or str(message.content).startswith("Error calling tool")
+
+
+class _Plan:
+    __slots__ = ("calls", "fingerprint", "agreement", "expires_at", "hits")
+
+    def __init__(self, calls: List[Dict[str, Any]], expires_at: float):
+        self.calls = calls
+        self.fingerprint = json.dumps(calls, sort_keys=True, default=str)
+        self.agreement = 1
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class PlanCache:
+    """LRU of trusted tool-call plans keyed on (tool profile, user message)."""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        min_agreement: int = 2,
+        tools: Sequence[str] = ("search_global_products",),
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_agreement = max(1, min_agreement)
+        self.tools = frozenset(tools)
+        self._plans: OrderedDict[str, _Plan] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "rejected": 0, "invalidated": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["PlanCache"]:
+        """Build a cache from the PLAN_CACHE_* variables, or None if disabled."""
+        max_entries = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+        if max_entries <= 0:
+            return None
+        tools = os.getenv("PLAN_CACHE_TOOLS", "search_global_products")
+        return cls(
+            max_entries=max_entries,
+            ttl=float(os.getenv("PLAN_CACHE_TTL", "3600")),
+            min_agreement=int(os.getenv("PLAN_CACHE_MIN_AGREEMENT", "2")),
+            tools=[t.strip() for t in tools.split(",") if t.strip()],
+        )
+
+    def lookup(self, profile: str, prompt: str) -> Optional[AIMessage]:
+        """
+        Return a tool-calling AIMessage replaying the trusted plan for this turn, if any.
+
+        Args:
+            profile: Tool profile the run is bound to.
+            prompt: Content of the user message that starts the turn.
+        """
+        key = plan_key(profile, prompt)
+        plan = self._plans.get(key)
+        if plan is None or plan.agreement < self.min_agreement or plan.expires_at < time.monotonic():
+            self.stats["misses"] += 1
+            PLAN_CACHE_TOTAL.labels("miss").inc()
+            return None
+
+        self._plans.move_to_end(key)
+        plan.hits += 1
+        self.stats["hits"] += 1
+        PLAN_CACHE_TOTAL.labels("hit").inc()
+        return AIMessage(
+            content="",
+            tool_calls=[
+                {"name": call["name"], "args": dict(call["args"]), "id": f"call_plan_{uuid.uuid4().hex[:12]}"}
+                for call in plan.calls
+            ],
+            response_metadata={PLAN_CACHE_METADATA_KEY: "hit"},
+        )
+
+    def observe(self, profile: str, prompt: str, messages: List[BaseMessage]) -> None:
+        """
+        Learn from (or verify) the plan of a finished run.
+
+        ``messages`` is the run's final message list; the turn starts at the last
+        user message whose content is ``prompt``.
+        """
+        start = next(
+            (i for i in range(len(messages) - 1, -1, -1)
+             if isinstance(messages[i], HumanMessage) and messages[i].content == prompt),
+            None,
+        )
+        if start is None or start + 1 >= len(messages):
+            return
+        first = messages[start + 1]
+        if not isinstance(first, AIMessage) or not first.tool_calls:
+            return
+
+        call_ids = {tc.get("id") for tc in first.tool_calls}
+        failed = any(
+            isinstance(m, ToolMessage) and m.tool_call_id in call_ids and _is_failed_tool_message(m)
+            for m in messages[start + 2:]
+        )
+        key = plan_key(profile, prompt)
+
+        if first.response_metadata.get(PLAN_CACHE_METADATA_KEY) == "hit":
+            if failed and self._plans.pop(key, None) is not None:
+                self.stats["invalidated"] += 1
+                PLAN_CACHE_TOTAL.labels("invalidated").inc()
+            return
+
+        calls = _plan_of(first)
+        if failed or any(call["name"] not in self.tools for call in calls):
+            self.stats["rejected"] += 1
+            PLAN_CACHE_TOTAL.labels("rejected").inc()
+            return
+
+        now = time.monotonic()
+        existing = self._plans.get(key)
+        candidate = _Plan(calls, now + self.ttl)
+        if existing is not None and existing.expires_at >= now and existing.fingerprint == candidate.fingerprint:
+            existing.agreement += 1
+            existing.expires_at = candidate.expires_at
+            self._plans.move_to_end(key)
+        else:
+            # New prompt, expired plan, or the model changed its mind: start counting again
+            self._plans[key] = candidate
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        self.stats["stores"] += 1
+        PLAN_CACHE_TOTAL.labels("store").inc()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"entries": len(self._plans), **self.stats}
@@ -0,0 +1,353 @@
+"""
+Speculative prefetch of likely follow-up searches.
+
+After each ``/search``, ``Prefetcher`` predicts what the user may search next
+and, while the backend has nothing better to do, runs those searches ahead of
+time. The results land in a small cache that ``/search`` checks first, so a
+predicted search answers without an LLM round trip.
+
+Candidates for a user's next query:
+- refinements: longer queries seen from other users that contain every word of
+  the user's last query ("sneakers" -> "white leather sneakers")
+- profile-driven: the last query qualified by the user's style preferences and
+  budget tier
+- trending: the most searched query right now that the user has not just searched
+
+Prefetching is strictly background work:
+- a job only starts when no foreground LLM call (interactive or batch) ran for
+  PREFETCH_IDLE_SECONDS, no MCP call is in flight and every breaker is closed
+- its LLM calls use the lowest scheduler priority (llm_scheduler.PREFETCH)
+- ``preempt()``, called when a foreground request arrives, cancels the running job
+- tokens and tool calls are capped per rolling minute
+
+``prefetch_results_total`` (stored / hit / wasted / ...) and
+``prefetch_spend_total`` (tokens / tool_calls) show whether it pays for itself.
+
+Configuration (environment):
+    PREFETCH_ENABLED              1 to run the prefetcher (default 0)
+    PREFETCH_TOKENS_PER_MIN       LLM token budget per rolling minute (default 20000)
+    PREFETCH_TOOL_CALLS_PER_MIN   MCP tool call budget per rolling minute (default 30)
+    PREFETCH_IDLE_SECONDS         Foreground quiet time before a job may start (default 1.0)
+    PREFETCH_TTL                  Seconds a prefetched result may be served (default 300)
+    PREFETCH_MAX_ENTRIES          Max prefetched results kept (default 500)
+    PREFETCH_QUEUE_SIZE           Max pending candidates; oldest are dropped (default 100)
+    PREFETCH_QUERY_TIMEOUT        Seconds one speculative search may take (default 60)
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app_logging import get_logger
+from database import get_user_profile
+from llm_scheduler import PREFETCH
+from metrics import PREFETCH_RESULTS_TOTAL, PREFETCH_SPEND_TOTAL
+from models import get_budget_tier
+from util import search_products, extract_json_items
+
+logger = get_logger(__name__)
+
+
+WINDOW_SECONDS = 60
+# Trending counts halve every this many seconds
+TRENDING_HALF_LIFE = 900
+TRENDING_SIZE = 500
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+class _Entry:
+    __slots__ = ("items", "expires_at", "hits")
+
+    def __init__(self, items: List[Any], expires_at: float):
+        self.items = items
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class Prefetcher:
+    """Predicts follow-up searches and runs them on idle capacity, within a budget."""
+
+    def __init__(
+        self,
+        get_agent: Callable[[], Any],
+        enabled: bool = False,
+        tokens_per_min: int = 20000,
+        tool_calls_per_min: int = 30,
+        idle_seconds: float = 1.0,
+        ttl: float = 300,
+        max_entries: int = 500,
+        queue_size: int = 100,
+        query_timeout: float = 60,
+    ):
+        """
+        Args:
+            get_agent: Returns the ready agent, or None while it is warming up.
+            enabled: Run the background loop at all.
+            tokens_per_min: LLM tokens speculative searches may spend per rolling minute.
+            tool_calls_per_min: MCP tool calls they may make per rolling minute.
+            idle_seconds: Foreground quiet time required before starting a job.
+            ttl: Seconds a prefetched result stays servable.
+            max_entries: Max prefetched results kept.
+            queue_size: Max pending candidates.
+            query_timeout: Seconds one speculative search may take.
+        """
+        self.get_agent = get_agent
+        self.enabled = enabled
+        self.tokens_per_min = tokens_per_min
+        self.tool_calls_per_min = tool_calls_per_min
+        self.idle_seconds = idle_seconds
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.query_timeout = query_timeout
+
+        self._results: OrderedDict[Tuple[str, str], _Entry] = OrderedDict()
+        self._queue: Deque[Tuple[str, str]] = deque(maxlen=queue_size)
+        self._observed: Deque[Tuple[str, str]] = deque(maxlen=queue_size)
+        self._trending: Counter = Counter()
+        self._trending_decayed_at = time.monotonic()
+        self._spend: Deque[Tuple[float, int, int]] = deque()  # (time, tokens, tool calls)
+        self._avg_tokens = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._job: Optional[asyncio.Task] = None
+        self.stats = {"stored": 0, "used": 0, "hits": 0, "wasted": 0, "preempted": 0, "failed": 0, "over_budget": 0}
+
+    @classmethod
+    def from_env(cls, get_agent: Callable[[], Any]) -> "Prefetcher":
+        return cls(
+            get_agent,
+            enabled=os.getenv("PREFETCH_ENABLED", "0") == "1",
+            tokens_per_min=int(os.getenv("PREFETCH_TOKENS_PER_MIN", "20000")),
+            tool_calls_per_min=int(os.getenv("PREFETCH_TOOL_CALLS_PER_MIN", "30")),
+            idle_seconds=float(os.getenv("PREFETCH_IDLE_SECONDS", "1.0")),
+            ttl=float(os.getenv("PREFETCH_TTL", "300")),
+            max_entries=int(os.getenv("PREFETCH_MAX_ENTRIES", "500")),
+            queue_size=int(os.getenv("PREFETCH_QUEUE_SIZE", "100")),
+            query_timeout=float(os.getenv("PREFETCH_QUERY_TIMEOUT", "60")),
+        )
+
+    # ------------------------------------------------------------------
+    # Foreground hooks
+    # ------------------------------------------------------------------
+
+    def take(self, user_id: str, query: str) -> Optional[List[Any]]:
+        """Prefetched items for this user's query, if a fresh result exists."""
+        if not self.enabled:
+            return None
+        self._expire()
+        entry = self._results.get((user_id, normalize_query(query)))
+        if entry is None:
+            return None
+        if entry.hits == 0:
+            self.stats["used"] += 1
+        entry.hits += 1
+        self.stats["hits"] += 1
+        PREFETCH_RESULTS_TOTAL.labels("hit").inc()
+        return entry.items
+
+    def preempt(self) -> None:
+        """Foreground traffic arrived: cancel the running speculative search, if any."""
+        if self._job is not None and not self._job.done():
+            self._job.cancel()
+
+    def observe(self, user_id: str, query: str) -> None:
+        """Record a completed foreground search; predictions for the user's next one are made in the background."""
+        if not self.enabled:
+            return
+        normalized = normalize_query(query)
+        self._decay_trending()
+        self._trending[normalized] += 1
+        if len(self._trending) > TRENDING_SIZE:
+            for q, _ in self._trending.most_common()[TRENDING_SIZE:]:
+                del self._trending[q]
+        self._observed.append((user_id, normalized))
+        self._wakeup.set()
+
+    async def _enqueue_predictions(self) -> None:
+        while self._observed:
+            user_id, query = self._observed.popleft()
+            try:
+                candidates = await self.predict(user_id, query)
+            except Exception as e:
+                logger.debug("Predicting follow-ups for %r failed: %s", query, e)
+                continue
+            for candidate in candidates:
+                key = (user_id, candidate)
+                if key not in self._results and key not in self._queue:
+                    # Newest activity first: it is the likeliest to be followed up soon
+                    self._queue.appendleft(key)
+
+    # ------------------------------------------------------------------
+    # Prediction
+    # ------------------------------------------------------------------
+
+    def _decay_trending(self) -> None:
+        elapsed = time.monotonic() - self._trending_decayed_at
+        if elapsed < TRENDING_HALF_LIFE / 10:
+            return
+        factor = 0.5 ** (elapsed / TRENDING_HALF_LIFE)
+        for q in list(self._trending):
+            self._trending[q] *= factor
+            if self._trending[q] < 0.05:
+                del self._trending[q]
+        self._trending_decayed_at = time.monotonic()
+
+    async def predict(self, user_id: str, query: str) -> List[str]:
+        """Likely next queries for a user whose last query was ``query`` (normalized)."""
+        words = set(query.split())
+        ranked = self._trending.most_common(50)
+        candidates: List[str] = []
+
+        refinements = [q for q, _ in ranked if q != query and words <= set(q.split())]
+        candidates.extend(refinements[:2])
+
+        profile = await asyncio.to_thread(get_user_profile, user_id) if user_id else None
+        if profile:
+            for style in (profile.get("style") or [])[:2]:
+                candidates.append(normalize_query(f"{style} {query}"))
+            if profile.get("budget") is not None:
+                candidates.append(normalize_query(f"{get_budget_tier(int(profile['budget']))} {query}"))
+
+        trending = next((q for q, _ in ranked if q != query and q not in candidates), None)
+        if trending:
+            candidates.append(trending)
+
+        seen = set()
+        return [c for c in candidates if c != query and not (c in seen or seen.add(c))]
+
+    # ------------------------------------------------------------------
+    # Background loop
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="search-prefetch")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self.preempt()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _window(self) -> Tuple[int, int]:
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        while self._spend and self._spend[0][0] < cutoff:
+            self._spend.popleft()
+        return sum(s[1] for s in self._spend), sum(s[2] for s in self._spend)
+
+    def _within_budget(self) -> bool:
+        tokens, calls = self._window()
+        return (
+            tokens + max(self._avg_tokens, 1) <= self.tokens_per_min
+            and calls + 1 <= self.tool_calls_per_min
+        )
+
+    def _idle(self, agent) -> bool:
+        return (
+            agent.llm_scheduler.foreground_idle(self.idle_seconds)
+            and (agent.mcp_client is None or agent.mcp_client.is_idle())
+        )
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, e in self._results.items() if e.expires_at < now]:
+            self._drop(key)
+
+    def _drop(self, key) -> None:
+        entry = self._results.pop(key)
+        if entry.hits == 0:
+            self.stats["wasted"] += 1
+            PREFETCH_RESULTS_TOTAL.labels("wasted").inc()
+
+    async def _run(self) -> None:
+        while True:
+            await self._enqueue_predictions()
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            agent = self.get_agent()
+            if agent is None or not self._idle(agent):
+                await asyncio.sleep(0.25)
+                continue
+            if not self._within_budget():
+                self.stats["over_budget"] += 1
+                PREFETCH_RESULTS_TOTAL.labels("over_budget").inc()
+                await asyncio.sleep(WINDOW_SECONDS / 10)
+                continue
+
+            user_id, query = self._queue.popleft()
+            self._job = asyncio.create_task(self._prefetch(agent, user_id, query))
+            try:
+                await asyncio.shield(self._job)
+            except asyncio.CancelledError:
+                if self._task is not None and self._task.cancelling():
+                    raise
+                # Preempted by foreground traffic; the candidate is dropped (it may be stale by now)
+                self.stats["preempted"] += 1
+                PREFETCH_RESULTS_TOTAL.labels("preempted").inc()
+            except Exception as e:
+                self.stats["failed"] += 1
+                PREFETCH_RESULTS_TOTAL.labels("failed").inc()
+                logger.debug("Prefetch of %r failed: %s", query, e)
+            finally:
+                self._job = None
+
+    async def _prefetch(self, agent, user_id: str, query: str) -> None:
+        thread_id = f"prefetch:{uuid.uuid4().hex}"
+        tool_calls: List[Dict[str, Any]] = []
+        usage: Dict[str, int] = {}
+        try:
+            res = await asyncio.wait_for(
+                search_products(agent, query, user_id, thread_id=thread_id, priority=PREFETCH,
+                                tool_calls=tool_calls, usage=usage),
+                self.query_timeout,
+            )
+        finally:
+            # A preempted run reports no usage; it is charged one tool call
+            tokens = usage.get("tokens", 0)
+            self._spend.append((time.monotonic(), tokens, max(len(tool_calls), 1)))
+            PREFETCH_SPEND_TOTAL.labels("tokens").inc(tokens)
+            PREFETCH_SPEND_TOTAL.labels("tool_calls").inc(len(tool_calls))
+            if tokens:
+                self._avg_tokens = tokens if not self._avg_tokens else 0.8 * self._avg_tokens + 0.2 * tokens
+            try:
+                await agent.checkpointer.adelete_thread(thread_id)
+            except Exception as e:
+                logger.debug("Could not drop prefetch thread %s: %s", thread_id, e)
+
+        items = extract_json_items(res)
+        if not isinstance(items, list):
+            raise ValueError("Agent response is not a JSON list")
+
+        self._expire()
+        key = (user_id, query)
+        if key in self._results:
+            self._drop(key)
+        self._results[key] = _Entry(items, time.monotonic() + self.ttl)
+        while len(self._results) > self.max_entries:
+            self._drop(next(iter(self._results)))
+        self.stats["stored"] += 1
+        PREFETCH_RESULTS_TOTAL.labels("stored").inc()
+
+    def status(self) -> Dict[str, Any]:
+        tokens, calls = self._window()
+        stored = self.stats["stored"]
+        return {
+            "enabled": self.enabled,
+            "queued": len(self._queue),
+            "cached": len(self._results),
+            "tokens_last_minute": tokens,
+            "tool_calls_last_minute": calls,
+            # Share of prefetched results that were served at least once
+            "hit_rate": round(self.stats["used"] / stored, 3) if stored else None,
+            **self.stats,
+        }
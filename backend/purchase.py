@@ -0,0 +1,263 @@
+"""
+Async purchase pipeline behind ``POST /purchase``.
+
+Items in a purchase are handed to a pluggable ``PurchaseProvider`` concurrently,
+bounded by a semaphore, and every item gets its own result so one failure does
+not hide the others.
+
+Requests may carry an idempotency key (``Idempotency-Key`` header). The first
+request with a key does the work; retries with the same key and the same items
+get the stored result (or wait for the in-flight one) instead of purchasing
+again. Reusing a key for a different set of items is rejected.
+
+Configuration (environment):
+    PURCHASE_PROVIDER             Provider to use (default "mock"; the only one so far)
+    PURCHASE_CONCURRENCY          Max items purchased at once per request (default 4)
+    PURCHASE_ITEM_TIMEOUT         Seconds before a single item is given up on (default 30)
+    PURCHASE_IDEMPOTENCY_TTL      Seconds a keyed result is remembered (default 86400)
+    PURCHASE_IDEMPOTENCY_MAX      Max remembered keys (default 10000)
+    PURCHASE_MOCK_LATENCY_MS      Mock provider: max latency per item (default 1000)
+    PURCHASE_MOCK_FAILURE_RATE    Mock provider: probability an item fails (default 0)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Protocol
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PurchaseResult:
+    """Outcome of purchasing a single item."""
+    item: str
+    success: bool
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+    elapsed_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class PurchaseProvider(Protocol):
+    """Anything that can buy one item. Implementations must be safe to call concurrently."""
+
+    name: str
+
+    async def purchase(self, item: str, idempotency_key: str) -> PurchaseResult:
+        """
+        Purchase a single item.
+
+        Args:
+            item: The product identifier from the request.
+            idempotency_key: Per-item key; providers that support it should pass it
+                upstream so a retried item is not charged twice.
+
+        Returns:
+            The item's PurchaseResult. Failures may be returned or raised.
+        """
+        ...
+
+
+class MockPurchaseProvider:
+    """
+    Local stand-in for the UCP purchase flow.
+
+    Sleeps for a random time up to ``max_latency`` seconds (without blocking the
+    event loop) and fails with probability ``failure_rate``.
+    """
+
+    name = "mock"
+
+    def __init__(self, max_latency: float = 1.0, failure_rate: float = 0.0):
+        self.max_latency = max_latency
+        self.failure_rate = failure_rate
+
+    @classmethod
+    def from_env(cls) -> "MockPurchaseProvider":
+        return cls(
+            max_latency=float(os.getenv("PURCHASE_MOCK_LATENCY_MS", "1000")) / 1000,
+            failure_rate=float(os.getenv("PURCHASE_MOCK_FAILURE_RATE", "0")),
+        )
+
+    async def purchase(self, item: str, idempotency_key: str) -> PurchaseResult:
+        await asyncio.sleep(random.random() * self.max_latency)
+        if random.random() < self.failure_rate:
+            return PurchaseResult(item=item, success=False, error="Mock provider declined the purchase")
+        order_id = "mock-" + hashlib.sha1(idempotency_key.encode()).hexdigest()[:12]
+        return PurchaseResult(item=item, success=True, order_id=order_id)
+
+
+PROVIDERS = {
+    "mock": MockPurchaseProvider,
+}
+
+
+def create_provider(name: Optional[str] = None) -> PurchaseProvider:
+    """Build the provider named by ``name`` or PURCHASE_PROVIDER."""
+    name = (name or os.getenv("PURCHASE_PROVIDER", "mock")).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown purchase provider '{name}'. Available: {sorted(PROVIDERS)}")
+    return PROVIDERS[name].from_env()
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with a different request body."""
+
+
+@dataclass
+class _KeyedRun:
+    fingerprint: str
+    future: "asyncio.Future[List[PurchaseResult]]"
+    stored_at: float = field(default_factory=time.monotonic)
+
+
+class IdempotencyStore:
+    """
+    In-memory record of keyed purchases.
+
+    Holds the in-flight task while a purchase runs, so concurrent retries share
+    it, and the finished result until ``ttl`` expires. Runs that raise are
+    forgotten so the client can retry with the same key.
+    """
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._runs: "OrderedDict[str, _KeyedRun]" = OrderedDict()
+        self.stats = {"replays": 0, "joined": 0, "conflicts": 0}
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyStore":
+        return cls(
+            ttl=float(os.getenv("PURCHASE_IDEMPOTENCY_TTL", "86400")),
+            max_entries=int(os.getenv("PURCHASE_IDEMPOTENCY_MAX", "10000")),
+        )
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._runs:
+            key, run = next(iter(self._runs.items()))
+            expired = now - run.stored_at > self.ttl
+            if not expired and len(self._runs) <= self.max_entries:
+                break
+            if not run.future.done() and not expired:
+                # Never drop an in-flight run just to make room
+                break
+            self._runs.pop(key)
+
+    def lookup(self, key: str, fingerprint: str) -> Optional[_KeyedRun]:
+        """
+        Return the existing run for ``key``, or None if the caller should start one.
+
+        Raises:
+            IdempotencyConflict: If the key was used for a different request.
+        """
+        self._evict()
+        run = self._runs.get(key)
+        if run is None:
+            return None
+        if run.fingerprint != fingerprint:
+            self.stats["conflicts"] += 1
+            raise IdempotencyConflict(f"Idempotency key '{key}' was already used for a different purchase")
+        self.stats["replays" if run.future.done() else "joined"] += 1
+        return run
+
+    def begin(self, key: str, fingerprint: str, future: "asyncio.Future[List[PurchaseResult]]") -> None:
+        self._runs[key] = _KeyedRun(fingerprint=fingerprint, future=future)
+
+    def forget(self, key: str) -> None:
+        self._runs.pop(key, None)
+
+
+def request_fingerprint(items: List[str]) -> str:
+    """Hash of the purchased items, used to detect idempotency key reuse."""
+    return hashlib.sha256(json.dumps(items, separators=(",", ":")).encode()).hexdigest()
+
+
+class PurchasePipeline:
+    """Runs a purchase's items concurrently against a provider, with idempotency."""
+
+    def __init__(
+        self,
+        provider: PurchaseProvider,
+        concurrency: int = 4,
+        item_timeout: float = 30,
+        store: Optional[IdempotencyStore] = None,
+    ):
+        self.provider = provider
+        self.concurrency = max(1, concurrency)
+        self.item_timeout = item_timeout
+        self.store = store or IdempotencyStore()
+
+    @classmethod
+    def from_env(cls) -> "PurchasePipeline":
+        return cls(
+            provider=create_provider(),
+            concurrency=int(os.getenv("PURCHASE_CONCURRENCY", "4")),
+            item_timeout=float(os.getenv("PURCHASE_ITEM_TIMEOUT", "30")),
+            store=IdempotencyStore.from_env(),
+        )
+
+    async def _purchase_one(self, semaphore: asyncio.Semaphore, item: str, item_key: str) -> PurchaseResult:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self.provider.purchase(item, item_key), self.item_timeout)
+            except asyncio.TimeoutError:
+                result = PurchaseResult(item=item, success=False, error=f"Timed out after {self.item_timeout}s")
+            except Exception as e:
+                logger.warning("Purchase of %s via %s failed: %s", item, self.provider.name, e)
+                result = PurchaseResult(item=item, success=False, error=str(e))
+            result.elapsed_ms = (time.perf_counter() - start) * 1000
+            return result
+
+    async def _run_items(self, items: List[str], key: str) -> List[PurchaseResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return list(await asyncio.gather(*(
+            self._purchase_one(semaphore, item, f"{key}:{index}")
+            for index, item in enumerate(items)
+        )))
+
+    async def run(self, items: List[str], idempotency_key: Optional[str] = None) -> tuple[List[PurchaseResult], bool]:
+        """
+        Purchase ``items``, or return the stored result for a repeated key.
+
+        Args:
+            items: Product identifiers to purchase.
+            idempotency_key: Optional client-supplied key. Without one every call
+                purchases again.
+
+        Returns:
+            (results in item order, whether the results were replayed from a previous request)
+
+        Raises:
+            IdempotencyConflict: If the key was used for different items.
+        """
+        if not idempotency_key:
+            return await self._run_items(items, uuid.uuid4().hex), False
+
+        fingerprint = request_fingerprint(items)
+        existing = self.store.lookup(idempotency_key, fingerprint)
+        if existing is not None:
+            # shield: a disconnecting retry must not cancel the shared run
+            return await asyncio.shield(existing.future), True
+
+        # The purchase runs as its own task so a client disconnecting mid-way does
+        # not abandon half-bought items; a retry with the same key picks it up
+        task = asyncio.ensure_future(self._run_items(items, idempotency_key))
+        self.store.begin(idempotency_key, fingerprint, task)
+        task.add_done_callback(
+            lambda t: self.store.forget(idempotency_key) if t.cancelled() or t.exception() else None
+        )
+        return await asyncio.shield(task), False
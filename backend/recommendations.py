@@ -0,0 +1,605 @@
+"""
+"Frequently bought together" from an item-item co-occurrence matrix.
+
+Every checkout basket (``/checkout`` line items) and every cart session
+(``/cart/events``) is folded into a sparse co-occurrence matrix as it arrives:
+item counts, pair counts and the number of baskets. For each item touched by a
+basket, its neighbor list (the RECS_TOP_K best co-occurring items) is recomputed
+from its row of the matrix, so ``related`` only reads a precomputed list and
+never scans the matrix: answering is O(k) regardless of catalog size.
+
+Scores are normalized so popular items don't top every list:
+    lift     c(i,j) * N / (c(i) * c(j))   how much more often than chance the pair occurs
+    cosine   c(i,j) / sqrt(c(i) * c(j))
+Pairs seen fewer than RECS_MIN_COOCCURRENCE times are ignored as noise.
+
+Checkout baskets weigh 1; cart sessions (items added to one cart within
+RECS_SESSION_TTL) weigh RECS_CART_WEIGHT since they are weaker evidence. A
+checkout is recorded once at least one store checkout succeeds; when it carries
+the cart session it came from, that session's cart-weight contribution is taken
+back out and later checkouts of the same session are ignored.
+
+Memory is bounded: each item keeps its RECS_MAX_ROW strongest partners and the
+matrix its RECS_MAX_ITEMS most frequent items (cart events are unauthenticated,
+so product IDs are arbitrary input).
+
+State lives in memory, loaded from RECS_SNAPSHOT_PATH at startup and saved every
+RECS_SAVE_INTERVAL seconds and on shutdown. A save merges only the changes since
+the previous one into the file, under a lock on ``<path>.lock``, then reloads
+it, so several workers can share one snapshot without overwriting each other.
+Both event kinds are also logged to the analytics ``user_events`` collection,
+from which the matrix can be rebuilt offline (replacing the snapshot):
+
+    python recommendations.py rebuild [--days 90]
+
+Configuration (environment):
+    RECS_METRIC               lift or cosine (default lift)
+    RECS_TOP_K                Neighbors kept per item (default 20)
+    RECS_MIN_COOCCURRENCE     Minimum pair weight to recommend (default 2)
+    RECS_MAX_BASKET           Items per basket considered; larger ones are truncated (default 50)
+    RECS_MAX_ITEMS            Items kept in the matrix; the rarest are pruned past this (default 50000)
+    RECS_MAX_ROW              Partners kept per item; the weakest are pruned (default 500)
+    RECS_CART_WEIGHT          Weight of a cart session relative to a checkout (default 0.5)
+    RECS_SESSION_TTL          Seconds a cart session stays open (default 3600)
+    RECS_MAX_PRODUCTS         Product details remembered for responses (default 20000)
+    RECS_SNAPSHOT_PATH        Snapshot file (default recommendations.json; empty = no persistence)
+    RECS_SAVE_INTERVAL        Seconds between saves (default 300; 0 = only on shutdown)
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import tempfile
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app_logging import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers sharing a snapshot aren't serialized
+    fcntl = None
+
+logger = get_logger(__name__)
+
+
+CHECKOUT_EVENT = "checkout_initiated"
+CART_ADD_EVENT = "cart_add"
+CART_REMOVE_EVENT = "cart_remove"
+
+PRODUCT_FIELDS = ("id", "title", "price", "image_url", "url")
+
+
+def item_key(product_id: Optional[str] = None, store_domain: Optional[str] = None, variant_id: Any = None) -> Optional[str]:
+    """Product ID if known, else "store:variant" (what /checkout line items carry)."""
+    if product_id:
+        return str(product_id)
+    if store_domain and variant_id is not None:
+        return f"{store_domain}:{variant_id}"
+    return None
+
+
+# Weights at or below this are treated as zero (after retracting a cart basket)
+EPSILON = 1e-9
+
+
+class Delta:
+    """Changes to an index since its last save, merged into the snapshot file on the next one."""
+
+    def __init__(self):
+        self.baskets = 0.0
+        self.counts: Dict[str, float] = defaultdict(float)
+        self.pairs: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def __bool__(self) -> bool:
+        return bool(self.baskets or self.counts)
+
+    def merge(self, other: "Delta") -> None:
+        self.baskets += other.baskets
+        for item, weight in other.counts.items():
+            self.counts[item] += weight
+        for item, row in other.pairs.items():
+            for partner, weight in row.items():
+                self.pairs[item][partner] += weight
+
+    def apply_to(self, index: "CoOccurrenceIndex") -> None:
+        index.baskets += self.baskets
+        for item, weight in self.counts.items():
+            index.bump(item, weight)
+        for item, row in self.pairs.items():
+            for other, weight in row.items():
+                if item < other:
+                    index.bump_pair(item, other, weight)
+        index.refresh_all()
+
+
+class CoOccurrenceIndex:
+    """
+    Sparse co-occurrence counts with precomputed top-k neighbor lists.
+
+    Memory is bounded: rows keep at most ``max_row`` partners and the index at
+    most ``max_items`` items; past that the weakest entries are pruned.
+    """
+
+    def __init__(
+        self,
+        metric: str = "lift",
+        top_k: int = 20,
+        min_cooccurrence: float = 2,
+        max_basket: int = 50,
+        max_items: int = 50000,
+        max_row: int = 500,
+    ):
+        if metric not in ("lift", "cosine"):
+            raise ValueError(f"Unknown metric {metric!r} (expected lift or cosine)")
+        self.metric = metric
+        self.top_k = top_k
+        self.min_cooccurrence = min_cooccurrence
+        self.max_basket = max_basket
+        self.max_items = max_items
+        self.max_row = max_row
+        self.baskets = 0.0
+        self.counts: Dict[str, float] = defaultdict(float)
+        self.pairs: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.neighbors: Dict[str, List[str]] = {}
+        # Set by the Recommender to record what still has to be saved
+        self.journal: Optional[Delta] = None
+
+    def score(self, item: str, other: str, together: float) -> float:
+        ci, cj = self.counts.get(item, 0.0), self.counts.get(other, 0.0)
+        if not ci or not cj:
+            return 0.0
+        if self.metric == "lift":
+            return together * self.baskets / (ci * cj)
+        return together / math.sqrt(ci * cj)
+
+    def _refresh(self, item: str) -> None:
+        """Recompute ``item``'s neighbor list from its matrix row."""
+        row = self.pairs.get(item, {})
+        candidates = [(other, self.score(item, other, n)) for other, n in row.items() if n >= self.min_cooccurrence]
+        candidates.sort(key=lambda c: c[1], reverse=True)
+        if candidates:
+            self.neighbors[item] = [other for other, _ in candidates[:self.top_k]]
+        else:
+            self.neighbors.pop(item, None)
+
+    def refresh_all(self) -> None:
+        self.neighbors = {}
+        for item in list(self.pairs):
+            self._refresh(item)
+        self._prune()
+
+    def bump(self, item: str, weight: float) -> None:
+        count = self.counts[item] + weight
+        if count > EPSILON:
+            self.counts[item] = count
+        else:
+            self.counts.pop(item, None)
+
+    def bump_pair(self, item: str, other: str, weight: float) -> None:
+        for a, b in ((item, other), (other, item)):
+            together = self.pairs[a][b] + weight
+            if together > EPSILON:
+                self.pairs[a][b] = together
+            else:
+                self.pairs[a].pop(b, None)
+                if not self.pairs[a]:
+                    del self.pairs[a]
+
+    def _apply(self, basket: List[str], weight: float, new: Optional[str] = None) -> None:
+        """Add ``weight`` to the basket's counts and pairs (all pairs, or only those with ``new``)."""
+        journal = self.journal
+        for item in ([new] if new else basket):
+            self.bump(item, weight)
+            if journal is not None:
+                journal.counts[item] += weight
+        for index, item in enumerate(basket):
+            for other in ([new] if new else basket[index + 1:]):
+                if other == item:
+                    continue
+                self.bump_pair(item, other, weight)
+                if journal is not None:
+                    journal.pairs[item][other] += weight
+                    journal.pairs[other][item] += weight
+
+    def _add_baskets(self, weight: float) -> None:
+        self.baskets += weight
+        if self.journal is not None:
+            self.journal.baskets += weight
+
+    def add_basket(self, items: Iterable[str], weight: float = 1.0) -> None:
+        """Fold one basket in (duplicates count once); a negative weight takes one back out."""
+        basket = list(dict.fromkeys(i for i in items if i))[:self.max_basket]
+        if not basket:
+            return
+        self._add_baskets(weight)
+        self._apply(basket, weight)
+        for item in basket:
+            self._refresh(item)
+        self._prune()
+
+    def extend_basket(self, basket: Set[str], item: str, weight: float) -> None:
+        """Add ``item`` to an open basket already folded in (cart sessions grow one item at a time)."""
+        if not item or item in basket or len(basket) >= self.max_basket:
+            return
+        if not basket:
+            self._add_baskets(weight)
+        self._apply(sorted(basket), weight, new=item)
+        basket.add(item)
+        for touched in basket:
+            self._refresh(touched)
+        self._prune()
+
+    def _prune(self) -> None:
+        """Drop the weakest partners of oversized rows, then the rarest items past ``max_items``."""
+        stale: Set[str] = set()
+        for item in [i for i, row in self.pairs.items() if len(row) > self.max_row]:
+            row = self.pairs[item]
+            for other in sorted(row, key=row.get)[:len(row) - self.max_row]:
+                self.bump_pair(item, other, -row[other])
+                stale.update((item, other))
+        if len(self.counts) > self.max_items:
+            # Prune well below the cap so this doesn't run on every basket
+            keep = int(self.max_items * 0.9)
+            for item in sorted(self.counts, key=self.counts.get)[:len(self.counts) - keep]:
+                for other in list(self.pairs.get(item, {})):
+                    self.bump_pair(item, other, -self.pairs[item][other])
+                    stale.add(other)
+                del self.counts[item]
+                self.neighbors.pop(item, None)
+                stale.discard(item)
+        for item in stale:
+            self._refresh(item)
+
+    def related(self, item: str, k: int = 10) -> List[Tuple[str, float, float]]:
+        """
+        Top ``k`` neighbors of ``item`` as (item, score, co-occurrence weight).
+
+        Scores are recomputed from current counts for the precomputed list only,
+        so the cost does not depend on how many items or baskets there are.
+        """
+        row = self.pairs.get(item, {})
+        scored = [(other, self.score(item, other, row.get(other, 0.0)), row.get(other, 0.0))
+                  for other in self.neighbors.get(item, [])]
+        scored.sort(key=lambda s: s[1], reverse=True)
+        return scored[:k]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "metric": self.metric,
+            "baskets": self.baskets,
+            "counts": dict(self.counts),
+            "pairs": {item: dict(row) for item, row in self.pairs.items()},
+        }
+
+    def load_dict(self, data: Dict[str, Any]) -> None:
+        self.baskets = float(data.get("baskets", 0))
+        self.counts = defaultdict(float, data.get("counts", {}))
+        self.pairs = defaultdict(lambda: defaultdict(float))
+        for item, row in data.get("pairs", {}).items():
+            self.pairs[item] = defaultdict(float, row)
+        self.refresh_all()
+
+    def empty_copy(self) -> "CoOccurrenceIndex":
+        return CoOccurrenceIndex(self.metric, self.top_k, self.min_cooccurrence, self.max_basket, self.max_items, self.max_row)
+
+
+class Recommender:
+    """Co-occurrence index fed by checkouts and cart sessions, with product details for responses."""
+
+    def __init__(
+        self,
+        index: Optional[CoOccurrenceIndex] = None,
+        cart_weight: float = 0.5,
+        session_ttl: float = 3600,
+        max_products: int = 20000,
+        snapshot_path: Optional[str] = None,
+        save_interval: float = 300,
+    ):
+        self.index = index or CoOccurrenceIndex()
+        self.index.journal = Delta()
+        self.cart_weight = cart_weight
+        self.session_ttl = session_ttl
+        self.max_products = max_products
+        self.snapshot_path = snapshot_path
+        self.save_interval = save_interval
+        self.products: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._sessions: OrderedDict[str, Tuple[Set[str], float]] = OrderedDict()
+        # Cart sessions that already checked out (a retried checkout isn't counted again)
+        self._checked_out: OrderedDict[str, float] = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"checkouts": 0, "duplicate_checkouts": 0, "cart_events": 0, "saves": 0}
+
+    @classmethod
+    def from_env(cls) -> "Recommender":
+        return cls(
+            index=CoOccurrenceIndex(
+                metric=os.getenv("RECS_METRIC", "lift"),
+                top_k=int(os.getenv("RECS_TOP_K", "20")),
+                min_cooccurrence=float(os.getenv("RECS_MIN_COOCCURRENCE", "2")),
+                max_basket=int(os.getenv("RECS_MAX_BASKET", "50")),
+                max_items=int(os.getenv("RECS_MAX_ITEMS", "50000")),
+                max_row=int(os.getenv("RECS_MAX_ROW", "500")),
+            ),
+            cart_weight=float(os.getenv("RECS_CART_WEIGHT", "0.5")),
+            session_ttl=float(os.getenv("RECS_SESSION_TTL", "3600")),
+            max_products=int(os.getenv("RECS_MAX_PRODUCTS", "20000")),
+            snapshot_path=os.getenv("RECS_SNAPSHOT_PATH", "recommendations.json") or None,
+            save_interval=float(os.getenv("RECS_SAVE_INTERVAL", "300")),
+        )
+
+    def remember_product(self, product: Optional[Dict[str, Any]]) -> None:
+        if not product or not product.get("id"):
+            return
+        key = str(product["id"])
+        self.products[key] = {k: product[k] for k in PRODUCT_FIELDS if product.get(k) is not None}
+        self.products.move_to_end(key)
+        while len(self.products) > self.max_products:
+            self.products.popitem(last=False)
+
+    def _expire(self, now: float) -> None:
+        """Drop idle cart sessions and old checkout markers (oldest first)."""
+        while self._sessions:
+            _, (_, last_seen) = next(iter(self._sessions.items()))
+            if now - last_seen <= self.session_ttl:
+                break
+            self._sessions.popitem(last=False)
+        while self._checked_out and now - next(iter(self._checked_out.values())) > self.session_ttl:
+            self._checked_out.popitem(last=False)
+
+    def observe_checkout(self, items: List[str], session_id: Optional[str] = None, now: Optional[float] = None) -> bool:
+        """
+        Fold a successful checkout's basket in.
+
+        If the basket came from a cart session, the session's cart-weight
+        contribution is taken back out first, so the basket ends up counted
+        once, at checkout weight. A session that already checked out is
+        ignored (a retried checkout).
+
+        Returns:
+            False if the basket was skipped as a duplicate.
+        """
+        now = time.time() if now is None else now
+        self._expire(now)
+        if session_id and session_id in self._checked_out:
+            self.stats["duplicate_checkouts"] += 1
+            return False
+        self.stats["checkouts"] += 1
+        if session_id:
+            basket, _ = self._sessions.pop(session_id, (set(), now))
+            if basket:
+                self.index.add_basket(sorted(basket), -self.cart_weight)
+            self._checked_out[session_id] = now
+        self.index.add_basket(items, 1.0)
+        return True
+
+    def observe_cart(self, session_id: str, event: str, item: str, product: Optional[Dict[str, Any]] = None, now: Optional[float] = None) -> None:
+        """
+        Fold a cart event into the session's basket.
+
+        Removing an item closes nothing and undoes nothing: the pair was still
+        considered together. It only stops later additions pairing with it.
+        """
+        now = time.time() if now is None else now
+        self.stats["cart_events"] += 1
+        self.remember_product(product)
+        self._expire(now)
+        if session_id in self._checked_out:
+            return
+
+        basket, _ = self._sessions.pop(session_id, (set(), now))
+        if event == CART_ADD_EVENT:
+            self.index.extend_basket(basket, item, self.cart_weight)
+        elif event == CART_REMOVE_EVENT:
+            basket.discard(item)
+        self._sessions[session_id] = (basket, now)
+
+    def related(self, items: List[str], k: int = 10) -> List[Dict[str, Any]]:
+        """
+        Items bought with any of ``items`` (a cart), best first, excluding ``items`` themselves.
+
+        Each input contributes its precomputed neighbor list; scores of items
+        related to several inputs are summed.
+        """
+        scores: Dict[str, float] = defaultdict(float)
+        together: Dict[str, float] = defaultdict(float)
+        for item in items:
+            for other, score, weight in self.index.related(item, k):
+                scores[other] += score
+                together[other] += weight
+        exclude = set(items)
+        ranked = sorted((i for i in scores if i not in exclude), key=lambda i: scores[i], reverse=True)[:k]
+        return [
+            {"id": i, **self.products.get(i, {}), "score": round(scores[i], 4), "cooccurrences": round(together[i], 2)}
+            for i in ranked
+        ]
+
+    def _read_snapshot(self) -> Optional[Dict[str, Any]]:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable recommendations snapshot %s: %s", self.snapshot_path, e)
+            return None
+
+    def _write_snapshot(self, data: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.snapshot_path)
+
+    def _reload(self, data: Dict[str, Any]) -> None:
+        """Replace the in-memory state with snapshot ``data``, keeping changes not saved yet."""
+        pending = self.index.journal
+        self.index.journal = None
+        self.index.load_dict(data.get("index", {}))
+        pending.apply_to(self.index)
+        self.index.journal = pending
+        for product in data.get("products", []):
+            if str(product.get("id")) not in self.products:
+                self.remember_product(product)
+
+    def load(self) -> bool:
+        """Load the snapshot, if there is one."""
+        data = self._read_snapshot()
+        if data is None:
+            return False
+        self._reload(data)
+        logger.info("Loaded recommendations: %d items, %.0f baskets", len(self.index.counts), self.index.baskets)
+        return True
+
+    def _merge(self, delta: Delta, products: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Add ``delta`` to the snapshot on disk and return the merged snapshot.
+
+        Workers sharing a snapshot each add only their own unsaved changes,
+        under a file lock, so nothing is counted twice or overwritten.
+        """
+        with _snapshot_lock(self.snapshot_path):
+            data = self._read_snapshot() or {}
+            merged = self.index.empty_copy()
+            merged.load_dict(data.get("index", {}))
+            delta.apply_to(merged)
+            by_id = {str(p.get("id")): p for p in data.get("products", [])}
+            by_id.update((str(p["id"]), p) for p in products)
+            data = {"index": merged.to_dict(), "products": list(by_id.values())[-self.max_products:]}
+            self._write_snapshot(data)
+        return data
+
+    def _take_delta(self) -> Tuple[Delta, List[Dict[str, Any]]]:
+        delta, self.index.journal = self.index.journal, Delta()
+        return delta, list(self.products.values())
+
+    def save(self) -> None:
+        """Merge unsaved changes into the snapshot (blocking; see ``persist``)."""
+        if not self.snapshot_path:
+            return
+        delta, products = self._take_delta()
+        self._reload(self._merge(delta, products))
+        self.stats["saves"] += 1
+
+    def save_all(self) -> None:
+        """Overwrite the snapshot with the whole in-memory state (used by rebuilds)."""
+        if not self.snapshot_path:
+            return
+        self.index.journal = Delta()
+        with _snapshot_lock(self.snapshot_path):
+            self._write_snapshot({"index": self.index.to_dict(), "products": list(self.products.values())})
+
+    async def persist(self) -> None:
+        """Merge unsaved changes into the snapshot from a worker thread, then pick up other workers' changes."""
+        if not self.snapshot_path or not self.index.journal:
+            return
+        delta, products = self._take_delta()
+        try:
+            data = await asyncio.to_thread(self._merge, delta, products)
+        except Exception:
+            # Keep the changes for the next attempt
+            self.index.journal.merge(delta)
+            raise
+        self._reload(data)
+        self.stats["saves"] += 1
+
+    def start(self) -> None:
+        """Save every RECS_SAVE_INTERVAL seconds, so a crash loses at most one interval."""
+        if self.snapshot_path and self.save_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._save_loop(), name="recommendations-save")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.persist()
+
+    async def _save_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.save_interval)
+            try:
+                await self.persist()
+            except Exception as e:
+                logger.warning("Saving recommendations failed: %s", e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "metric": self.index.metric,
+            "items": len(self.index.counts),
+            "items_with_neighbors": len(self.index.neighbors),
+            "baskets": self.index.baskets,
+            "open_cart_sessions": len(self._sessions),
+            **self.stats,
+        }
+
+
+@contextmanager
+def _snapshot_lock(path: str):
+    """Exclusive lock on ``<path>.lock`` across processes (no-op where fcntl is unavailable)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def replay_events(recommender: Recommender, events: Iterable[Dict[str, Any]]) -> int:
+    """Fold analytics events (oldest first) into ``recommender``; returns how many were used."""
+    used = 0
+    for event in events:
+        data = event.get("data") or {}
+        kind = event.get("event_type")
+        if kind == CHECKOUT_EVENT and data.get("items"):
+            recommender.observe_checkout([str(i) for i in data["items"]], data.get("session_id"))
+        elif kind in (CART_ADD_EVENT, CART_REMOVE_EVENT) and data.get("product_id"):
+            at = event.get("timestamp")
+            now = at.replace(tzinfo=datetime.timezone.utc).timestamp() if isinstance(at, datetime.datetime) else None
+            session = data.get("session_id") or event.get("user_id") or ""
+            recommender.observe_cart(session, kind, str(data["product_id"]), data.get("product"), now=now)
+        else:
+            continue
+        used += 1
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild recommendations from the analytics events")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("rebuild", help="Replay user_events into a fresh snapshot")
+    rebuild.add_argument("--days", type=float, default=0, help="Only events from the last N days (default: all)")
+    args = parser.parse_args()
+
+    from database import get_database
+
+    db = get_database()
+    if db is None:
+        raise SystemExit("MongoDB unavailable (check MONGODB_URI)")
+
+    query: Dict[str, Any] = {"event_type": {"$in": [CHECKOUT_EVENT, CART_ADD_EVENT, CART_REMOVE_EVENT]}}
+    if args.days:
+        query["timestamp"] = {"$gte": datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=args.days)}
+
+    recommender = Recommender.from_env()
+    started = time.perf_counter()
+    used = replay_events(recommender, db["user_events"].find(query).sort("timestamp", 1))
+    recommender.save_all()
+    print(json.dumps({
+        "events": used,
+        "seconds": round(time.perf_counter() - started, 2),
+        "snapshot": recommender.snapshot_path,
+        **recommender.snapshot(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Compact JSON responses.
+
+- ``dumps`` encodes with orjson when it is installed (falling back to the
+  standard library), without whitespace
+- ``FastJSONResponse`` is the app's default response class, built on ``dumps``
+- ``json_response`` additionally negotiates ``Content-Encoding`` from the
+  request's ``Accept-Encoding`` (brotli when the ``brotli`` package is
+  installed, else gzip) for bodies worth compressing
+- ``select_fields`` implements the ``fields=`` selector for item lists
+
+Streaming responses (NDJSON, SSE) are not compressed here: buffering them for
+a compressor would defeat streaming.
+
+Configuration (environment):
+    RESPONSE_COMPRESS_MIN_BYTES   Smallest body that is compressed (default 1024)
+    RESPONSE_GZIP_LEVEL           gzip level (default 5)
+    RESPONSE_BROTLI_QUALITY       brotli quality (default 4)
+"""
+
+import gzip
+import json
+import os
+from typing import Any, Iterable, List, Mapping, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by ``dumps``."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the response encoding for an ``Accept-Encoding`` header.
+
+    Returns:
+        "br", "gzip", or None for an uncompressed response.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    def allowed(name: str) -> bool:
+        return accepted.get(name, accepted.get("*", 0.0)) > 0
+
+    if brotli is not None and allowed("br"):
+        return "br"
+    if allowed("gzip"):
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def json_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Compact JSON response, compressed when the client accepts it and the body is large enough."""
+    body = dumps(content)
+    response_headers = dict(headers or {})
+    response_headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        response_headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=response_headers)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Split a ``fields=`` value ("id,title,price") into names; None or empty selects everything."""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    return names or None
+
+
+def select_fields(items: Iterable[Any], fields: Optional[List[str]]) -> List[Any]:
+    """Keep only ``fields`` of each dict item (other values pass through unchanged)."""
+    if not fields:
+        return list(items)
+    return [
+        {k: item[k] for k in fields if k in item} if isinstance(item, dict) else item
+        for item in items
+    ]
@@ -0,0 +1,273 @@
+"""
+Server-side search result sets with cursor pagination.
+
+Each ``/search`` creates a ``ResultSet``: the agent's items are its first page,
+and the catalog call the agent made (tool name + arguments) is remembered so
+more items can be pulled without another LLM round trip. The first "load more"
+asks the catalog for RESULT_SET_CHUNK items at once, so the pages after it are
+answered from memory. When a client pages past what is cached, the set asks the
+catalog for another chunk (a larger ``limit``; items already in the set are
+skipped) until the catalog has nothing new or RESULT_SET_MAX_ITEMS is reached.
+RESULT_SET_PREFETCH=1 fetches the first chunk right after every search instead,
+trading a second catalog call per search for a faster first "load more".
+
+Catalog fetches go through the agent's LangChain tool, so they share the
+tool-result cache, the output reducer (items come back in the same
+title/price/description/url/id/image_url shape as the agent's answer) and the
+MCP health/breaker logic.
+
+Cursors are opaque strings encoding (set id, offset); a set expires RESULT_SET_TTL
+seconds after it was last used. Sets live in the memory of the worker process
+that ran the search: with several workers and no sticky routing, a cursor that
+reaches another worker gets 410 and the client has to search again.
+
+Configuration (environment):
+    RESULT_SET_TTL          Seconds an idle result set is kept (default 600)
+    RESULT_SET_MAX          Max result sets kept in memory, LRU (default 1000)
+    RESULT_SET_CHUNK        Items requested from the catalog per fetch (default 50)
+    RESULT_SET_MAX_ITEMS    Never hold more than this many items per set (default 250)
+    RESULT_SET_PREFETCH     1 to fetch the first chunk right after the search; 0 waits
+                            until a client asks for the second page (default 0)
+"""
+
+import asyncio
+import base64
+import binascii
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app_logging import get_logger
+from tool_reducers import ToolReducer, find_items
+
+logger = get_logger(__name__)
+
+
+SEARCH_TOOL = "search_global_products"
+
+# (tool name, arguments) -> items
+Fetcher = Callable[[str, Dict[str, Any]], Awaitable[List[Dict[str, Any]]]]
+
+
+class ResultSetExpired(LookupError):
+    """The cursor's result set is unknown or has expired."""
+
+
+class InvalidCursor(ValueError):
+    """The cursor could not be decoded."""
+
+
+def encode_cursor(set_id: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{set_id}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        set_id, offset = raw.rsplit(":", 1)
+        return set_id, max(0, int(offset))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Malformed cursor")
+
+
+def parse_tool_items(output: Any) -> List[Dict[str, Any]]:
+    """Items from a catalog tool's (usually reduced) text output."""
+    try:
+        data = json.loads(output) if isinstance(output, str) else output
+    except (json.JSONDecodeError, TypeError):
+        return []
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    # Reduction disabled: project the raw products ourselves
+    reducer = ToolReducer()
+    return [reducer.project(item) for item in find_items(data) or []]
+
+
+def agent_tool_fetcher(agent) -> Fetcher:
+    """Fetch items by invoking one of the agent's catalog tools directly."""
+
+    async def fetch(tool_name: str, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        tool = next((t for t in agent.tools if t.name == tool_name), None)
+        if tool is None:
+            raise LookupError(f"Tool {tool_name} is not loaded")
+        output = await tool.ainvoke(args)
+        if isinstance(output, str) and output.startswith("Error calling tool"):
+            raise RuntimeError(output)
+        return parse_tool_items(output)
+
+    return fetch
+
+
+def _item_key(item: Dict[str, Any]) -> Any:
+    return item.get("id") or item.get("url") or item.get("title")
+
+
+class ResultSet:
+    """One search's items, extended lazily from the catalog."""
+
+    def __init__(self, query: str, items: List[Dict[str, Any]], tool_name: str, tool_args: Dict[str, Any], ttl: float):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.tool_name = tool_name
+        self.tool_args = {k: v for k, v in tool_args.items() if k != "limit"}
+        self.items: List[Dict[str, Any]] = []
+        self._seen = set()
+        self.requested = 0  # Largest limit asked of the catalog so far
+        self.exhausted = False
+        self.ttl = ttl
+        self.expires_at = time.monotonic() + ttl
+        self.fetches = 0
+        self._lock = asyncio.Lock()
+        self.add(items)
+
+    def add(self, items: List[Dict[str, Any]]) -> int:
+        added = 0
+        for item in items:
+            key = _item_key(item)
+            if key is None or key in self._seen:
+                continue
+            self._seen.add(key)
+            self.items.append(item)
+            added += 1
+        return added
+
+    def touch(self) -> None:
+        self.expires_at = time.monotonic() + self.ttl
+
+    async def extend(self, fetch: Fetcher, needed: int, chunk: int, max_items: int) -> None:
+        """Fetch from the catalog until ``needed`` items are cached, the catalog runs dry or the cap is hit."""
+        async with self._lock:
+            while len(self.items) < needed and not self.exhausted:
+                limit = min(max(self.requested, len(self.items)) + chunk, max_items)
+                if limit <= self.requested:
+                    self.exhausted = True
+                    break
+                self.requested = limit
+                self.fetches += 1
+                items = await fetch(self.tool_name, {**self.tool_args, "limit": limit})
+                # A short answer (or nothing new) means the catalog has no more for this query
+                if not self.add(items) or len(items) < limit:
+                    self.exhausted = True
+
+
+class ResultSetStore:
+    """In-memory LRU of result sets."""
+
+    def __init__(self, ttl: float = 600, max_sets: int = 1000, chunk: int = 50, max_items: int = 250, prefetch: bool = False):
+        self.ttl = ttl
+        self.prefetch = prefetch
+        self.max_sets = max_sets
+        self.chunk = chunk
+        self.max_items = max_items
+        self._sets: OrderedDict[str, ResultSet] = OrderedDict()
+        self._prefetches: set = set()
+        self.stats = {"created": 0, "pages": 0, "expired": 0}
+
+    @classmethod
+    def from_env(cls) -> "ResultSetStore":
+        return cls(
+            ttl=float(os.getenv("RESULT_SET_TTL", "600")),
+            max_sets=int(os.getenv("RESULT_SET_MAX", "1000")),
+            chunk=int(os.getenv("RESULT_SET_CHUNK", "50")),
+            max_items=int(os.getenv("RESULT_SET_MAX_ITEMS", "250")),
+            prefetch=os.getenv("RESULT_SET_PREFETCH", "0") == "1",
+        )
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for set_id in [k for k, s in self._sets.items() if s.expires_at < now]:
+            del self._sets[set_id]
+            self.stats["expired"] += 1
+        while len(self._sets) > self.max_sets:
+            self._sets.popitem(last=False)
+
+    def create(
+        self,
+        query: str,
+        items: List[Dict[str, Any]],
+        tool_calls: Optional[List[Dict[str, Any]]] = None,
+        fetch: Optional[Fetcher] = None,
+    ) -> ResultSet:
+        """
+        Register a search's items (and start prefetching the next chunk if enabled).
+
+        Args:
+            query: The user's query (used when the agent's tool call is unknown).
+            items: The items already returned to the client, in order.
+            tool_calls: Tool calls the agent made during the search ({"name", "args"}).
+            fetch: Catalog fetcher; prefetching also needs one (and RESULT_SET_PREFETCH=1).
+        """
+        call = next((c for c in tool_calls or [] if c["name"].endswith(SEARCH_TOOL)), None)
+        tool_name, args = (call["name"], dict(call["args"])) if call else (SEARCH_TOOL, {"query": query})
+        result_set = ResultSet(query, items, tool_name, args, self.ttl)
+        self._sets[result_set.id] = result_set
+        self.stats["created"] += 1
+        self._evict()
+
+        if fetch is not None and self.prefetch:
+            task = asyncio.create_task(self._prefetch(result_set, fetch))
+            self._prefetches.add(task)
+            task.add_done_callback(self._prefetches.discard)
+        return result_set
+
+    async def _prefetch(self, result_set: ResultSet, fetch: Fetcher) -> None:
+        try:
+            await result_set.extend(fetch, len(result_set.items) + 1, self.chunk, self.max_items)
+        except Exception as e:
+            logger.warning("Prefetch for result set %s failed: %s", result_set.id, e)
+
+    def get(self, set_id: str) -> ResultSet:
+        result_set = self._sets.get(set_id)
+        if result_set is None or result_set.expires_at < time.monotonic():
+            raise ResultSetExpired("Result set expired; run the search again")
+        self._sets.move_to_end(set_id)
+        result_set.touch()
+        return result_set
+
+    async def page(self, cursor: str, limit: int, fetch: Fetcher) -> Dict[str, Any]:
+        """
+        Return the page at ``cursor``, fetching more from the catalog if needed.
+
+        Raises:
+            InvalidCursor: If the cursor is malformed.
+            ResultSetExpired: If its result set is gone.
+        """
+        set_id, offset = decode_cursor(cursor)
+        result_set = self.get(set_id)
+        self.stats["pages"] += 1
+
+        # One extra item tells us whether there is a next page
+        needed = offset + limit + 1
+        if len(result_set.items) < needed and not result_set.exhausted:
+            try:
+                await result_set.extend(fetch, needed, self.chunk, self.max_items)
+            except Exception as e:
+                # Serve what is cached; the client can retry the same cursor
+                logger.warning("Fetching more results for %s failed: %s", set_id, e)
+
+        items = result_set.items[offset:offset + limit]
+        end = offset + len(items)
+        has_more = end < len(result_set.items) or not result_set.exhausted
+        return {
+            "items": items,
+            "offset": offset,
+            "next_cursor": encode_cursor(set_id, end) if has_more and items else None,
+            "cached": len(result_set.items),
+            "exhausted": result_set.exhausted,
+        }
+
+    def first_page(self, result_set: ResultSet, returned: int) -> Dict[str, Any]:
+        """Cursor metadata for the page a search returned itself (its first ``returned`` items)."""
+        has_more = len(result_set.items) > returned or not result_set.exhausted
+        return {
+            "id": result_set.id,
+            "next_cursor": encode_cursor(result_set.id, returned) if has_more else None,
+            "expires_in": result_set.ttl,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        fetches = sum(s.fetches for s in self._sets.values())
+        return {"sets": len(self._sets), "live_set_fetches": fetches, **self.stats}
@@ -0,0 +1,351 @@
+"""
+Declared MongoDB schema: collections, indexes, TTL retention and capping.
+
+``declared_collections()`` lists every collection the backend reads or writes
+(``CHECKPOINT_COLLECTIONS`` the agent checkpointer's), with the
+indexes its queries rely on and its retention policy. ``apply_schema`` brings a
+database in line with it idempotently:
+
+- missing collections are created (capped ones with their size limit)
+- missing indexes are created
+- a TTL whose retention setting changed is updated in place (``collMod``)
+
+Anything it will not change on its own is reported as drift instead: indexes
+nobody declared, an index whose keys exist with other options, a collection
+that should (not) be capped. Fixing those means dropping or converting data,
+which is left to a person.
+
+``explain_hot_queries`` runs ``explain()`` on the queries that run on every
+request (history by user/timestamp, events by user/type, ...) and reports
+whether each one is answered from an index or needs a collection scan or an
+in-memory sort.
+
+The server applies the schema in the background at startup (SCHEMA_MODE);
+``init_db.py`` and ``python schema.py apply|check|explain`` run it by hand.
+
+Configuration (environment):
+    SCHEMA_MODE                       apply (default), check (report drift only) or off, at startup
+    SEARCH_HISTORY_RETENTION_DAYS     Days search history is kept (default 0 = forever)
+    USER_EVENTS_RETENTION_DAYS        Days analytics events are kept (default 0 = forever)
+    USER_EVENTS_CAPPED_MB             Cap user_events at this size instead (default 0 = not capped;
+                                      only applies when the collection is created)
+"""
+
+import argparse
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+DAY = 86400
+
+Keys = Sequence[Tuple[str, int]]
+
+
+@dataclass
+class IndexSpec:
+    keys: Keys
+    name: Optional[str] = None  # Default: MongoDB's generated name ("user_id_1_timestamp_-1")
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None
+
+    def __post_init__(self):
+        self.keys = [tuple(k) for k in self.keys]
+        if self.name is None:
+            self.name = "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+@dataclass
+class HotQuery:
+    """A query shape that runs on the request path and must be served by an index."""
+    name: str
+    filter: Dict[str, Any]
+    sort: Optional[Keys] = None
+    limit: int = 10
+
+
+@dataclass
+class CollectionSpec:
+    name: str
+    indexes: List[IndexSpec] = field(default_factory=list)
+    capped_bytes: int = 0
+    hot_queries: List[HotQuery] = field(default_factory=list)
+
+
+def _retention(env: str, default_days: int) -> Optional[int]:
+    days = float(os.getenv(env, str(default_days)))
+    return int(days * DAY) if days > 0 else None
+
+
+def _events_capped_bytes() -> int:
+    return int(float(os.getenv("USER_EVENTS_CAPPED_MB", "0")) * 1024 * 1024)
+
+
+def declared_collections() -> List[CollectionSpec]:
+    """The application collections (retention settings are read from the environment)."""
+    events_capped = _events_capped_bytes()
+    events_indexes = [
+        IndexSpec([("user_id", ASCENDING), ("event_type", ASCENDING), ("timestamp", DESCENDING)]),
+        # Per-user insight rebuilds (analytics.py) scan a user's events in time order
+        IndexSpec([("user_id", ASCENDING), ("timestamp", ASCENDING)]),
+    ]
+    events_ttl = _retention("USER_EVENTS_RETENTION_DAYS", 0)
+    if events_ttl and not events_capped:
+        # Capped collections cannot delete documents, so they get no TTL
+        events_indexes.append(IndexSpec([("timestamp", ASCENDING)], name="timestamp_ttl", expire_after_seconds=events_ttl))
+
+    history_indexes = [IndexSpec([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp_index")]
+    history_ttl = _retention("SEARCH_HISTORY_RETENTION_DAYS", 0)
+    if history_ttl:
+        history_indexes.append(IndexSpec([("timestamp", ASCENDING)], name="timestamp_ttl", expire_after_seconds=history_ttl))
+
+    return [
+        CollectionSpec(
+            "user_profiles",
+            [
+                IndexSpec([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+                IndexSpec([("email", ASCENDING)], name="email_index"),
+            ],
+            hot_queries=[HotQuery("profile_by_user", {"user_id": "u"}, limit=1)],
+        ),
+        CollectionSpec(
+            "search_history",
+            history_indexes,
+            hot_queries=[HotQuery("history_by_user_recent", {"user_id": "u"}, [("timestamp", DESCENDING)], limit=50)],
+        ),
+        # Keyed by _id = user_id
+        CollectionSpec("user_search_stats", hot_queries=[HotQuery("search_stats_by_user", {"_id": "u"}, limit=1)]),
+        CollectionSpec(
+            "user_events",
+            events_indexes,
+            capped_bytes=events_capped,
+            hot_queries=[
+                HotQuery("events_by_user_type", {"user_id": "u", "event_type": "search"}, [("timestamp", DESCENDING)]),
+                HotQuery("events_by_user_time", {"user_id": "u"}, [("timestamp", ASCENDING)], limit=1000),
+            ],
+        ),
+        CollectionSpec("user_insights", hot_queries=[HotQuery("insights_by_user", {"_id": "u"}, limit=1)]),
+    ]
+
+
+# Agent state (AGENT_CHECKPOINTER=mongo); ensured by MongoCheckpointStore when it is used
+CHECKPOINT_COLLECTIONS = [
+    CollectionSpec(
+        "agent_checkpoints",
+        [IndexSpec([("thread_id", ASCENDING), ("ns", ASCENDING), ("checkpoint_id", DESCENDING)], unique=True)],
+        hot_queries=[HotQuery("latest_checkpoint", {"thread_id": "t", "ns": ""}, [("checkpoint_id", DESCENDING)], limit=1)],
+    ),
+    CollectionSpec(
+        "agent_checkpoint_blobs",
+        [IndexSpec([("thread_id", ASCENDING), ("ns", ASCENDING), ("channel", ASCENDING), ("version", ASCENDING)], unique=True)],
+    ),
+    CollectionSpec(
+        "agent_checkpoint_writes",
+        [IndexSpec([("thread_id", ASCENDING), ("ns", ASCENDING), ("checkpoint_id", ASCENDING),
+                    ("task_id", ASCENDING), ("idx", ASCENDING)], unique=True)],
+    ),
+    CollectionSpec(
+        "agent_checkpoint_messages",
+        [IndexSpec([("thread_id", ASCENDING), ("ns", ASCENDING), ("gen", ASCENDING), ("seq", ASCENDING)], unique=True)],
+        hot_queries=[HotQuery("messages_in_order", {"thread_id": "t", "ns": "", "gen": 0}, [("seq", ASCENDING)], limit=100)],
+    ),
+]
+
+
+def _key_tuple(keys) -> Tuple[Tuple[str, Any], ...]:
+    return tuple((k, int(v) if isinstance(v, (int, float)) else v) for k, v in dict(keys).items())
+
+
+def _apply_collection(db, spec: CollectionSpec, fix: bool) -> Dict[str, List[str]]:
+    result: Dict[str, List[str]] = {"created": [], "updated": [], "drift": []}
+    infos = list(db.list_collections(filter={"name": spec.name}))
+
+    if not infos:
+        if not fix:
+            result["drift"].append("collection missing")
+        else:
+            try:
+                if spec.capped_bytes:
+                    db.create_collection(spec.name, capped=True, size=spec.capped_bytes)
+                else:
+                    db.create_collection(spec.name)
+                result["created"].append("collection" + (" (capped)" if spec.capped_bytes else ""))
+            except CollectionInvalid:
+                pass  # Created concurrently (another worker starting up)
+    else:
+        capped = bool(infos[0].get("options", {}).get("capped"))
+        if capped != bool(spec.capped_bytes):
+            result["drift"].append(f"collection is {'' if capped else 'not '}capped, declared {'capped' if spec.capped_bytes else 'uncapped'}")
+
+    collection = db[spec.name]
+    existing = {}
+    if infos or fix:
+        existing = {_key_tuple(info["key"]): info for info in collection.list_indexes()}
+
+    declared = set()
+    for index in spec.indexes:
+        key = _key_tuple(index.keys)
+        declared.add(key)
+        info = existing.get(key)
+        if info is None:
+            if not fix:
+                result["drift"].append(f"index {index.name} missing")
+                continue
+            options = {"name": index.name}
+            if index.unique:
+                options["unique"] = True
+            if index.expire_after_seconds is not None:
+                options["expireAfterSeconds"] = index.expire_after_seconds
+            collection.create_index(list(index.keys), **options)
+            result["created"].append(f"index {index.name}")
+            continue
+
+        if bool(info.get("unique")) != index.unique:
+            result["drift"].append(f"index {info['name']} unique={bool(info.get('unique'))}, declared {index.unique}")
+        ttl = info.get("expireAfterSeconds")
+        if ttl != index.expire_after_seconds:
+            if fix and ttl is not None and index.expire_after_seconds is not None:
+                db.command("collMod", spec.name, index={"name": info["name"], "expireAfterSeconds": index.expire_after_seconds})
+                result["updated"].append(f"index {info['name']} TTL {ttl}s -> {index.expire_after_seconds}s")
+            else:
+                result["drift"].append(f"index {info['name']} TTL {ttl}, declared {index.expire_after_seconds}")
+
+    for key, info in existing.items():
+        if key not in declared and info["name"] != "_id_":
+            result["drift"].append(f"undeclared index {info['name']}")
+    return result
+
+
+def apply_schema(db, collections: Optional[List[CollectionSpec]] = None, fix: bool = True) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Create what is missing and report drift.
+
+    Args:
+        db: pymongo Database.
+        collections: Specs to apply (default: ``declared_collections()``).
+        fix: False only reports what differs (nothing is created or changed).
+
+    Returns:
+        Per collection: {"created": [...], "updated": [...], "drift": [...]}.
+    """
+    report = {}
+    for spec in collections if collections is not None else declared_collections():
+        try:
+            report[spec.name] = _apply_collection(db, spec, fix)
+        except OperationFailure as e:
+            report[spec.name] = {"created": [], "updated": [], "drift": [f"error: {e}"]}
+    return report
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+    """(stage, index name) for every stage of an explain plan, top down."""
+    stages = [(plan.get("stage", "?"), plan.get("indexName"))]
+    children = []
+    if "queryPlan" in plan:  # Slot-based engine wraps the classic plan
+        children.append(plan["queryPlan"])
+    if "inputStage" in plan:
+        children.append(plan["inputStage"])
+    children.extend(plan.get("inputStages", []))
+    for child in children:
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+def explain_hot_queries(db, collections: Optional[List[CollectionSpec]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    ``explain()`` each declared hot query.
+
+    Returns:
+        Per query: its plan ("IXSCAN(user_timestamp_index) <- FETCH <- LIMIT"), whether an
+        index serves it, and whether it needs an in-memory (blocking) sort.
+    """
+    report = {}
+    present = set(db.list_collection_names())
+    for spec in collections if collections is not None else declared_collections() + CHECKPOINT_COLLECTIONS:
+        if spec.name not in present:
+            continue  # e.g. checkpoint collections when another checkpointer is configured
+        for query in spec.hot_queries:
+            cursor = db[spec.name].find(query.filter).limit(query.limit)
+            if query.sort:
+                cursor = cursor.sort(list(query.sort))
+            try:
+                plan = cursor.explain()["queryPlanner"]["winningPlan"]
+            except (OperationFailure, KeyError) as e:
+                report[query.name] = {"collection": spec.name, "error": str(e)}
+                continue
+            stages = _plan_stages(plan)
+            names = {stage for stage, _ in stages}
+            report[query.name] = {
+                "collection": spec.name,
+                "plan": " <- ".join(
+                    f"{stage}({index})" if index else stage for stage, index in reversed(stages)
+                ),
+                "index_supported": bool(names & {"IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_CLUSTERED_IXSCAN"})
+                and "COLLSCAN" not in names,
+                "in_memory_sort": bool(names & {"SORT", "SORT_KEY_GENERATOR"}),
+            }
+    return report
+
+
+def problems(schema_report: Dict[str, Dict[str, List[str]]], query_report: Optional[Dict[str, Dict[str, Any]]] = None) -> List[str]:
+    """Flatten reports into one line per drift item or unsupported hot query."""
+    lines = [f"{name}: {item}" for name, result in schema_report.items() for item in result["drift"]]
+    for name, result in (query_report or {}).items():
+        if "error" in result:
+            lines.append(f"{name}: explain failed: {result['error']}")
+        elif not result["index_supported"] or result["in_memory_sort"]:
+            lines.append(f"{name}: not index-served ({result['plan']})")
+    return lines
+
+
+def apply_from_env(db) -> None:
+    """Startup hook: apply or check the schema per SCHEMA_MODE and log the outcome."""
+    mode = os.getenv("SCHEMA_MODE", "apply").lower()
+    if mode == "off" or db is None:
+        return
+    try:
+        schema_report = apply_schema(db, fix=mode == "apply")
+        for name, result in schema_report.items():
+            for item in result["created"] + result["updated"]:
+                logger.info("Schema: %s: %s", name, item)
+        issues = problems(schema_report, explain_hot_queries(db))
+    except PyMongoError as e:
+        # E.g. the connection dropped after get_database(); the server runs on regardless
+        logger.error("Schema %s failed: %s", mode, e)
+        return
+    for issue in issues:
+        logger.warning("Schema drift: %s", issue)
+    if not issues:
+        logger.info("Schema: %d collections match the declared schema", len(schema_report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply or check the declared MongoDB schema")
+    parser.add_argument("command", choices=["apply", "check", "explain"])
+    args = parser.parse_args()
+
+    from database import get_database
+
+    db = get_database()
+    if db is None:
+        raise SystemExit("MongoDB unavailable (check MONGODB_URI)")
+
+    output: Dict[str, Any] = {}
+    if args.command in ("apply", "check"):
+        output["collections"] = apply_schema(db, fix=args.command == "apply")
+    output["queries"] = explain_hot_queries(db)
+    output["problems"] = problems(output.get("collections", {}), output["queries"])
+    print(json.dumps(output, indent=2, default=str))
+    raise SystemExit(1 if output["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
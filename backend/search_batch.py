@@ -0,0 +1,186 @@
+"""
+Many catalog searches in one request.
+
+``BatchSearcher`` runs the queries of a ``POST /search/batch`` request over the
+shared agent:
+- identical queries (case/whitespace-insensitive) run once; each requested entry
+  then gets its own limit and sort applied to the shared items
+- at most SEARCH_BATCH_CONCURRENCY queries of a batch run at once, and their LLM
+  calls are scheduled behind interactive traffic (llm_scheduler.BATCH)
+- every query runs on its own throwaway conversation thread, so concurrent
+  queries of one user do not interleave in the same checkpoint history
+- a query that fails or times out produces an error entry; the rest of the
+  batch carries on
+
+Results are yielded as each query finishes, which is what the NDJSON stream
+of the endpoint sends; a final summary line closes the batch.
+
+Configuration (environment):
+    SEARCH_BATCH_CONCURRENCY     Queries of one batch running at once (default 4)
+    SEARCH_BATCH_MAX_QUERIES     Max queries per batch (default 50)
+    SEARCH_BATCH_QUERY_TIMEOUT   Seconds one query may take (default 60)
+"""
+
+import asyncio
+import os
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List
+
+from app_logging import get_logger
+from dto.search import BatchSearchQuery
+from enums.sort import SortBy
+from llm_scheduler import BATCH
+from metrics import SEARCH_BATCH_QUERIES_TOTAL
+from util import search_products, extract_json_items
+
+logger = get_logger(__name__)
+
+
+_PRICE_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+def parse_price(item: Any) -> float | None:
+    """Numeric price of an agent-formatted item ("$12.50", 12.5 or {"amount": ...}), if any."""
+    price = item.get("price") if isinstance(item, dict) else None
+    if isinstance(price, dict):
+        price = price.get("amount")
+    if isinstance(price, (int, float)):
+        return float(price)
+    if isinstance(price, str):
+        match = _PRICE_RE.search(price.replace(",", ""))
+        if match:
+            return float(match.group(0))
+    return None
+
+
+def sort_and_limit(items: List[Any], sort_order: SortBy, limit: int) -> List[Any]:
+    """
+    Order and truncate one query's items.
+
+    Only PRICE can be applied to the agent's item schema (title, price, description,
+    url, id, image_url); other orders keep the agent's relevance order.
+    """
+    if sort_order == SortBy.PRICE:
+        priced = [(parse_price(item), i, item) for i, item in enumerate(items)]
+        # Items without a price go last, in their original order
+        priced.sort(key=lambda p: (p[0] is None, p[0] or 0.0, p[1]))
+        items = [item for _, _, item in priced]
+    return items[:limit]
+
+
+class BatchTooLarge(ValueError):
+    """The batch has more queries than SEARCH_BATCH_MAX_QUERIES."""
+
+
+class BatchSearcher:
+    """Runs a batch of searches with dedupe, bounded concurrency and per-query isolation."""
+
+    def __init__(self, concurrency: int = 4, max_queries: int = 50, query_timeout: float = 60):
+        self.concurrency = max(1, concurrency)
+        self.max_queries = max_queries
+        self.query_timeout = query_timeout
+
+    @classmethod
+    def from_env(cls) -> "BatchSearcher":
+        return cls(
+            concurrency=int(os.getenv("SEARCH_BATCH_CONCURRENCY", "4")),
+            max_queries=int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "50")),
+            query_timeout=float(os.getenv("SEARCH_BATCH_QUERY_TIMEOUT", "60")),
+        )
+
+    def check(self, queries: List[BatchSearchQuery]) -> None:
+        """
+        Raises:
+            BatchTooLarge: If the batch exceeds SEARCH_BATCH_MAX_QUERIES.
+        """
+        if len(queries) > self.max_queries:
+            raise BatchTooLarge(f"Batch has {len(queries)} queries; the limit is {self.max_queries}")
+
+    async def _run_query(self, agent, query: str, user_id: str, slots: asyncio.Semaphore) -> List[Any]:
+        thread_id = f"product_search_batch:{uuid.uuid4().hex}"
+        async with slots:
+            try:
+                res = await asyncio.wait_for(
+                    search_products(agent, query, user_id, thread_id=thread_id, priority=BATCH),
+                    self.query_timeout,
+                )
+            finally:
+                try:
+                    await agent.checkpointer.adelete_thread(thread_id)
+                except Exception as e:
+                    logger.debug("Could not drop batch thread %s: %s", thread_id, e)
+        items = extract_json_items(res)
+        if not isinstance(items, list):
+            raise ValueError("Agent response is not a JSON list")
+        return items
+
+    async def stream(self, agent, queries: List[BatchSearchQuery], user_id: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the batch and yield one result per requested query as it completes,
+        followed by a summary (``{"done": true, ...}``).
+
+        Result entries carry ``index`` (position in the request), ``id``, ``query``,
+        ``status`` ("ok" or "error"), ``items`` and, on failure, ``error``.
+        ``deduped`` marks entries answered by another entry's run.
+        """
+        self.check(queries)
+        started = time.perf_counter()
+
+        groups: Dict[str, List[int]] = {}
+        for index, q in enumerate(queries):
+            groups.setdefault(normalize_query(q.query), []).append(index)
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run_group(indexes: List[int]):
+            try:
+                return indexes, await self._run_query(agent, queries[indexes[0]].query, user_id, slots), None
+            except asyncio.TimeoutError:
+                return indexes, [], "Query timed out"
+            except Exception as e:
+                return indexes, [], f"{type(e).__name__}: {e}"
+
+        tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+        counts = {"ok": 0, "error": 0}
+        try:
+            for done in asyncio.as_completed(tasks):
+                indexes, items, error = await done
+                status = "error" if error else "ok"
+                if error:
+                    logger.warning("Batch query %r failed: %s", queries[indexes[0]].query, error)
+
+                for n, index in enumerate(indexes):
+                    q = queries[index]
+                    counts[status] += 1
+                    SEARCH_BATCH_QUERIES_TOTAL.labels("deduped" if n else status).inc()
+                    entry = {
+                        "index": index,
+                        "id": q.id,
+                        "query": q.query,
+                        "status": status,
+                        "items": sort_and_limit(items, q.sort_order, q.limit),
+                        "deduped": n > 0,
+                    }
+                    if error:
+                        entry["error"] = error
+                    yield entry
+        finally:
+            # Client went away (or the consumer stopped early): don't leave queries running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        yield {
+            "done": True,
+            "queries": len(queries),
+            "unique": len(groups),
+            "ok": counts["ok"],
+            "errors": counts["error"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
@@ -1,79 +1,135 @@
 import os
 import requests
 import re
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from enums.sort import SortBy
-from dto.search import SearchRequest
-from dto.purchase import PurchaseRequest, PurchaseResponse
-from util import search_products
-from database import add_search_history
+from dto.search import SearchRequest, BatchSearchRequest
+from dto.tryon import TryOnRequest
+from dto.recommendations import CartEvent
+from dto.purchase import PurchaseRequest, PurchaseResponse, PurchaseItemResult
+from purchase import PurchasePipeline, IdempotencyConflict
+from jobs import JobRunner, JobQueueFull
+from warmup import AgentWarmup
+from shopify_auth import ShopifyTokenManager, TOKEN_ENV_VAR
+from util import search_products, extract_json_items
+from search_batch import BatchSearcher, BatchTooLarge
+from responses import FastJSONResponse, json_response, dumps, parse_fields, select_fields
+from result_sets import ResultSetStore, ResultSetExpired, InvalidCursor, agent_tool_fetcher
+from prefetch import Prefetcher
+from image_proxy import ImageProxy, ImageProxyError, CACHE_CONTROL
+from tryon import TryOnService, TryOnUnavailable
+from recommendations import Recommender, item_key, CHECKOUT_EVENT, CART_ADD_EVENT, CART_REMOVE_EVENT
+from analytics import AsyncAnalyticsClient, SEARCH_EVENT
+from database import add_search_history, get_user_profile, get_database
+from schema import apply_from_env as apply_schema_from_env
 from profile_router import router as profile_router
-from time import sleep
-from random import random
-import json
+from metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    JSON_EXTRACT,
+    HISTORY_WRITE,
+    SEARCH_REQUESTS_TOTAL,
+    CHECKOUT_STAGE_SECONDS,
+    CHECKOUT_STORES_TOTAL,
+    PURCHASE_ITEMS_TOTAL,
+    IMAGE_PROXY_REQUESTS_TOTAL,
+    RECOMMENDATION_REQUESTS_TOTAL,
+)
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 import asyncio
 from mcp_agent import MCPLangGraphAgent
+from app_logging import configure_logging, get_logger, Truncated, RequestIdMiddleware
 
 load_dotenv()
 
-# Fetch fresh Shopify token on startup
-def fetch_shopify_token():
-    client_id = os.getenv("SHOPIFY_CLIENT_ID")
-    client_secret = os.getenv("SHOPIFY_CLIENT_SECRET")
-    
-    if not client_id or not client_secret:
-        print("⚠️  SHOPIFY_CLIENT_ID or SHOPIFY_CLIENT_SECRET missing. Skipping auto-fetch.")
-        return
+# Log records are written by a background thread, off the event loop
+configure_logging()
+logger = get_logger(__name__)
+
+# Catalog token: refreshed before it expires, and on demand when a tool call is rejected
+token_manager = ShopifyTokenManager.from_env()
+
+async def refresh_catalog_sessions():
+    # Rebuild only the MCP sessions whose headers carry the token
+    agent = getattr(app.state, "agent", None)
+    if agent and agent.mcp_client:
+        await agent.mcp_client.reconnect_servers_using_env(TOKEN_ENV_VAR)
+
+token_manager.add_listener(refresh_catalog_sessions)
+
+async def on_catalog_auth_error(server_name: str) -> bool:
+    return await token_manager.refresh()
+
+def set_agent(agent):
+    app.state.agent = agent
+
+def verify_agent(agent):
+    # MCPMultiClient skips servers it cannot reach, so an agent with no tools is not ready
+    if not agent.tools:
+        raise RuntimeError("No MCP tools loaded (catalog server unreachable?)")
+
+# Token refresh, MCP connections, tools and model are set up in the background;
+# the agent's routes answer 503 until it is ready
+warmup = AgentWarmup.from_env(
+    factory=lambda: MCPLangGraphAgent(
+        os.getenv("MCP_CONFIG_PATH", "servers_config.json"),
+        on_auth_error=on_catalog_auth_error,
+    ),
+    prepare=token_manager.ensure_fresh,
+    verify=verify_agent,
+    on_ready=set_agent,
+)
 
-    try:
-        print("🔄 Fetching new Shopify Access Token...")
-        resp = requests.post(
-            "https://api.shopify.com/auth/access_token",
-            json={
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "grant_type": "client_credentials"
-            },
-            timeout=10
-        )
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            token = data.get("access_token")
-            if token:
-                os.environ["SHOPIFY_ACCESS_TOKEN"] = token
-                print("✅ Successfully refreshed SHOPIFY_ACCESS_TOKEN")
-            else:
-                print("❌ Failed to parse access_token from response")
-        else:
-            print(f"❌ Failed to fetch token: {resp.status_code} {resp.text}")
-            
-    except Exception as e:
-        print(f"❌ Error fetching Shopify token: {e}")
+# Speculative searches on idle capacity (off unless PREFETCH_ENABLED=1)
+prefetcher = Prefetcher.from_env(lambda: getattr(app.state, "agent", None))
+
+# Product images fetched once into a disk cache, served with thumbnails (IMAGE_* env vars)
+image_proxy = ImageProxy.from_env()
+
+# Try-on images generated by background jobs, cached per photo + product (TRYON_* env vars)
+tryon_service = TryOnService.from_env(load_image=image_proxy.fetch)
+
+# Analytics events (user_events) and per-user rollups; disabled without MONGODB_URI
+analytics = AsyncAnalyticsClient()
+
+# Frequently-bought-together from checkouts and cart sessions (RECS_* env vars)
+recommender = Recommender.from_env()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 1. Try to fetch a fresh token first
-    fetch_shopify_token()
-
-    # 2. Initialize Agent immediately on startup
-    print("🚀 Pre-warming Agent Connection...")
-    # The agent will read os.environ["SHOPIFY_ACCESS_TOKEN"] which we just updated
-    app.state.agent = MCPLangGraphAgent("servers_config.json")
-    await app.state.agent.initialize()
-    print("✅ Agent Ready")
+    # The port is bound right away; routes that don't need the agent serve traffic during warm-up
+    # Collections, indexes and TTLs are brought in line with schema.py off the startup path (SCHEMA_MODE)
+    app.state.schema_task = asyncio.create_task(asyncio.to_thread(lambda: apply_schema_from_env(get_database())))
+    app.state.analytics_task = asyncio.create_task(analytics.initialize())
+    await asyncio.to_thread(recommender.load)
+    recommender.start()
+    warmup.start()
+    token_manager.start()
+    job_runner.start()
+    prefetcher.start()
+    tryon_service.start()
     
     yield
     
-    print("🛑 Cleaning up...")
-    if hasattr(app.state, "agent") and app.state.agent:
-        await app.state.agent.cleanup()
-
-app = FastAPI(lifespan=lifespan)
+    logger.info("🛑 Cleaning up...")
+    startup_tasks = [app.state.schema_task, app.state.analytics_task]
+    for task in startup_tasks:
+        task.cancel()
+    await asyncio.gather(*startup_tasks, return_exceptions=True)
+    await recommender.stop()
+    await analytics.cleanup()
+    await tryon_service.stop()
+    await image_proxy.stop()
+    await prefetcher.stop()
+    await job_runner.stop()
+    await token_manager.stop()
+    await warmup.stop()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Define which origins (frontends) are allowed
 origins = [
@@ -83,6 +139,9 @@ origins = [
     "https://www.trovato.tech",
 ]
 
+# Attach a correlation ID to every request (and every log record it produces)
+app.add_middleware(RequestIdMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,       # Allow these specific ports
@@ -100,100 +159,252 @@ class CheckoutItem(BaseModel):
     quantity: int = 1
     store_domain: str
     access_token: str | None = None
+    product_id: str | None = None
 
 class CheckoutRequest(BaseModel):
     items: list[CheckoutItem]
+    user_id: str = ""
+    # Cart session the items were added in (see /cart/events), so the basket isn't counted twice
+    session_id: str | None = None
 
 # Accessor for the eagerly initialized agent
 async def get_agent():
-    if not hasattr(app.state, "agent") or not app.state.agent:
-        raise HTTPException(503, "Agent not initialized (Startup failed?)")
-    return app.state.agent
+    agent = getattr(app.state, "agent", None)
+    if not agent:
+        raise HTTPException(
+            503,
+            f"Agent not ready ({warmup.state}, attempt {warmup.attempts})",
+            headers={"Retry-After": "5"},
+        )
+    return agent
+
+
+# Liveness: the process and its event loop are responsive
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+# MCP server health: breaker state, latency EWMA/p95, error rate and hedging per server
+@app.get("/mcp/health")
+async def mcp_health():
+    agent = getattr(app.state, "agent", None)
+    if not agent or not agent.mcp_client:
+        return JSONResponse(status_code=503, content={"servers": {}, "warmup": warmup.status()})
+    return {"servers": agent.mcp_client.health_snapshot()}
+
+
+# Readiness: the agent is initialized and can serve searches
+@app.get("/readyz")
+async def readyz():
+    ready = getattr(app.state, "agent", None) is not None
+    body = {"ready": ready, "warmup": warmup.status(), "catalog_token": token_manager.status()}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+# Expose backend metrics in the Prometheus text format
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# Server-side result sets behind /search cursors (RESULT_SET_* env vars)
+result_sets = ResultSetStore.from_env()
 
 # Search for items via the Shopify Catalog MCP Server
 @app.post("/search")
 async def search(
     req: SearchRequest,
+    request: Request,
     limit: int = Query(default=10, ge=1, le=100),
     sort_order: SortBy = Query(default=SortBy.RELEVANCE),
-    user_id: str = Query(default="")
+    user_id: str = Query(default=""),
+    fields: str | None = Query(default=None, description="Comma-separated item fields to return, e.g. id,title,price"),
+    debug: bool = Query(default=False, description="Include the raw agent text as agent_response"),
+    v: int = Query(default=1, ge=1, le=2, description="2 = items as a JSON array (with fields/thumb/result_set); 1 = legacy shape, items as a JSON string with agent_response"),
+    thumb: int | None = Query(default=None, ge=1, le=2048, description="Add thumbnail_url (proxied WebP of about this width) to each item"),
 ):
     agent = await get_agent()
-    print(f"Searching for: {req.query}")
+    logger.info("Searching for: %s", req.query)
+    # Foreground traffic always wins over speculative searches
+    prefetcher.preempt()
 
     # Pass user_id for history tracking if needed (though history is handled in util.py now?)
     # Let's clean up util.py's history implementation vs server.py's
     # For now, just call search_products
     try:
-        res = await search_products(agent, req.query, user_id)
-        print(f"Agent Response: {res}")
-        
-        # Robust JSON extraction
-        try:
-            # Try parsing directly first
-            data = json.loads(res.strip())
-        except json.JSONDecodeError:
-            # Fallback: Extract JSON array from text using regex
-            import re
-            match = re.search(r'\[.*\]', res, re.DOTALL)
-            if match:
-                json_str = match.group(0)
-                try:
-                    data = json.loads(json_str)
-                except json.JSONDecodeError:
-                     # Attempt to fix common trailing comma issues or markdown
-                     clean_str = json_str.replace("`", "").strip()
-                     data = json.loads(clean_str)
-            else:
-                 # Last resort: try to find just the JSON array start
-                 if "[" in res:
-                     start = res.find("[")
-                     end = res.rfind("]") + 1
-                     clean_str = res[start:end]
-                     data = json.loads(clean_str)
-                 else:
-                    raise ValueError("No JSON array found in response")
+        tool_calls = []
+        data = prefetcher.take(user_id, req.query)
+        if data is not None:
+            logger.info("Serving prefetched results for: %s", req.query)
+            res = dumps(data).decode("utf-8")
+        else:
+            res = await search_products(agent, req.query, user_id, tool_calls=tool_calls)
+            logger.debug("Agent Response: %s", Truncated(res))
+
+            with JSON_EXTRACT.time():
+                data = extract_json_items(res)
 
         if user_id:
             # Note: add_search_history might be redundant if util.py does it, 
             # but util.py only READS history currently. 
             # server.py ADDS history after successful response.
-            add_search_history(user_id, req.query)
-            
-        return {
-            "items": json.dumps(data, separators=(",", ":")),
-            "agent_response": res
+            # The history insert and search summary update are blocking round trips
+            with HISTORY_WRITE.time():
+                await asyncio.to_thread(add_search_history, user_id, req.query)
+
+        SEARCH_REQUESTS_TOTAL.labels("ok").inc()
+        # Feeds the user's insight rollup (recent/top queries, checkout conversion)
+        log_in_background(SEARCH_EVENT, user_id, {"query": req.query})
+        prefetcher.observe(user_id, req.query)
+        if v == 1:
+            return {
+                "items": dumps(data).decode("utf-8"),
+                "agent_response": res
+            }
+
+        if not isinstance(data, list):
+            raise ValueError("Agent response is not a JSON list")
+        # Keep the full answer server-side so "load more" pages from memory
+        page = data[:limit]
+        result_set = result_sets.create(req.query, data, tool_calls, fetch=agent_tool_fetcher(agent))
+        if thumb:
+            page = image_proxy.add_thumbnails(page, str(request.base_url), thumb)
+        body = {
+            "items": select_fields(page, parse_fields(fields)),
+            "result_set": result_sets.first_page(result_set, len(page)),
         }
+        if debug:
+            body["agent_response"] = res
+        return json_response(request, body)
 
     except Exception as e:
-        print(f"Search failed/parse error: {e}")
+        logger.warning("Search failed/parse error: %s", e)
+        SEARCH_REQUESTS_TOTAL.labels("error").inc()
         # Return empty list on failure, but log it
         return {
-            "items": "[]", 
+            "items": "[]" if v == 1 else [],
             "error": "Failed to parse JSON response from AI"
         }
 
 
+# Next page of a search's result set, served from memory and topped up from the catalog
+@app.get("/search/results")
+async def search_results(
+    request: Request,
+    cursor: str = Query(..., description="next_cursor from /search or a previous page"),
+    limit: int = Query(default=10, ge=1, le=100),
+    fields: str | None = Query(default=None, description="Comma-separated item fields to return, e.g. id,title,price"),
+    thumb: int | None = Query(default=None, ge=1, le=2048, description="Add thumbnail_url (proxied WebP of about this width) to each item"),
+):
+    agent = await get_agent()
+    try:
+        page = await result_sets.page(cursor, limit, agent_tool_fetcher(agent))
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ResultSetExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    if thumb:
+        page["items"] = image_proxy.add_thumbnails(page["items"], str(request.base_url), thumb)
+    page["items"] = select_fields(page["items"], parse_fields(fields))
+    return json_response(request, page)
+
+
+# Product image through the disk cache; w= picks a WebP thumbnail width (snapped to IMAGE_PROXY_WIDTHS)
+@app.get("/images")
+async def images(
+    request: Request,
+    url: str = Query(..., description="Original image URL (must be on IMAGE_PROXY_ALLOWED_HOSTS)"),
+    w: int | None = Query(default=None, ge=1, le=4096),
+):
+    try:
+        image, hit = await image_proxy.get(url, w)
+    except ImageProxyError as e:
+        IMAGE_PROXY_REQUESTS_TOTAL.labels("error").inc()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    # Cached files never change for a given url/width, so clients may keep them forever
+    etag = f'"{image.etag}"'
+    headers = {"Cache-Control": CACHE_CONTROL, "ETag": etag, "X-Image-Cache": "hit" if hit else "miss"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        IMAGE_PROXY_REQUESTS_TOTAL.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    IMAGE_PROXY_REQUESTS_TOTAL.labels("hit" if hit else "miss").inc()
+    return FileResponse(image.path, media_type=image.content_type, headers=headers)
+
+
+# Batch search (concurrency, size and timeout settings come from SEARCH_BATCH_* env vars)
+batch_searcher = BatchSearcher.from_env()
+
+# Run many searches at once; results stream as NDJSON, one line per query as it finishes
+@app.post("/search/batch")
+async def search_batch(
+    req: BatchSearchRequest,
+    request: Request,
+    stream: bool = Query(True, description="Stream NDJSON lines; false returns one JSON body in request order"),
+    fields: str | None = Query(default=None, description="Comma-separated item fields to return, e.g. id,title,price"),
+    thumb: int | None = Query(default=None, ge=1, le=2048, description="Add thumbnail_url (proxied WebP of about this width) to each item"),
+):
+    agent = await get_agent()
+    try:
+        batch_searcher.check(req.queries)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    logger.info("Batch search: %d queries", len(req.queries))
+    prefetcher.preempt()
+
+    selected = parse_fields(fields)
+
+    async def results():
+        async for entry in batch_searcher.stream(agent, req.queries, req.user_id):
+            if "items" in entry:
+                if thumb:
+                    entry["items"] = image_proxy.add_thumbnails(entry["items"], str(request.base_url), thumb)
+                entry["items"] = select_fields(entry["items"], selected)
+            yield entry
+
+    if stream:
+        async def lines():
+            async for entry in results():
+                yield dumps(entry) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    entries = [entry async for entry in results()]
+    summary = entries.pop()
+    return json_response(request, {"results": sorted(entries, key=lambda e: e["index"]), "summary": summary})
+
+
+# Purchase pipeline (provider, concurrency and idempotency settings come from PURCHASE_* env vars)
+purchase_pipeline = PurchasePipeline.from_env()
+
 # Purchase specified items
 @app.post("/purchase", response_model=PurchaseResponse)
-def purchase(req: PurchaseRequest):
-    res = PurchaseResponse(purchases = [])
-    
-    for item in req.items:
-        # Mock purchasing 
-        # TODO: use UCP to genuinely purchase items using a credit provider
-        sleep(random())
-        res.add(item, True)
+async def purchase(req: PurchaseRequest, idempotency_key: str | None = Header(default=None, max_length=128)):
+    key = idempotency_key or req.idempotency_key
+    try:
+        # TODO: use UCP to genuinely purchase items using a credit provider (add it to purchase.PROVIDERS)
+        results, replayed = await purchase_pipeline.run(req.items, key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    res = PurchaseResponse(purchases=[], idempotency_key=key, replayed=replayed)
+    for result in results:
+        res.add(result.item, result.success)
+        res.results.append(PurchaseItemResult(**result.to_dict()))
+        if not replayed:
+            PURCHASE_ITEMS_TOTAL.labels(purchase_pipeline.provider.name, "ok" if result.success else "error").inc()
 
     return res
 
+def storefront_api_url(store_domain: str) -> str:
+    """Builds the Storefront GraphQL endpoint for a store domain (bare host or full URL)."""
+    if not store_domain.startswith("http"):
+        return f"https://{store_domain}/api/2025-01/graphql.json"
+    return f"{store_domain.rstrip('/')}/api/2025-01/graphql.json"
+
 def validate_token(store_domain: str, token: str) -> bool:
     """Checks if a token is valid by making a lightweight query."""
     try:
-        if not store_domain.startswith("http"):
-             api_url = f"https://{store_domain}/api/2025-01/graphql.json"
-        else:
-             api_url = f"{store_domain.rstrip('/')}/api/2025-01/graphql.json"
+        api_url = storefront_api_url(store_domain)
 
         query = "{ shop { name } }"
         response = requests.post(
@@ -208,7 +419,7 @@ def validate_token(store_domain: str, token: str) -> bool:
 
 def find_storefront_token(store_domain: str) -> str:
     """Attempts to scrape the storefront access token from the store's homepage."""
-    print(f"🕵️ Searching for token on {store_domain}...")
+    logger.info("🕵️ Searching for token on %s...", store_domain)
     try:
         if not store_domain.startswith("http"):
             url = f"https://{store_domain}"
@@ -223,11 +434,11 @@ def find_storefront_token(store_domain: str) -> str:
         # Look for 32-char hex strings
         candidates = set(re.findall(r'["\']([a-f0-9]{32})["\']', html))
         
-        print(f"🔎 Found {len(candidates)} candidate tokens.")
+        logger.info("🔎 Found %d candidate tokens.", len(candidates))
         
         for token in candidates:
             if validate_token(store_domain, token):
-                print(f"✅ Found valid token: {token}")
+                logger.info("✅ Found valid token: %s…", token[:6])
                 return token
         
         raise Exception("No valid token found in HTML candidates.")
@@ -259,10 +470,7 @@ def resolve_variant_id(store_domain: str, access_token: str, input_id: str | int
     """
     
     try:
-        if not store_domain.startswith("http"):
-             api_url = f"https://{store_domain}/api/2025-01/graphql.json"
-        else:
-             api_url = f"{store_domain.rstrip('/')}/api/2025-01/graphql.json"
+        api_url = storefront_api_url(store_domain)
 
         response = requests.post(
             api_url,
@@ -279,102 +487,318 @@ def resolve_variant_id(store_domain: str, access_token: str, input_id: str | int
         if data.get('data') and data['data'].get('product') and data['data']['product'].get('variants'):
             nodes = data['data']['product']['variants']['nodes']
             if nodes:
-                print(f"✅ Resolved Product {numeric_id} -> Variant {nodes[0]['id']}")
+                logger.info("✅ Resolved Product %s -> Variant %s", numeric_id, nodes[0]['id'])
                 return nodes[0]['id']
                 
     except Exception as e:
-        print(f"⚠️ Failed to resolve Product ID: {e}")
+        logger.warning("⚠️ Failed to resolve Product ID: %s", e)
 
     # 2. Fallback: Assume it's a Variant ID if product lookup failed/returned null
     return f"gid://shopify/ProductVariant/{numeric_id}"
 
 
-@app.post("/checkout")
-async def create_checkout(request: CheckoutRequest):
-    # Group items by store_domain
-    items_by_store = {}
-    for item in request.items:
-        if item.store_domain not in items_by_store:
-            items_by_store[item.store_domain] = []
-        items_by_store[item.store_domain].append(item)
+def create_cart(store_domain: str, access_token: str, line_items: list[dict]) -> dict:
+    """
+    Creates a cart on the store and returns its checkout entry
+    ({store, checkout_url, item_count} or {store, error}).
+    """
+    query = """
+    mutation($lines: [CartLineInput!]!) {
+      cartCreate(input: { lines: $lines }) {
+        cart { checkoutUrl }
+        userErrors { field message }
+      }
+    }
+    """
+
+    response = requests.post(
+        storefront_api_url(store_domain),
+        json={
+            'query': query, 
+            'variables': {
+                'lines': line_items
+            }
+        },
+        headers={
+            'X-Shopify-Storefront-Access-Token': access_token,
+            'Content-Type': 'application/json'
+        },
+        timeout=10
+    )
     
-    checkouts = []
+    data = response.json()
+    
+    if 'errors' in data:
+        logger.error("❌ GraphQL Error for %s: %s", store_domain, data['errors'])
+        return {"store": store_domain, "error": str(data['errors'])}
+        
+    cart_data = data['data']['cartCreate']
+    if cart_data['userErrors']:
+         msg = cart_data['userErrors'][0]['message']
+         logger.error("❌ User Error for %s: %s", store_domain, msg)
+         return {"store": store_domain, "error": msg}
+        
+    return {
+        "store": store_domain,
+        "checkout_url": cart_data['cart']['checkoutUrl'],
+        "item_count": len(line_items)
+    }
 
-    for store_domain, items in items_by_store.items():
-        try:
-            # 1. Get Access Token (use the first one found or discover it)
-            access_token = next((i.access_token for i in items if i.access_token), None)
-            
-            if not access_token:
+
+def checkout_store(store_domain: str, items: list[CheckoutItem]) -> dict | None:
+    """
+    Runs the full checkout for one store: token discovery, variant resolution, cartCreate.
+    Returns the store's checkout entry, or None if it had no valid items.
+    """
+    try:
+        # 1. Get Access Token (use the first one found or discover it)
+        access_token = next((i.access_token for i in items if i.access_token), None)
+        
+        if not access_token:
+            with CHECKOUT_STAGE_SECONDS.labels("token_discovery").time():
                 access_token = find_storefront_token(store_domain)
-            
-            # 2. Resolve all variant IDs for this store
-            line_items = []
+        
+        # 2. Resolve all variant IDs for this store
+        line_items = []
+        with CHECKOUT_STAGE_SECONDS.labels("variant_resolution").time():
             for item in items:
                 final_variant_id = resolve_variant_id(store_domain, access_token, item.variant_id)
                 if final_variant_id:
                      line_items.append({'quantity': item.quantity, 'merchandiseId': final_variant_id})
-            
-            if not line_items:
-                print(f"⚠️ No valid items for store {store_domain}, skipping.")
-                continue
-
-            # 3. Create Cart
-            query = """
-            mutation($lines: [CartLineInput!]!) {
-              cartCreate(input: { lines: $lines }) {
-                cart { checkoutUrl }
-                userErrors { field message }
-              }
-            }
-            """
-            
-            if not store_domain.startswith("http"):
-                 api_url = f"https://{store_domain}/api/2025-01/graphql.json"
-            else:
-                 api_url = f"{store_domain.rstrip('/')}/api/2025-01/graphql.json"
-
-            response = requests.post(
-                api_url,
-                json={
-                    'query': query, 
-                    'variables': {
-                        'lines': line_items
-                    }
-                },
-                headers={
-                    'X-Shopify-Storefront-Access-Token': access_token,
-                    'Content-Type': 'application/json'
-                }
-            )
-            
-            data = response.json()
-            
-            if 'errors' in data:
-                print(f"❌ GraphQL Error for {store_domain}: {data['errors']}")
-                checkouts.append({"store": store_domain, "error": str(data['errors'])})
-                continue
-                
-            cart_data = data['data']['cartCreate']
-            if cart_data['userErrors']:
-                 msg = cart_data['userErrors'][0]['message']
-                 print(f"❌ User Error for {store_domain}: {msg}")
-                 checkouts.append({"store": store_domain, "error": msg})
-                 continue
-                
-            checkouts.append({
-                "store": store_domain,
-                "checkout_url": cart_data['cart']['checkoutUrl'],
-                "item_count": len(line_items)
-            })
+        
+        if not line_items:
+            logger.warning("⚠️ No valid items for store %s, skipping.", store_domain)
+            return None
+
+        # 3. Create Cart
+        with CHECKOUT_STAGE_SECONDS.labels("cart_create").time():
+            checkout = create_cart(store_domain, access_token, line_items)
+
+    except Exception as e:
+        logger.error("❌ Error processing checkout for %s: %s", store_domain, e)
+        checkout = {"store": store_domain, "error": str(e)}
+
+    CHECKOUT_STORES_TOTAL.labels("error" if "error" in checkout else "ok").inc()
+    return checkout
+
+
+# Background jobs (checkout); workers start with the app
+job_runner = JobRunner.from_env()
 
-        except Exception as e:
-            print(f"❌ Error processing checkout for {store_domain}: {e}")
-            checkouts.append({"store": store_domain, "error": str(e)})
+# Stores checked out at once per request (each store's steps are blocking HTTP calls run in threads)
+CHECKOUT_STORE_CONCURRENCY = int(os.getenv("CHECKOUT_STORE_CONCURRENCY", "4"))
 
+
+def group_items_by_store(items: list[CheckoutItem]) -> dict[str, list[CheckoutItem]]:
+    items_by_store = {}
+    for item in items:
+        if item.store_domain not in items_by_store:
+            items_by_store[item.store_domain] = []
+        items_by_store[item.store_domain].append(item)
+    return items_by_store
+
+
+async def run_checkouts(items_by_store: dict[str, list[CheckoutItem]], on_checkout) -> None:
+    """
+    Checks out every store concurrently and calls on_checkout(entry) as each store finishes.
+    """
+    semaphore = asyncio.Semaphore(CHECKOUT_STORE_CONCURRENCY)
+
+    async def run_store(store_domain, items):
+        async with semaphore:
+            return await asyncio.to_thread(checkout_store, store_domain, items)
+
+    for finished in asyncio.as_completed([run_store(d, i) for d, i in items_by_store.items()]):
+        checkout = await finished
+        if checkout:
+            on_checkout(checkout)
+
+
+def basket_recorder(request: CheckoutRequest):
+    """
+    on_checkout hook recording the basket once the first store checkout succeeds.
+
+    The basket feeds "frequently bought together"; the event allows offline
+    rebuilds. Failed checkouts (which get retried) aren't recorded.
+    """
+    recorded = False
+
+    def record(checkout: dict) -> None:
+        nonlocal recorded
+        if recorded or "error" in checkout:
+            return
+        recorded = True
+        basket = [item_key(i.product_id, i.store_domain, i.variant_id) for i in request.items]
+        if recommender.observe_checkout(basket, request.session_id):
+            log_in_background(CHECKOUT_EVENT, request.user_id, {"items": basket, "session_id": request.session_id})
+
+    return record
+
+
+@app.post("/checkout")
+async def create_checkout(request: CheckoutRequest, background: bool = Query(False, description="Return a job ID immediately and deliver checkouts via /checkout/jobs")):
+    items_by_store = group_items_by_store(request.items)
+    record_basket = basket_recorder(request)
+
+    if background:
+        async def work(job):
+            def publish(checkout):
+                record_basket(checkout)
+                job.publish(checkout)
+
+            await run_checkouts(items_by_store, publish)
+
+        try:
+            job = job_runner.submit("checkout", work, total=len(items_by_store))
+        except JobQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return JSONResponse(status_code=202, content={
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/checkout/jobs/{job.id}",
+            "events_url": f"/checkout/jobs/{job.id}/events",
+        })
+
+    checkouts = []
+
+    def collect(checkout):
+        record_basket(checkout)
+        checkouts.append(checkout)
+
+    await run_checkouts(items_by_store, collect)
+
+    # Keep the request's store order regardless of which store finished first
+    order = {store: index for index, store in enumerate(items_by_store)}
+    checkouts.sort(key=lambda c: order.get(c["store"], len(order)))
     return {"checkouts": checkouts}
 
 
+def get_checkout_job(job_id: str):
+    job = job_runner.get(job_id)
+    if job is None or job.kind != "checkout":
+        raise HTTPException(status_code=404, detail="Checkout job not found (it may have expired)")
+    return job
+
+
+@app.get("/checkout/jobs/{job_id}")
+async def checkout_job_status(job_id: str):
+    job = get_checkout_job(job_id)
+    status = job.to_dict()
+    status["checkouts"] = status.pop("results")
+    return status
+
+
+@app.get("/checkout/jobs/{job_id}/events")
+async def checkout_job_events(job_id: str):
+    job = get_checkout_job(job_id)
+    return StreamingResponse(
+        job.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+_background_logs: set = set()
+
+def log_in_background(event_type: str, user_id: str, data: dict):
+    """Write an analytics event without holding up the response."""
+    if not analytics.enabled:
+        return
+    task = asyncio.create_task(analytics.log_event(event_type, user_id, data))
+    _background_logs.add(task)
+    task.add_done_callback(_background_logs.discard)
+
+
+# Cart additions/removals: items added to one cart session count as bought together
+@app.post("/cart/events")
+async def cart_event(event: CartEvent):
+    kind = CART_ADD_EVENT if event.event == "add" else CART_REMOVE_EVENT
+    product = event.product.model_dump(exclude_none=True) if event.product else None
+    recommender.observe_cart(event.session_id, kind, event.product_id, product)
+    data = {"session_id": event.session_id, "product_id": event.product_id}
+    if product:
+        data["product"] = product
+    log_in_background(kind, event.user_id, data)
+    return {"ok": True}
+
+
+# Frequently bought together with one product, or with a whole cart (comma-separated IDs)
+@app.get("/recommendations")
+async def recommendations(
+    request: Request,
+    product_ids: str = Query(..., description="Comma-separated product IDs"),
+    k: int = Query(default=8, ge=1, le=50),
+    fields: str | None = Query(default=None, description="Comma-separated item fields to return, e.g. id,title,price"),
+):
+    items = [p.strip() for p in product_ids.split(",") if p.strip()]
+    related = recommender.related(items, k)
+    RECOMMENDATION_REQUESTS_TOTAL.labels("hit" if related else "empty").inc()
+    return json_response(request, {"product_ids": items, "items": select_fields(related, parse_fields(fields))})
+
+
+# Try-on of a product on the user's profile photo; never blocks: 200 if cached, else 202 with a job
+@app.post("/tryon")
+async def create_tryon(req: TryOnRequest):
+    profile = await asyncio.to_thread(get_user_profile, req.user_id)
+    if not profile or not profile.get("photo"):
+        raise HTTPException(status_code=404, detail="No profile photo available")
+    try:
+        key, job = tryon_service.request(
+            profile["photo"], req.product_id or req.product_image_url, req.product_image_url, req.product_name
+        )
+    except TryOnUnavailable as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
+    image_url = f"/tryon/images/{key}"
+    if job is None:
+        return {"status": "succeeded", "image_url": image_url}
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/tryon/jobs/{job.id}",
+        "events_url": f"/tryon/jobs/{job.id}/events",
+        "image_url": image_url,
+    })
+
+
+def get_tryon_job(job_id: str):
+    job = tryon_service.runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Try-on job not found (it may have expired)")
+    return job
+
+
+@app.get("/tryon/jobs/{job_id}")
+async def tryon_job_status(job_id: str):
+    return get_tryon_job(job_id).to_dict()
+
+
+@app.get("/tryon/jobs/{job_id}/events")
+async def tryon_job_events(job_id: str):
+    job = get_tryon_job(job_id)
+    return StreamingResponse(
+        job.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Generated try-on image; the key is a content hash, so it never changes (but it shows the user: private)
+@app.get("/tryon/images/{key}")
+async def tryon_image(key: str, request: Request):
+    image = tryon_service.get_image(key)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Try-on image not found (it may have expired)")
+    etag = f'"{key}"'
+    headers = {"Cache-Control": f"private, max-age={int(tryon_service.cache_ttl)}, immutable", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(image.data, media_type=image.content_type, headers=headers)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("server:app", host="0.0.0.0", port=8080, reload=True)
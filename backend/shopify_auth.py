@@ -0,0 +1,209 @@
+"""
+Shopify catalog access token management.
+
+``ShopifyTokenManager`` fetches the client-credentials token, remembers when it
+expires and refreshes it in the background before it does. Refreshes are
+single-flight: any number of concurrent callers that hit an auth failure share
+one token request, and a token fetched moments ago is reused rather than
+fetched again.
+
+The token is published as ``SHOPIFY_ACCESS_TOKEN`` in the environment (which is
+how servers_config.json headers pick it up), and registered listeners are
+awaited after every refresh so live MCP sessions can be rebuilt with it.
+
+Configuration (environment):
+    SHOPIFY_CLIENT_ID / SHOPIFY_CLIENT_SECRET   Client credentials (refresh is disabled without them)
+    SHOPIFY_TOKEN_URL              Token endpoint (default https://api.shopify.com/auth/access_token)
+    SHOPIFY_TOKEN_DEFAULT_TTL      Assumed lifetime when the response has no expires_in (default 3600)
+    SHOPIFY_TOKEN_REFRESH_MARGIN   Refresh this many seconds before expiry (default 300)
+    SHOPIFY_TOKEN_MIN_INTERVAL     A token younger than this is reused on auth failures (default 10)
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, List, Optional, Set
+
+import requests
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+TOKEN_ENV_VAR = "SHOPIFY_ACCESS_TOKEN"
+
+
+class ShopifyTokenManager:
+    """Tracks the catalog token's expiry and refreshes it proactively and on demand."""
+
+    def __init__(
+        self,
+        client_id: Optional[str],
+        client_secret: Optional[str],
+        token_url: str = "https://api.shopify.com/auth/access_token",
+        default_ttl: float = 3600,
+        refresh_margin: float = 300,
+        min_interval: float = 10,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.min_interval = min_interval
+
+        self.token: Optional[str] = os.getenv(TOKEN_ENV_VAR)
+        self.expires_at: Optional[float] = None
+        self.fetched_at: Optional[float] = None
+        self.generation = 0
+        self.stats = {"refreshes": 0, "failures": 0, "reused": 0}
+        self._listeners: List[Callable[[], Awaitable[None]]] = []
+        self._inflight: Optional[asyncio.Future] = None
+        self._listener_tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "ShopifyTokenManager":
+        return cls(
+            client_id=os.getenv("SHOPIFY_CLIENT_ID"),
+            client_secret=os.getenv("SHOPIFY_CLIENT_SECRET"),
+            token_url=os.getenv("SHOPIFY_TOKEN_URL", "https://api.shopify.com/auth/access_token"),
+            default_ttl=float(os.getenv("SHOPIFY_TOKEN_DEFAULT_TTL", "3600")),
+            refresh_margin=float(os.getenv("SHOPIFY_TOKEN_REFRESH_MARGIN", "300")),
+            min_interval=float(os.getenv("SHOPIFY_TOKEN_MIN_INTERVAL", "10")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.client_id and self.client_secret)
+
+    def add_listener(self, listener: Callable[[], Awaitable[None]]) -> None:
+        """Await ``listener()`` after every successful refresh."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], Awaitable[None]]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _fetch(self) -> tuple[str, float]:
+        """Blocking token request. Returns (token, lifetime in seconds)."""
+        resp = requests.post(
+            self.token_url,
+            json={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials",
+            },
+            timeout=10,
+        )
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to fetch token: {resp.status_code} {resp.text[:200]}")
+        data = resp.json()
+        token = data.get("access_token")
+        if not token:
+            raise RuntimeError("Failed to parse access_token from response")
+        return token, float(data.get("expires_in") or self.default_ttl)
+
+    async def refresh(self, force: bool = False) -> bool:
+        """
+        Fetch a new token unless a usable one was fetched very recently.
+
+        Concurrent callers share a single request. Listeners are notified in a
+        separate task that only the caller which made the request waits for.
+
+        Args:
+            force: Fetch even if the current token is younger than SHOPIFY_TOKEN_MIN_INTERVAL.
+
+        Returns:
+            True if a token (new or just-refreshed) is available, False if refreshing is
+            disabled or failed.
+        """
+        if not self.enabled:
+            return False
+        if self._inflight is not None:
+            return await asyncio.shield(self._inflight)
+        if not force and self.fetched_at is not None and time.time() - self.fetched_at < self.min_interval:
+            self.stats["reused"] += 1
+            return True
+
+        inflight = self._inflight = asyncio.get_running_loop().create_future()
+        ok = False
+        try:
+            logger.info("🔄 Fetching new Shopify Access Token...")
+            token, ttl = await asyncio.to_thread(self._fetch)
+            self._install(token, ttl)
+            ok = True
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error("❌ Error fetching Shopify token: %s", e)
+        finally:
+            # Waiters are released even if this caller is cancelled mid-fetch
+            self._inflight = None
+            inflight.set_result(ok)
+
+        if ok:
+            # Listeners run in their own task: waiters don't wait for a slow reconnect,
+            # and cancelling this caller doesn't interrupt it
+            task = asyncio.create_task(self._notify_listeners())
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_tasks.discard)
+            await asyncio.shield(task)
+        return ok
+
+    def _install(self, token: str, ttl: float) -> None:
+        self.token = token
+        self.fetched_at = time.time()
+        self.expires_at = self.fetched_at + ttl
+        self.generation += 1
+        self.stats["refreshes"] += 1
+        os.environ[TOKEN_ENV_VAR] = token
+        logger.info("✅ Successfully refreshed %s (expires in %.0fs)", TOKEN_ENV_VAR, ttl)
+
+    async def _notify_listeners(self) -> None:
+        for listener in list(self._listeners):
+            try:
+                await listener()
+            except Exception as e:
+                logger.warning("Token refresh listener failed: %s", e)
+
+    async def ensure_fresh(self) -> None:
+        """Refresh now if there is no token yet or it is inside the refresh margin."""
+        if self.enabled and (self.expires_at is None or time.time() >= self.expires_at - self.refresh_margin):
+            await self.refresh(force=True)
+        elif not self.enabled:
+            logger.warning("⚠️  SHOPIFY_CLIENT_ID or SHOPIFY_CLIENT_SECRET missing. Skipping auto-fetch.")
+
+    def start(self) -> None:
+        """Start the proactive background refresh loop."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(), name="shopify-token-refresh")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        retry_delay = 5.0
+        while True:
+            if self.expires_at is None:
+                wait = 0
+            else:
+                wait = max(0, self.expires_at - self.refresh_margin - time.time())
+            await asyncio.sleep(wait)
+            if await self.refresh(force=True):
+                retry_delay = 5.0
+            else:
+                await asyncio.sleep(random.uniform(retry_delay / 2, retry_delay))
+                retry_delay = min(retry_delay * 2, 300)
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "generation": self.generation,
+            "expires_in": None if self.expires_at is None else round(self.expires_at - time.time()),
+            **self.stats,
+        }
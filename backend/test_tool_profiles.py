@@ -0,0 +1,70 @@
+"""
+Unit tests for tool schema compaction.
+
+Run with: cd backend && python -m pytest -q test_tool_profiles.py
+"""
+
+import logging
+
+import tool_profiles
+from tool_profiles import compact_schema
+
+
+DETAILS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "product_ids": {"type": "array", "items": {"type": "string"}, "title": "Product Ids"},
+        "context": {"type": "string", "description": "Why the details are needed."},
+        "shop_ids": {"type": "array", "items": {"type": "string"}},
+        "locale": {"type": "string"},
+    },
+    "required": ["context"],
+}
+
+
+def test_details_schema_keeps_whitelisted_product_ids(monkeypatch):
+    monkeypatch.setenv("TOOL_SCHEMA_COMPACTION", "1")
+    compacted = compact_schema("get_global_product_details", DETAILS_SCHEMA)
+
+    # product_ids is whitelisted for this tool even though the wrapper can inject []
+    assert set(compacted["properties"]) == {"product_ids", "context"}
+    assert "title" not in compacted["properties"]["product_ids"]
+    assert compacted["required"] == ["context"]
+    # The input schema is left untouched
+    assert "shop_ids" in DETAILS_SCHEMA["properties"]
+
+
+def test_dropped_optional_properties_are_logged_once(monkeypatch, caplog):
+    monkeypatch.setenv("TOOL_SCHEMA_COMPACTION", "1")
+    monkeypatch.setattr(tool_profiles, "_reported_drops", set())
+    schema = {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string"},
+            "limit": {"type": "integer"},
+            "max_price": {"type": "number"},
+            "ships_to": {"type": "string"},
+        },
+        "required": ["query"],
+    }
+
+    with caplog.at_level(logging.INFO, logger="tool_profiles"):
+        compacted = compact_schema("search_global_products", schema)
+        compact_schema("search_global_products", schema)
+
+    assert set(compacted["properties"]) == {"query", "limit"}
+    messages = [r.getMessage() for r in caplog.records if r.name == "tool_profiles"]
+    assert len(messages) == 1
+    assert "max_price, ships_to" in messages[0]
+
+
+def test_unlisted_tool_drops_injected_defaults(monkeypatch):
+    monkeypatch.setenv("TOOL_SCHEMA_COMPACTION", "1")
+    compacted = compact_schema("some_other_tool", DETAILS_SCHEMA)
+
+    assert set(compacted["properties"]) == {"context", "locale"}
+
+
+def test_compaction_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("TOOL_SCHEMA_COMPACTION", "0")
+    assert compact_schema("get_global_product_details", DETAILS_SCHEMA) is DETAILS_SCHEMA
@@ -0,0 +1,282 @@
+"""
+TTL cache for MCP tool results.
+
+Wraps calls made from the agent's tool closures so that repeated calls with the
+same (canonicalized) arguments are answered from memory instead of going back to
+the remote MCP server.
+
+Features:
+- per-tool TTLs (catalog searches expire faster than product details)
+- short negative caching of tool-level error results (exceptions such as
+  timeouts or an open circuit breaker are not cached: every caller gets its own,
+  and the next call tries again)
+- stale-while-revalidate: popular entries are served stale for a grace window
+  while a single background refresh fetches a fresh copy
+- single-flight: concurrent identical calls share one upstream request, which
+  keeps running for the others if one caller is cancelled
+- lookups are counted per tool and outcome in ``tool_cache_total`` (GET /metrics)
+
+Configuration (environment):
+    TOOL_CACHE_TTLS          JSON object of per-tool TTLs in seconds, merged over the defaults
+    TOOL_CACHE_DEFAULT_TTL   TTL for tools without an explicit entry (default 60, 0 disables)
+    TOOL_CACHE_NEGATIVE_TTL  TTL for error results (default 5)
+    TOOL_CACHE_STALE_WINDOW  Seconds past expiry a popular entry may be served stale (default 300)
+    TOOL_CACHE_MAX_ENTRIES   Max cached results (default 1024)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app_logging import get_logger
+from metrics import TOOL_CACHE_TOTAL
+
+logger = get_logger(__name__)
+
+
+DEFAULT_TOOL_TTLS: Dict[str, float] = {
+    "search_global_products": 120,
+    "get_global_product_details": 900,
+}
+
+# stats key -> TOOL_CACHE_TOTAL outcome label
+OUTCOME_LABELS = {
+    "hits": "hit",
+    "stale_hits": "stale_hit",
+    "negative_hits": "negative_hit",
+    "misses": "miss",
+    "coalesced": "coalesced",
+    "refreshes": "refresh",
+}
+
+# An entry needs this many hits before it is worth serving stale and refreshing
+POPULAR_HITS = 3
+
+
+@dataclass
+class _Entry:
+    value: Any = None
+    negative: bool = False  # A tool-level error result
+    stored_at: float = field(default_factory=time.monotonic)
+    ttl: float = 0
+    hits: int = 0
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+def tool_cache_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """Build a stable key from the tool name and its (final) arguments."""
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{tool_name}:{digest}"
+
+
+def is_error_result(result: Any) -> bool:
+    """Whether an MCP CallToolResult reports a tool-level error."""
+    return bool(getattr(result, "isError", False))
+
+
+class ToolResultCache:
+    """
+    In-memory TTL cache of MCP tool results keyed on tool name + arguments.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 60,
+        negative_ttl: float = 5,
+        stale_window: float = 300,
+        max_entries: int = 1024,
+    ):
+        """
+        Args:
+            ttls: Per-tool TTLs in seconds. A TTL of 0 disables caching for that tool.
+            default_ttl: TTL for tools not listed in ``ttls``.
+            negative_ttl: TTL for tool-level error results.
+            stale_window: How long past expiry a popular entry may be served stale.
+            max_entries: Maximum number of cached results (LRU eviction).
+        """
+        self.ttls = {**DEFAULT_TOOL_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.stale_window = stale_window
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._refreshing: set[str] = set()
+        self._refresh_tasks: set[asyncio.Task] = set()
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "ToolResultCache":
+        """Build a cache from the TOOL_CACHE_* environment variables."""
+        return cls(
+            ttls=json.loads(os.getenv("TOOL_CACHE_TTLS", "{}")),
+            default_ttl=float(os.getenv("TOOL_CACHE_DEFAULT_TTL", "60")),
+            negative_ttl=float(os.getenv("TOOL_CACHE_NEGATIVE_TTL", "5")),
+            stale_window=float(os.getenv("TOOL_CACHE_STALE_WINDOW", "300")),
+            max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024")),
+        )
+
+    def _count(self, tool_name: str, stat: str) -> None:
+        self.stats[stat] += 1
+        TOOL_CACHE_TOTAL.labels(tool_name, OUTCOME_LABELS[stat]).inc()
+
+    def ttl_for(self, tool_name: str) -> float:
+        """Return the configured TTL for a tool."""
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    async def get_or_call(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        call: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Return a cached result for ``tool_name(arguments)`` or run ``call`` to fetch it.
+
+        Args:
+            tool_name: The (exposed) tool name.
+            arguments: The final arguments sent to the server, after default injection.
+            call: Zero-argument coroutine function performing the real tool call.
+
+        Returns:
+            The tool result. Exceptions from ``call`` propagate and are not cached.
+        """
+        ttl = self.ttl_for(tool_name)
+        if ttl <= 0:
+            return await call()
+
+        key = tool_cache_key(tool_name, arguments)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            age = entry.age()
+            if age <= entry.ttl:
+                entry.hits += 1
+                self._entries.move_to_end(key)
+                self._count(tool_name, "negative_hits" if entry.negative else "hits")
+                return entry.value
+
+            if (
+                not entry.negative
+                and entry.hits >= POPULAR_HITS
+                and age <= entry.ttl + self.stale_window
+            ):
+                entry.hits += 1
+                self._count(tool_name, "stale_hits")
+                self._schedule_refresh(key, ttl, call)
+                return entry.value
+
+        self._count(tool_name, "misses")
+        return await self._fetch(key, ttl, call)
+
+    async def _fetch(
+        self,
+        key: str,
+        ttl: float,
+        call: Callable[[], Awaitable[Any]],
+        keep_previous_on_error: bool = False,
+    ) -> Any:
+        """
+        Fetch and store a result, sharing the request with concurrent callers.
+
+        Args:
+            keep_previous_on_error: Leave an existing good entry in place when the
+                fetch fails (used by background refreshes).
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._count(key.split(":")[0], "coalesced")
+        else:
+            # The request runs detached: a cancelled caller (timeout, preemption) doesn't
+            # cancel it for the other callers waiting on the same key
+            task = asyncio.create_task(self._load(key, ttl, call, keep_previous_on_error))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    async def _load(
+        self,
+        key: str,
+        ttl: float,
+        call: Callable[[], Awaitable[Any]],
+        keep_previous_on_error: bool,
+    ) -> Any:
+        result = await call()
+        previous = self._entries.get(key)
+        if is_error_result(result):
+            if not (keep_previous_on_error and previous is not None):
+                self._store(key, _Entry(value=result, ttl=self.negative_ttl, negative=True))
+        else:
+            self._store(key, _Entry(value=result, ttl=ttl, hits=previous.hits if previous else 0))
+        return result
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Retrieved here so a request whose callers all gave up doesn't log "never retrieved"
+            task.exception()
+
+    def _schedule_refresh(self, key: str, ttl: float, call: Callable[[], Awaitable[Any]]) -> None:
+        """Refresh a stale entry in the background (at most one refresh per key)."""
+        if key in self._refreshing or key in self._in_flight:
+            return
+        self._refreshing.add(key)
+        self._count(key.split(":")[0], "refreshes")
+
+        async def refresh():
+            try:
+                await self._fetch(key, ttl, call, keep_previous_on_error=True)
+            except Exception as e:
+                logger.warning("Background refresh failed for %s: %s", key.split(":")[0], e)
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Drop cached results.
+
+        Args:
+            tool_name: Tool whose results should be dropped.
+            arguments: If given, only the entry for these exact arguments is dropped.
+        """
+        if arguments is not None:
+            self._entries.pop(tool_cache_key(tool_name, arguments), None)
+            return
+        prefix = f"{tool_name}:"
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop every cached result."""
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current entry count."""
+        return {**self.stats, "entries": len(self._entries)}
@@ -0,0 +1,192 @@
+"""
+Tool profiles and schema compaction for model binding.
+
+Every tool bound to the model is sent (name, description and JSON schema) with
+every Groq request. The catalog server's tool definitions are large, and the
+search flow only ever calls ``search_global_products``, so:
+
+- a *profile* names the subset of tools an endpoint needs, and the agent keeps
+  one bound model per profile
+- schemas are *compacted* before binding: long descriptions are cut down,
+  arguments we inject ourselves are dropped, and optional properties the flow
+  never sets are removed (each dropped property is logged once, so a filter
+  the server adds later doesn't disappear unnoticed; extend
+  USED_OPTIONAL_PROPERTIES to expose it)
+
+Configuration (environment):
+    TOOL_SCHEMA_COMPACTION  Set to "0" to bind the full, uncompacted schemas (default "1")
+
+Run ``python debug_tools.py`` for a per-profile schema token report.
+"""
+
+import copy
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Profile name -> tool names to bind. None binds every discovered tool.
+TOOL_PROFILES: Dict[str, Optional[List[str]]] = {
+    "all": None,
+    "search": ["search_global_products"],
+    "details": ["get_global_product_details"],
+}
+
+DEFAULT_PROFILE = "all"
+
+# Arguments the tool wrapper fills in when the model leaves them out
+# (the Shopify server rejects calls without them).
+INJECTED_DEFAULTS: Dict[str, Any] = {
+    "context": "User search request",
+    "shop_ids": [],
+    "product_ids": [],
+}
+
+# Optional properties worth exposing to the model, per tool. Tools that are
+# not listed keep all of their optional properties.
+USED_OPTIONAL_PROPERTIES: Dict[str, set[str]] = {
+    "search_global_products": {"query", "limit"},
+    "get_global_product_details": {"product_ids", "product_id", "id"},
+}
+
+MAX_TOOL_DESCRIPTION = 300
+MAX_PROPERTY_DESCRIPTION = 120
+
+CHARS_PER_TOKEN = 4
+
+# (tool, property) pairs already reported as dropped
+_reported_drops: set[tuple[str, str]] = set()
+
+
+def compaction_enabled() -> bool:
+    """Whether schema compaction is switched on."""
+    return os.getenv("TOOL_SCHEMA_COMPACTION", "1") != "0"
+
+
+def compact_description(text: str, max_chars: int) -> str:
+    """
+    Shorten a description to its leading sentences, within ``max_chars``.
+    """
+    text = re.sub(r"\s+", " ", text or "").strip()
+    if len(text) <= max_chars:
+        return text
+
+    sentences = re.split(r"(?<=[.!?])\s", text)
+    compacted = ""
+    for sentence in sentences:
+        if len(compacted) + len(sentence) + 1 > max_chars:
+            break
+        compacted = f"{compacted} {sentence}".strip()
+    return compacted or text[:max_chars].rsplit(" ", 1)[0]
+
+
+def _strip_property(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact a single property schema in place (descriptions, examples, titles)."""
+    schema.pop("examples", None)
+    schema.pop("title", None)
+    if "description" in schema:
+        schema["description"] = compact_description(schema["description"], MAX_PROPERTY_DESCRIPTION)
+    for nested in ("items", "additionalProperties"):
+        if isinstance(schema.get(nested), dict):
+            _strip_property(schema[nested])
+    for child in schema.get("properties", {}).values():
+        if isinstance(child, dict):
+            _strip_property(child)
+    return schema
+
+
+def compact_schema(tool_name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a compacted copy of a tool's input JSON schema.
+
+    Required properties are always kept. When the tool has a
+    USED_OPTIONAL_PROPERTIES entry, exactly the optional properties it lists are
+    kept (the others are logged the first time they are dropped); otherwise
+    optional properties we inject ourselves are dropped.
+    """
+    if not compaction_enabled():
+        return schema
+
+    compacted = copy.deepcopy(schema or {})
+    required = set(compacted.get("required", []))
+    used = USED_OPTIONAL_PROPERTIES.get(tool_name)
+
+    properties = {}
+    dropped = []
+    for name, prop in compacted.get("properties", {}).items():
+        if name not in required:
+            # A whitelisted property stays even if we could inject a default for it
+            if used is not None and name not in used:
+                dropped.append(name)
+                continue
+            if used is None and name in INJECTED_DEFAULTS:
+                continue
+        properties[name] = _strip_property(prop) if isinstance(prop, dict) else prop
+
+    new_drops = [name for name in dropped if (tool_name, name) not in _reported_drops]
+    if new_drops:
+        _reported_drops.update((tool_name, name) for name in new_drops)
+        logger.info(
+            "Schema compaction hides optional properties of %s from the model: %s "
+            "(not in USED_OPTIONAL_PROPERTIES)",
+            tool_name, ", ".join(new_drops),
+        )
+
+    compacted["properties"] = properties
+    return compacted
+
+
+def compact_tool_description(description: str) -> str:
+    """Compact a tool's top-level description."""
+    if not compaction_enabled():
+        return description
+    return compact_description(description, MAX_TOOL_DESCRIPTION)
+
+
+def tools_for_profile(tools: List[BaseTool], profile: str) -> List[BaseTool]:
+    """
+    Select the tools a profile binds.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile not in TOOL_PROFILES:
+        raise ValueError(f"Unknown tool profile '{profile}'. Known: {list(TOOL_PROFILES)}")
+
+    names = TOOL_PROFILES[profile]
+    if names is None:
+        return list(tools)
+    # Namespaced tools (server_tool) still match their un-prefixed profile entry
+    return [t for t in tools if t.name in names or any(t.name.endswith(f"_{n}") for n in names)]
+
+
+def schema_token_cost(tools: List[BaseTool]) -> int:
+    """Estimate the prompt tokens spent on binding ``tools``."""
+    chars = sum(len(json.dumps(convert_to_openai_tool(t), separators=(",", ":"))) for t in tools)
+    return chars // CHARS_PER_TOKEN
+
+
+def profile_report(tools: List[BaseTool]) -> List[Dict[str, Any]]:
+    """
+    Estimate the schema token cost of every profile.
+
+    Returns:
+        One row per profile with its tool names and estimated tokens.
+    """
+    report = []
+    for profile in TOOL_PROFILES:
+        selected = tools_for_profile(tools, profile)
+        report.append({
+            "profile": profile,
+            "tools": [t.name for t in selected],
+            "schema_tokens": schema_token_cost(selected),
+        })
+    return report
@@ -0,0 +1,205 @@
+"""
+Per-tool reducers that shrink MCP tool output before it is handed to the LLM.
+
+The catalog tools return a large JSON blob per product, but the search prompt only
+asks the model for six fields: title, price, description, url, id and image_url.
+A reducer parses the tool's text output, projects every product onto those
+fields, truncates long descriptions and caps the item count, so the second agent
+turn sends a fraction of the prompt tokens.
+
+Output that cannot be parsed (plain text, error messages) is passed through unchanged.
+
+Configuration (environment):
+    TOOL_OUTPUT_REDUCTION  Set to "0" to disable all reducers (default "1")
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Candidate paths (dot separated, integers index into lists) for each output field.
+# The first path that yields a non-empty value wins.
+PRODUCT_FIELD_PATHS: Dict[str, List[str]] = {
+    "title": ["title", "name"],
+    "price": [
+        "price.amount",
+        "price",
+        "priceRange.min.amount",
+        "price_range.min.amount",
+        "variants.0.price.amount",
+        "variants.0.price",
+    ],
+    "description": ["description", "summary", "body"],
+    "url": ["url", "onlineStoreUrl", "variants.0.url", "variants.0.variantUrl", "lookupUrl"],
+    "id": ["id", "product_id", "variants.0.id"],
+    "image_url": [
+        "image_url",
+        "image.url",
+        "featuredImage.url",
+        "media.0.url",
+        "images.0.url",
+        "images.0",
+    ],
+}
+
+# Keys under which a tool response may hold its list of products
+ITEM_CONTAINER_KEYS = ("products", "offers", "items", "results", "data")
+
+CHARS_PER_TOKEN = 4
+
+
+def _lookup(obj: Any, path: str) -> Any:
+    """Follow a dot-separated path through dicts and lists, returning None if absent."""
+    for part in path.split("."):
+        if isinstance(obj, dict):
+            obj = obj.get(part)
+        elif isinstance(obj, list) and part.isdigit():
+            index = int(part)
+            obj = obj[index] if index < len(obj) else None
+        else:
+            return None
+        if obj is None:
+            return None
+    return obj
+
+
+def find_items(data: Any) -> Optional[List[Dict[str, Any]]]:
+    """Locate the list of product dicts in a parsed tool response."""
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    if isinstance(data, dict):
+        for key in ITEM_CONTAINER_KEYS:
+            value = data.get(key)
+            if isinstance(value, list):
+                return [item for item in value if isinstance(item, dict)]
+        for value in data.values():
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                return value
+        # A single product (e.g. a details lookup)
+        if any(key in data for key in ("id", "title")):
+            return [data]
+    return None
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    """Cut text to at most ``max_chars``, preferring a word boundary."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + "..."
+
+
+@dataclass
+class ToolReducer:
+    """
+    Projection settings for one tool's output.
+
+    Attributes:
+        fields: Output field name -> candidate source paths.
+        max_description: Maximum description length in characters.
+        default_limit: Item cap used when the call didn't pass a ``limit`` argument.
+    """
+    fields: Dict[str, List[str]] = field(default_factory=lambda: dict(PRODUCT_FIELD_PATHS))
+    max_description: int = 200
+    default_limit: int = 10
+
+    def project(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Project a raw product onto the configured fields."""
+        projected = {}
+        for name, paths in self.fields.items():
+            value = None
+            for path in paths:
+                value = _lookup(item, path)
+                if value not in (None, "", [], {}):
+                    break
+            if isinstance(value, (dict, list)):
+                # Only scalars are useful to the model
+                value = None
+            if name == "description" and isinstance(value, str):
+                value = truncate_text(value, self.max_description)
+            projected[name] = value
+        return projected
+
+    def reduce(self, text: str, arguments: Dict[str, Any]) -> str:
+        """
+        Reduce a tool's text output.
+
+        Args:
+            text: The joined text content of the MCP result.
+            arguments: The arguments the tool was called with (for ``limit``).
+
+        Returns:
+            Compact JSON for the projected items, or the original text if it
+            doesn't look like a product response.
+        """
+        try:
+            data = json.loads(text)
+        except (json.JSONDecodeError, TypeError):
+            return text
+
+        items = find_items(data)
+        if not items:
+            return text
+
+        limit = arguments.get("limit") or self.default_limit
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = self.default_limit
+
+        projected = [self.project(item) for item in items[:limit]]
+        if not any(p.get("id") or p.get("title") for p in projected):
+            # Unknown shape - better to send everything than nothing
+            return text
+
+        return json.dumps(projected, separators=(",", ":"), ensure_ascii=False)
+
+
+# Only search results are reduced: product details are fetched for their
+# variants, options and availability, which the six search fields would drop.
+TOOL_REDUCERS: Dict[str, ToolReducer] = {
+    "search_global_products": ToolReducer(),
+}
+
+# Running totals, useful for benchmarks and debugging
+reduction_stats = {"calls": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def reduce_tool_output(tool_name: str, text: str, arguments: Dict[str, Any]) -> str:
+    """
+    Apply the reducer registered for ``tool_name`` (if any) and log the savings.
+
+    Namespaced tool names (``server_tool``) fall back to the un-prefixed reducer.
+    """
+    if os.getenv("TOOL_OUTPUT_REDUCTION", "1") == "0":
+        return text
+
+    reducer = TOOL_REDUCERS.get(tool_name)
+    if reducer is None:
+        reducer = next(
+            (r for name, r in TOOL_REDUCERS.items() if tool_name.endswith(f"_{name}")),
+            None,
+        )
+    if reducer is None:
+        return text
+
+    reduced = reducer.reduce(text, arguments)
+
+    bytes_in = len(text.encode("utf-8"))
+    bytes_out = len(reduced.encode("utf-8"))
+    reduction_stats["calls"] += 1
+    reduction_stats["bytes_in"] += bytes_in
+    reduction_stats["bytes_out"] += bytes_out
+    if bytes_out < bytes_in:
+        saved = bytes_in - bytes_out
+        logger.info(
+            "%s output reduced %dB -> %dB (saved %dB, ~%d tokens)",
+            tool_name, bytes_in, bytes_out, saved, saved // CHARS_PER_TOKEN,
+        )
+    return reduced
@@ -0,0 +1,307 @@
+"""
+Virtual try-on as background jobs.
+
+Generating a try-on image (the user's profile photo wearing a product) takes
+seconds, so it never runs on the search path. ``POST /tryon`` hands the work to
+``TryOnService``:
+
+- results are cached by content hash of the user's photo plus the product ID, so
+  a photo change invalidates them and nothing else does; a cached result is
+  answered at once, without a job
+- a request for an image that is already being generated joins that job
+  instead of starting another generation
+- otherwise a job is queued on a dedicated JobRunner (its own bounded workers,
+  so try-ons never hold up checkout jobs) and the client follows it through
+  the usual job status / SSE endpoints; the finished image is served from
+  ``/tryon/images/<key>``
+
+Image generation is pluggable (``TryOnBackend``):
+    gemini  Gemini image generation through the google-genai SDK (needs GOOGLE_API_KEY)
+    mock    Local stand-in: waits TRYON_MOCK_LATENCY_MS and returns the product image
+
+Configuration (environment):
+    TRYON_BACKEND            gemini or mock (default gemini when GOOGLE_API_KEY is set, else mock)
+    TRYON_GEMINI_MODEL       Image generation model (default gemini-2.5-flash-image)
+    TRYON_MOCK_LATENCY_MS    Mock generation time (default 1500)
+    TRYON_WORKERS            Generations run at once (default 2)
+    TRYON_MAX_PENDING        Queued try-on jobs before new ones are refused (default 100)
+    TRYON_JOB_TTL            Seconds a finished job is kept for polling (default 900)
+    TRYON_TIMEOUT            Seconds before a generation is abandoned (default 60)
+    TRYON_CACHE_MAX_BYTES    Memory for cached try-on images (default 134217728 = 128MB)
+    TRYON_CACHE_TTL          Seconds a cached try-on image is kept (default 86400)
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Protocol, Tuple
+
+from app_logging import get_logger
+from jobs import Job, JobRunner, FINISHED
+from metrics import TRYON_REQUESTS_TOTAL
+
+logger = get_logger(__name__)
+
+
+# Image bytes for a product image URL
+ImageLoader = Callable[[str], Awaitable[Tuple[bytes, str]]]
+
+
+class TryOnUnavailable(Exception):
+    """The try-on cannot be started (e.g. the user has no profile photo)."""
+
+
+@dataclass
+class TryOnImage:
+    data: bytes
+    content_type: str
+    created_at: float
+
+
+def decode_photo(photo: str) -> Tuple[bytes, str]:
+    """
+    Decode a profile photo stored as a base64 data URL (or bare base64).
+
+    Returns:
+        (image bytes, content type)
+
+    Raises:
+        TryOnUnavailable: If the photo is not valid base64.
+    """
+    content_type = "image/jpeg"
+    if photo.startswith("data:"):
+        header, _, photo = photo.partition(",")
+        content_type = header[5:].split(";")[0] or content_type
+    try:
+        return base64.b64decode(photo, validate=True), content_type
+    except (binascii.Error, ValueError):
+        raise TryOnUnavailable("Profile photo is not a valid image")
+
+
+def cache_key(photo: bytes, product_id: str) -> str:
+    photo_hash = hashlib.sha256(photo).hexdigest()
+    return hashlib.sha256(f"{photo_hash}:{product_id}".encode("utf-8")).hexdigest()[:40]
+
+
+class TryOnBackend(Protocol):
+    name: str
+
+    async def generate(
+        self,
+        photo: bytes,
+        photo_type: str,
+        product: bytes,
+        product_type: str,
+        product_name: str,
+    ) -> Tuple[bytes, str]:
+        """Return the try-on image and its content type."""
+        ...
+
+
+class MockTryOnBackend:
+    """Offline stand-in: simulated latency, the product image as the "try-on"."""
+
+    name = "mock"
+
+    def __init__(self, latency_ms: float = 1500):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    async def generate(self, photo, photo_type, product, product_type, product_name):
+        self.calls += 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        return product, product_type
+
+
+class GeminiTryOnBackend:
+    """Gemini image generation (the tryon.md prompt) through the async google-genai client."""
+
+    name = "gemini"
+
+    PROMPT = (
+        "Create a realistic photo of the person in the first image wearing/using the {product} "
+        "shown in the second image. Keep the person's face and body proportions accurate. "
+        "The result should look like a natural photo of them trying on the product."
+    )
+
+    def __init__(self, model: str = "gemini-2.5-flash-image", api_key: Optional[str] = None):
+        from google import genai  # Only needed when this backend is selected
+
+        self.model = model
+        self._client = genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+
+    async def generate(self, photo, photo_type, product, product_type, product_name):
+        from google.genai import types
+
+        response = await self._client.aio.models.generate_content(
+            model=self.model,
+            contents=[
+                self.PROMPT.format(product=product_name or "product"),
+                types.Part.from_bytes(data=photo, mime_type=photo_type),
+                types.Part.from_bytes(data=product, mime_type=product_type),
+            ],
+            config=types.GenerateContentConfig(response_modalities=["IMAGE"]),
+        )
+        for candidate in response.candidates or []:
+            for part in candidate.content.parts or []:
+                if part.inline_data and part.inline_data.data:
+                    return part.inline_data.data, part.inline_data.mime_type or "image/png"
+        raise RuntimeError("The model returned no image")
+
+
+def backend_from_env() -> TryOnBackend:
+    name = os.getenv("TRYON_BACKEND") or ("gemini" if os.getenv("GOOGLE_API_KEY") else "mock")
+    if name == "gemini":
+        return GeminiTryOnBackend(model=os.getenv("TRYON_GEMINI_MODEL", "gemini-2.5-flash-image"))
+    if name == "mock":
+        return MockTryOnBackend(latency_ms=float(os.getenv("TRYON_MOCK_LATENCY_MS", "1500")))
+    raise ValueError(f"Unknown TRYON_BACKEND {name!r} (expected gemini or mock)")
+
+
+class TryOnService:
+    """Cached, deduplicated try-on generation on a bounded job runner."""
+
+    def __init__(
+        self,
+        backend: TryOnBackend,
+        load_image: ImageLoader,
+        runner: Optional[JobRunner] = None,
+        timeout: float = 60,
+        cache_max_bytes: int = 128 * 1024 * 1024,
+        cache_ttl: float = 86400,
+    ):
+        """
+        Args:
+            backend: Image generator.
+            load_image: Fetches product images (the server passes the image proxy, so
+                they come from its disk cache).
+            runner: Job runner for generations (default: 2 workers).
+            timeout: Seconds before a generation is abandoned.
+            cache_max_bytes: Memory for cached results, LRU.
+            cache_ttl: Seconds a cached result is kept.
+        """
+        self.backend = backend
+        self.load_image = load_image
+        self.runner = runner or JobRunner(workers=2)
+        self.timeout = timeout
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_ttl = cache_ttl
+        self._cache: OrderedDict[str, TryOnImage] = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight: Dict[str, Job] = {}
+        self.stats = {"cached": 0, "coalesced": 0, "queued": 0, "generated": 0, "failed": 0}
+
+    @classmethod
+    def from_env(cls, load_image: ImageLoader) -> "TryOnService":
+        return cls(
+            backend=backend_from_env(),
+            load_image=load_image,
+            runner=JobRunner(
+                workers=int(os.getenv("TRYON_WORKERS", "2")),
+                ttl=float(os.getenv("TRYON_JOB_TTL", "900")),
+                max_pending=int(os.getenv("TRYON_MAX_PENDING", "100")),
+            ),
+            timeout=float(os.getenv("TRYON_TIMEOUT", "60")),
+            cache_max_bytes=int(os.getenv("TRYON_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+            cache_ttl=float(os.getenv("TRYON_CACHE_TTL", "86400")),
+        )
+
+    def start(self) -> None:
+        self.runner.start()
+
+    async def stop(self) -> None:
+        await self.runner.stop()
+
+    def get_image(self, key: str) -> Optional[TryOnImage]:
+        image = self._cache.get(key)
+        if image is None:
+            return None
+        if time.time() - image.created_at > self.cache_ttl:
+            self._drop(key)
+            return None
+        self._cache.move_to_end(key)
+        return image
+
+    def _drop(self, key: str) -> None:
+        image = self._cache.pop(key)
+        self._cache_bytes -= len(image.data)
+
+    def _store(self, key: str, data: bytes, content_type: str) -> None:
+        if key in self._cache:
+            self._drop(key)
+        self._cache[key] = TryOnImage(data, content_type, time.time())
+        self._cache_bytes += len(data)
+        while self._cache_bytes > self.cache_max_bytes and len(self._cache) > 1:
+            self._drop(next(iter(self._cache)))
+
+    def _count(self, outcome: str) -> None:
+        self.stats[outcome] += 1
+        TRYON_REQUESTS_TOTAL.labels(outcome).inc()
+
+    def request(self, photo: str, product_id: str, product_image_url: str, product_name: str) -> Tuple[str, Optional[Job]]:
+        """
+        Look up or start a try-on.
+
+        Args:
+            photo: The user's profile photo (base64 data URL).
+            product_id: Catalog product ID (part of the cache key).
+            product_image_url: Product image to put on the user.
+            product_name: Product title for the prompt.
+
+        Returns:
+            (key, job): ``job`` is None when the image is already cached under ``key``;
+            otherwise it is the (possibly shared) job generating it.
+
+        Raises:
+            TryOnUnavailable: If the photo cannot be decoded.
+            JobQueueFull: If TRYON_MAX_PENDING generations are already waiting.
+        """
+        photo_bytes, photo_type = decode_photo(photo)
+        key = cache_key(photo_bytes, product_id)
+
+        if self.get_image(key) is not None:
+            self._count("cached")
+            return key, None
+
+        job = self._inflight.get(key)
+        if job is not None and job.status not in FINISHED:
+            self._count("coalesced")
+            return key, job
+
+        async def work(job: Job) -> None:
+            try:
+                product, product_type = await self.load_image(product_image_url)
+                data, content_type = await asyncio.wait_for(
+                    self.backend.generate(photo_bytes, photo_type, product, product_type, product_name),
+                    self.timeout,
+                )
+            except asyncio.TimeoutError:
+                self._count("failed")
+                raise RuntimeError(f"Try-on generation timed out after {self.timeout:.0f}s")
+            except Exception:
+                self._count("failed")
+                raise
+            finally:
+                self._inflight.pop(key, None)
+            self._store(key, data, content_type)
+            self._count("generated")
+            job.publish({"key": key, "image_url": f"/tryon/images/{key}", "content_type": content_type})
+
+        job = self.runner.submit("tryon", work, total=1)
+        self._inflight[key] = job
+        self._count("queued")
+        return key, job
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend.name,
+            "cached_images": len(self._cache),
+            "cache_bytes": self._cache_bytes,
+            "in_flight": len(self._inflight),
+            **self.stats,
+        }
@@ -0,0 +1,203 @@
+"""
+Compact per-user search summary used as prompt context.
+
+Instead of pasting a user's last raw queries into every search prompt, each
+user has one small summary record that is updated whenever a search is added
+to their history (database.add_search_history):
+
+- ``terms``: query words with exponentially decayed counts (half-life
+  USER_STATS_HALF_LIFE_DAYS), top USER_STATS_MAX_TERMS kept
+- ``categories``: the same for product categories recognized in queries
+- ``recent``: the last USER_STATS_RECENT distinct queries, newest first
+- ``price``: decayed averages of budget ceilings/floors mentioned in queries
+  ("under $50", "$20-40", "over 100")
+
+The record has a fixed maximum size no matter how long the history is, and the
+prompt builder reads it with one keyed lookup. This module holds the pure
+update/formatting logic; storage lives in database.py.
+
+Configuration (environment):
+    USER_STATS_HALF_LIFE_DAYS   Days for a term/category/price signal to lose half its weight (default 14)
+    USER_STATS_MAX_TERMS        Terms kept per user (default 20)
+    USER_STATS_MAX_CATEGORIES   Categories kept per user (default 8)
+    USER_STATS_RECENT           Distinct recent queries kept (default 5)
+"""
+
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+HALF_LIFE_SECONDS = float(os.getenv("USER_STATS_HALF_LIFE_DAYS", "14")) * 86400
+MAX_TERMS = int(os.getenv("USER_STATS_MAX_TERMS", "20"))
+MAX_CATEGORIES = int(os.getenv("USER_STATS_MAX_CATEGORIES", "8"))
+RECENT = int(os.getenv("USER_STATS_RECENT", "5"))
+
+# Weights below this are dropped instead of decaying forever
+MIN_WEIGHT = 0.05
+
+STOPWORDS = {
+    "a", "an", "and", "the", "for", "with", "in", "on", "of", "to", "my", "me", "i",
+    "some", "any", "best", "good", "nice", "new", "cheap", "under", "below", "over",
+    "above", "less", "more", "than", "between", "around", "about", "from", "find",
+    "show", "looking", "want", "need", "buy", "get", "dollars", "usd", "price",
+}
+
+CATEGORY_KEYWORDS = {
+    "footwear": {"shoe", "shoes", "sneaker", "sneakers", "boot", "boots", "sandal", "sandals", "heels", "loafers", "slippers", "trainers"},
+    "tops": {"shirt", "shirts", "tee", "t-shirt", "tshirt", "blouse", "sweater", "hoodie", "sweatshirt", "top", "tops", "polo", "cardigan"},
+    "bottoms": {"jeans", "pants", "trousers", "shorts", "skirt", "leggings", "joggers", "chinos"},
+    "dresses": {"dress", "dresses", "gown", "jumpsuit"},
+    "outerwear": {"jacket", "jackets", "coat", "coats", "parka", "blazer", "vest", "raincoat", "windbreaker"},
+    "accessories": {"hat", "hats", "cap", "beanie", "scarf", "belt", "sunglasses", "glasses", "watch", "wallet", "gloves", "socks"},
+    "bags": {"bag", "bags", "backpack", "purse", "handbag", "tote", "luggage", "suitcase"},
+    "jewelry": {"ring", "rings", "necklace", "bracelet", "earrings", "jewelry", "pendant"},
+    "beauty": {"lipstick", "makeup", "perfume", "fragrance", "skincare", "serum", "moisturizer", "shampoo", "cologne"},
+    "electronics": {"headphones", "earbuds", "speaker", "phone", "laptop", "tablet", "charger", "camera", "keyboard", "mouse", "monitor"},
+    "home": {"mug", "lamp", "pillow", "blanket", "candle", "rug", "sheets", "towel", "plant", "vase", "chair", "desk"},
+}
+
+_WORD_RE = re.compile(r"[a-z][a-z\-']*")
+_NUMBER = r"\$?\s*(\d+(?:\.\d+)?)\s*(?:dollars|usd|\$)?"
+_RANGE_RE = re.compile(rf"{_NUMBER}\s*(?:-|to|–)\s*{_NUMBER}")
+_CEILING_RE = re.compile(rf"(?:under|below|less than|cheaper than|max|up to|<)\s*{_NUMBER}")
+_FLOOR_RE = re.compile(rf"(?:over|above|more than|at least|min|>)\s*{_NUMBER}")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+def extract_terms(query: str) -> List[str]:
+    """Distinct meaningful words of a query, in order."""
+    seen = []
+    for word in _WORD_RE.findall(query.lower()):
+        word = word.strip("-'")
+        if len(word) > 1 and word not in STOPWORDS and word not in seen:
+            seen.append(word)
+    return seen
+
+
+def extract_categories(terms: List[str]) -> List[str]:
+    return [category for category, words in CATEGORY_KEYWORDS.items() if words.intersection(terms)]
+
+
+def extract_price_range(query: str) -> Tuple[Optional[float], Optional[float]]:
+    """(floor, ceiling) mentioned in a query; either may be None."""
+    text = query.lower().replace(",", "")
+    match = _RANGE_RE.search(text)
+    if match:
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        return low, high
+    ceiling = _CEILING_RE.search(text)
+    floor = _FLOOR_RE.search(text)
+    return (float(floor.group(1)) if floor else None, float(ceiling.group(1)) if ceiling else None)
+
+
+def empty_stats() -> Dict[str, Any]:
+    return {
+        "terms": {},
+        "categories": {},
+        "recent": [],
+        "price": {"floor": None, "floor_weight": 0.0, "ceiling": None, "ceiling_weight": 0.0},
+        "searches": 0,
+        "updated_at": None,
+    }
+
+
+def _top(weights: Dict[str, float], limit: int) -> Dict[str, float]:
+    """The ``limit`` heaviest entries (heaviest first), without negligible ones."""
+    kept = {k: v for k, v in weights.items() if v >= MIN_WEIGHT}
+    top = sorted(kept.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return {k: round(v, 4) for k, v in top}
+
+
+def _blend(value: Optional[float], weight: float, sample: float) -> Tuple[float, float]:
+    """Fold ``sample`` into a decayed weighted average."""
+    if value is None or weight <= 0:
+        return sample, 1.0
+    return round((value * weight + sample) / (weight + 1), 2), weight + 1
+
+
+def update_stats(stats: Optional[Dict[str, Any]], query: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Return ``stats`` with one more search folded in (the input is not modified).
+
+    Args:
+        stats: The user's current summary (None for a new user).
+        query: The search query.
+        now: Unix time of the search (default: now).
+    """
+    now = time.time() if now is None else now
+    stats = stats or empty_stats()
+    last = stats.get("updated_at")
+    factor = 0.5 ** (max(0.0, now - last) / HALF_LIFE_SECONDS) if last else 1.0
+
+    terms = extract_terms(query)
+    term_weights = {k: v * factor for k, v in stats.get("terms", {}).items()}
+    for term in terms:
+        term_weights[term] = term_weights.get(term, 0.0) + 1.0
+    category_weights = {k: v * factor for k, v in stats.get("categories", {}).items()}
+    for category in extract_categories(terms):
+        category_weights[category] = category_weights.get(category, 0.0) + 1.0
+
+    normalized = normalize_query(query)
+    recent = [normalized] + [q for q in stats.get("recent", []) if q != normalized]
+
+    price = dict(stats.get("price") or empty_stats()["price"])
+    price["floor_weight"] = price.get("floor_weight", 0.0) * factor
+    price["ceiling_weight"] = price.get("ceiling_weight", 0.0) * factor
+    floor, ceiling = extract_price_range(query)
+    if floor is not None:
+        price["floor"], price["floor_weight"] = _blend(price.get("floor"), price["floor_weight"], floor)
+    if ceiling is not None:
+        price["ceiling"], price["ceiling_weight"] = _blend(price.get("ceiling"), price["ceiling_weight"], ceiling)
+    for side in ("floor", "ceiling"):
+        if price[f"{side}_weight"] < MIN_WEIGHT:
+            price[side], price[f"{side}_weight"] = None, 0.0
+        else:
+            price[f"{side}_weight"] = round(price[f"{side}_weight"], 4)
+
+    return {
+        "terms": _top(term_weights, MAX_TERMS),
+        "categories": _top(category_weights, MAX_CATEGORIES),
+        "recent": recent[:RECENT],
+        "price": price,
+        "searches": stats.get("searches", 0) + 1,
+        "updated_at": now,
+    }
+
+
+def build_stats(queries: List[Tuple[str, float]]) -> Dict[str, Any]:
+    """Summary for a history given as (query, unix time) pairs, oldest first (used for backfills)."""
+    stats = None
+    for query, at in queries:
+        stats = update_stats(stats, query, at)
+    return stats or empty_stats()
+
+
+def format_for_prompt(stats: Optional[Dict[str, Any]], max_terms: int = 8) -> str:
+    """
+    Render a summary as a few short prompt lines ("" when there is nothing to say).
+    """
+    if not stats or not stats.get("searches"):
+        return ""
+    lines = []
+    if stats.get("recent"):
+        lines.append("- Recent searches: " + "; ".join(stats["recent"]))
+    terms = list(stats.get("terms", {}))[:max_terms]
+    if terms:
+        lines.append("- Frequent terms: " + ", ".join(terms))
+    categories = list(stats.get("categories", {}))[:3]
+    if categories:
+        lines.append("- Favourite categories: " + ", ".join(categories))
+    price = stats.get("price") or {}
+    floor, ceiling = price.get("floor"), price.get("ceiling")
+    if floor is not None and ceiling is not None:
+        lines.append(f"- Usual budget: ${floor:.0f}-${ceiling:.0f}")
+    elif ceiling is not None:
+        lines.append(f"- Usual budget: under about ${ceiling:.0f}")
+    elif floor is not None:
+        lines.append(f"- Usual budget: over about ${floor:.0f}")
+    return "\n".join(lines)
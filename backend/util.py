@@ -11,6 +11,8 @@ Usage:
 """
 
 import asyncio
+import json
+import re
 import sys
 from dotenv import load_dotenv
 
@@ -18,7 +20,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from mcp_agent import MCPLangGraphAgent
-from database import add_search_history, get_search_history
+from llm_scheduler import INTERACTIVE
+from database import get_search_stats
+from user_stats import format_for_prompt
+from metrics import HISTORY_FETCH, PROMPT_BUILD, AGENT_RUN
+from app_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
 
 
 SYSTEM_PROMPT = """You are a helpful shopping assistant with access to Shopify's global product catalog.
@@ -36,21 +44,78 @@ If you need more details about a specific product, use get_global_product_detail
 Be concise but helpful. Keep your response in the JSON format for easy parsing. No backticks, just raw JSON text."""
 
 
-async def search_products(agent: MCPLangGraphAgent, query: str, user_id: str = "") -> str:
-    """Run a single product search query through the agent."""
-    history = get_search_history(user_id)
-    prompt = f"{SYSTEM_PROMPT}\n\nUser query: {query}"
-
-    if history:
-        print(f"[*] Found {len(history)} past searches for context.")
-        history_str = "\n".join([f"- {h}" for h in history])
-        prompt += f"\n\nRecent Search History:\n{history_str}\n\nUse this history to better understand the user's preferences if relevant."
-
-    print(f"[*] Searching for: {query}\n")
-    
-    prompt += "\n\nIMMEDIATE INSTRUCTION: Call the search_global_products tool immediately. Do not talk. Output the tool call JSON directly."
+def extract_json_items(res: str):
+    """Robust JSON extraction of the product list from the agent's response text."""
+    try:
+        # Try parsing directly first
+        return json.loads(res.strip())
+    except json.JSONDecodeError:
+        # Fallback: Extract JSON array from text using regex
+        match = re.search(r'\[.*\]', res, re.DOTALL)
+        if match:
+            json_str = match.group(0)
+            try:
+                return json.loads(json_str)
+            except json.JSONDecodeError:
+                 # Attempt to fix common trailing comma issues or markdown
+                 clean_str = json_str.replace("`", "").strip()
+                 return json.loads(clean_str)
+        else:
+             # Last resort: try to find just the JSON array start
+             if "[" in res:
+                 start = res.find("[")
+                 end = res.rfind("]") + 1
+                 clean_str = res[start:end]
+                 return json.loads(clean_str)
+             else:
+                raise ValueError("No JSON array found in response")
+
+
+async def search_products(
+    agent: MCPLangGraphAgent,
+    query: str,
+    user_id: str = "",
+    thread_id: str | None = None,
+    priority: int = INTERACTIVE,
+    tool_calls: list | None = None,
+    usage: dict | None = None,
+) -> str:
+    """
+    Run a single product search query through the agent.
+
+    Args:
+        agent: Initialized agent.
+        query: Natural language catalog query.
+        user_id: Whose search history to use as context ("" for none).
+        thread_id: Conversation thread; defaults to the user's shared search thread.
+        priority: LLM scheduling priority (batch searches pass llm_scheduler.BATCH).
+        tool_calls: If given, receives the tool calls the agent made.
+        usage: If given, receives the run's LLM call and token counts.
+    """
+    with HISTORY_FETCH.time():
+        stats = await asyncio.to_thread(get_search_stats, user_id)
+
+    with PROMPT_BUILD.time():
+        prompt = f"{SYSTEM_PROMPT}\n\nUser query: {query}"
+
+        summary = format_for_prompt(stats)
+        if summary:
+            logger.info("Using search summary (%d past searches) for context.", stats["searches"])
+            prompt += f"\n\nUser's Search Profile:\n{summary}\n\nUse this to better understand the user's preferences if relevant."
+
+        logger.info("Searching for: %s", query)
+        
+        prompt += "\n\nIMMEDIATE INSTRUCTION: Call the search_global_products tool immediately. Do not talk. Output the tool call JSON directly."
 
-    return await agent.chat(prompt, thread_id=f"product_search:{user_id}")
+    with AGENT_RUN.time():
+        return await agent.chat(
+            prompt,
+            thread_id=thread_id or f"product_search:{user_id}",
+            tool_profile="search",
+            priority=priority,
+            tool_calls=tool_calls,
+            usage=usage,
+        )
 
 
 
@@ -104,6 +169,7 @@ async def interactive_mode():
 
 async def main():
     """Main entry point."""
+    configure_logging()
     if len(sys.argv) > 1:
         # Single query mode: python util.py "search term"
         agent = MCPLangGraphAgent("servers_config.json")
@@ -0,0 +1,192 @@
+"""
+Supervised background warm-up of the agent.
+
+Startup used to fetch the Shopify token and initialize the agent inside the
+FastAPI lifespan, so the port was not bound until the catalog server answered,
+and one failed attempt left the app without an agent until restarted.
+
+``AgentWarmup`` runs that work in a background task instead: it retries with
+exponential backoff until the agent is ready, publishes the agent through an
+``on_ready`` callback, and on shutdown cleans the agent up *in the same task*
+that initialized it (the MCP transports hold anyio cancel scopes, which must be
+exited by the task that entered them).
+
+Configuration (environment):
+    WARMUP_ATTEMPT_TIMEOUT   Seconds one initialization attempt may take (default 60)
+    WARMUP_RETRY_INITIAL     First retry delay in seconds (default 1)
+    WARMUP_RETRY_MAX         Max retry delay in seconds (default 60)
+    WARMUP_MAX_ATTEMPTS      Give up after this many attempts (default 0 = never)
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+STARTING = "starting"
+RETRYING = "retrying"
+READY = "ready"
+FAILED = "failed"
+STOPPED = "stopped"
+
+
+class AgentWarmup:
+    """Owns the agent's lifecycle in a single supervised background task."""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        prepare: Optional[Callable[[], Awaitable[None]]] = None,
+        verify: Optional[Callable[[Any], None]] = None,
+        on_ready: Optional[Callable[[Any], None]] = None,
+        attempt_timeout: float = 60,
+        retry_initial: float = 1,
+        retry_max: float = 60,
+        max_attempts: int = 0,
+    ):
+        """
+        Args:
+            factory: Builds a fresh, uninitialized agent for each attempt.
+            prepare: Awaited before each attempt (e.g. refreshing credentials).
+            verify: Called with the initialized agent; raises if it is not usable yet.
+            on_ready: Called with the agent once it is initialized, and with None on shutdown.
+            attempt_timeout: Seconds one attempt may take before it is abandoned.
+            retry_initial: First backoff delay in seconds; doubles per failure.
+            retry_max: Backoff ceiling in seconds.
+            max_attempts: Stop retrying after this many attempts (0 retries forever).
+        """
+        self.factory = factory
+        self.prepare = prepare
+        self.verify = verify
+        self.on_ready = on_ready
+        self.attempt_timeout = attempt_timeout
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+
+        self.agent = None
+        self.state = STOPPED
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, factory, prepare=None, verify=None, on_ready=None) -> "AgentWarmup":
+        return cls(
+            factory,
+            prepare=prepare,
+            verify=verify,
+            on_ready=on_ready,
+            attempt_timeout=float(os.getenv("WARMUP_ATTEMPT_TIMEOUT", "60")),
+            retry_initial=float(os.getenv("WARMUP_RETRY_INITIAL", "1")),
+            retry_max=float(os.getenv("WARMUP_RETRY_MAX", "60")),
+            max_attempts=int(os.getenv("WARMUP_MAX_ATTEMPTS", "0")),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def start(self) -> None:
+        """Start warming up in the background and return immediately."""
+        if self._task is None:
+            self._stop = asyncio.Event()
+            self.state = STARTING
+            self.started_at = time.time()
+            self._task = asyncio.create_task(self._supervise(), name="agent-warmup")
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Signal shutdown and wait for the supervisor to clean the agent up."""
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Agent cleanup took longer than %ss; cancelling", timeout)
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "started_at": self.started_at,
+            "ready_at": self.ready_at,
+        }
+
+    async def _cleanup(self, agent) -> None:
+        try:
+            await agent.cleanup()
+        except Exception as e:
+            logger.warning("Agent cleanup failed: %s", e)
+
+    async def _attempt(self):
+        if self.prepare is not None:
+            await self.prepare()
+        agent = self.factory()
+        try:
+            await asyncio.wait_for(agent.initialize(), self.attempt_timeout)
+            if self.verify is not None:
+                self.verify(agent)
+        except BaseException:
+            await self._cleanup(agent)
+            raise
+        return agent
+
+    async def _supervise(self) -> None:
+        delay = self.retry_initial
+        while not self._stop.is_set():
+            self.attempts += 1
+            logger.info("🚀 Pre-warming Agent Connection (attempt %d)...", self.attempts)
+            try:
+                self.agent = await self._attempt()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if self.max_attempts and self.attempts >= self.max_attempts:
+                    self.state = FAILED
+                    logger.error("❌ Agent warm-up failed after %d attempts: %s", self.attempts, self.last_error)
+                    return
+                self.state = RETRYING
+                # Jitter keeps several workers from retrying in lockstep
+                wait = random.uniform(delay / 2, delay)
+                logger.warning("⚠️ Agent warm-up failed (%s); retrying in %.1fs", self.last_error, wait)
+                try:
+                    await asyncio.wait_for(self._stop.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.retry_max)
+
+        if self.agent is None:
+            self.state = STOPPED
+            return
+
+        self.state = READY
+        self.ready_at = time.time()
+        self.last_error = None
+        logger.info("✅ Agent Ready")
+        if self.on_ready:
+            self.on_ready(self.agent)
+
+        try:
+            await self._stop.wait()
+        finally:
+            if self.on_ready:
+                self.on_ready(None)
+            agent, self.agent = self.agent, None
+            self.state = STOPPED
+            await self._cleanup(agent)
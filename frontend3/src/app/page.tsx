@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useMemo, useEffect } from "react";
+import { useState, useMemo, useEffect, useRef } from "react";
 import Link from "next/link";
 import { ChatInput } from "@/components/ChatInput";
 import { ProductGrid } from "@/components/ProductGrid";
@@ -19,9 +19,25 @@ import { supabase } from "@/lib/supabase";
 import { useRouter } from "next/navigation";
 import { User as SupabaseUser } from "@supabase/supabase-js";
 
+const PRODUCT_FIELDS = "id,title,price,image_url,thumbnail_url,url,description";
+// Product tiles load a cached WebP thumbnail through the backend's image proxy
+const THUMB_WIDTH = 320;
+
+const toProduct = (product: any): Product => ({
+  id: product["id"],
+  name: product["title"],
+  price: product["price"]/100,
+  image: product["thumbnail_url"] ?? product["image_url"],
+  store: product["url"],
+  deliveryTime: "3-5 days",
+  description: product["description"],
+});
+
 export default function HomePage() {
   const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8080";
   const [products, setProducts] = useState<Product[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [recommendations, setRecommendations] = useState<Product[]>([]);
   const [selectedProducts, setSelectedProducts] = useState<Product[]>([]);
   const [isLoading, setIsLoading] = useState(false);
@@ -36,6 +52,8 @@ export default function HomePage() {
   const [lastAgentResponse, setLastAgentResponse] = useState("");
   const [user, setUser] = useState<SupabaseUser | null>(null);
   const router = useRouter();
+  // One cart session per page load; items added together feed "frequently bought together"
+  const cartSessionId = useRef(crypto.randomUUID());
 
   useEffect(() => {
     supabase.auth.getSession().then(({ data: { session } }) => {
@@ -58,6 +76,7 @@ export default function HomePage() {
 
   const handleGoHome = () => {
     setProducts([]);
+    setNextCursor(null);
     setRecommendations([]);
     setHasSearched(false);
     setCurrentQuery("");
@@ -68,6 +87,26 @@ export default function HomePage() {
     setIsLoading(false)
   }, [products])
 
+  // Next page of the current search, served from the backend's cached result set
+  const handleLoadMore = async () => {
+    if (!nextCursor || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const res = await fetch(`http://localhost:8080/search/results?cursor=${encodeURIComponent(nextCursor)}&fields=${PRODUCT_FIELDS}&thumb=${THUMB_WIDTH}`);
+      if (!res.ok) {
+        // Expired result set: the user can search again
+        setNextCursor(null);
+        return;
+      }
+      const data = await res.json();
+      const more: Product[] = data.items.map(toProduct);
+      setProducts(prev => [...prev, ...more.filter(p => !prev.some(q => q.id === p.id))]);
+      setNextCursor(data.next_cursor ?? null);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleSearch = async (query: string) => {
     console.log("bruh")
 
@@ -76,7 +115,8 @@ export default function HomePage() {
     setCurrentQuery(query);
 
     // Retrieve products from backend
-    fetch("http://localhost:8080/search", {
+    setNextCursor(null);
+    fetch(`http://localhost:8080/search?v=2&fields=${PRODUCT_FIELDS}&thumb=${THUMB_WIDTH}`, {
       method: "POST",
       headers: {
         'Content-Type': 'application/json'
@@ -86,17 +126,10 @@ export default function HomePage() {
       })
     })
       .then(res => res.json())
-      .then(data => JSON.parse(data.items).map((product: any): Product => {
-        return {
-          id: product["id"],
-          name: product["title"],
-          price: product["price"]/100,
-          image: product["image_url"],
-          store: product["url"],
-          deliveryTime: "3-5 days",
-          description: product["description"],
-        }
-      }))
+      .then(data => {
+        setNextCursor(data.result_set?.next_cursor ?? null);
+        return data.items.map(toProduct);
+      })
       .then(data => { setProducts(data) })
 
     // Mock: return random 4-6 products
@@ -129,7 +162,45 @@ export default function HomePage() {
     }
   }, [products, sortBy]);
 
+  const sendCartEvent = (event: "add" | "remove", product: Product) => {
+    fetch(`${API_URL}/cart/events`, {
+      method: "POST",
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        event,
+        product_id: product.id,
+        session_id: cartSessionId.current,
+        user_id: user?.id ?? "",
+        product: {
+          id: product.id,
+          title: product.name,
+          price: Math.round(product.price * 100),
+          image_url: product.image,
+          url: product.store,
+        },
+      }),
+    }).catch((e) => console.error("Cart event failed", e));
+  };
+
+  // Products frequently bought together with what is in the cart
+  useEffect(() => {
+    if (selectedProducts.length === 0) {
+      return;
+    }
+    const ids = selectedProducts.map((p) => p.id).join(",");
+    const controller = new AbortController();
+    fetch(`${API_URL}/recommendations?product_ids=${encodeURIComponent(ids)}&k=4`, { signal: controller.signal })
+      .then((res) => res.json())
+      .then((data) => {
+        const items = (data.items ?? []).filter((item: any) => item.title).map(toProduct);
+        if (items.length > 0) setRecommendations(items);
+      })
+      .catch(() => { });
+    return () => controller.abort();
+  }, [selectedProducts, API_URL]);
+
   const handleToggleProduct = (product: Product) => {
+    sendCartEvent(selectedProducts.some((p) => p.id === product.id) ? "remove" : "add", product);
     setSelectedProducts((prev) => {
       const exists = prev.some((p) => p.id === product.id);
       if (exists) {
@@ -141,11 +212,14 @@ export default function HomePage() {
 
   const handleAddRecommendation = (product: Product) => {
     if (!selectedProducts.some((p) => p.id === product.id)) {
+      sendCartEvent("add", product);
       setSelectedProducts((prev) => [...prev, product]);
     }
   };
 
   const handleRemoveFromCart = (productId: string) => {
+    const product = selectedProducts.find((p) => p.id === productId);
+    if (product) sendCartEvent("remove", product);
     setSelectedProducts((prev) => prev.filter((p) => p.id !== productId));
   };
 
@@ -178,7 +252,8 @@ export default function HomePage() {
       return {
         variant_id: variantId,
         quantity: 1,
-        store_domain: domain
+        store_domain: domain,
+        product_id: p.id
       };
     });
 
@@ -186,7 +261,7 @@ export default function HomePage() {
       const res = await fetch(`${API_URL}/checkout`, {
         method: "POST",
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ items })
+        body: JSON.stringify({ items, user_id: user?.id ?? "", session_id: cartSessionId.current })
       });
       const data = await res.json();
 
@@ -195,6 +270,9 @@ export default function HomePage() {
         setIsCheckoutOpen(false);
         setIsSuccessOpen(true);
         setSelectedProducts([]); // Clear cart
+        if (data.checkouts.some((c: { error?: string }) => !c.error)) {
+          cartSessionId.current = crypto.randomUUID(); // The next cart is a new basket
+        }
         // setProducts([]); // Maybe keep results?
         // setRecommendations([]);
         // setHasSearched(false);
@@ -356,6 +434,8 @@ export default function HomePage() {
               products={sortedProducts}
               selectedProducts={selectedProducts}
               onToggleProduct={handleToggleProduct}
+              onLoadMore={nextCursor ? handleLoadMore : undefined}
+              isLoadingMore={isLoadingMore}
             />
 
             {/* Recommendations Section */}